@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Background model of the kinect's metric depth.
+
+The floor, the walls and the furniture are always within the kinect's range,
+so a distance threshold alone finds them too. A DepthBackground learns the
+depth of the empty scene and only the things in front of it are foreground.
+
+Arrays follow SimpleCV's convention and are indexed [x, y].
+'''
+
+import math
+import numpy as np
+from framepool import FramePool
+
+
+class DepthBackground(object):
+    '''
+    A per pixel model of the scene's background depth, in millimetres.
+
+    Each pixel's background starts at its first valid reading. Readings that
+    are farther than the background replace it at once, because whatever
+    was in front of it has moved away, and all the readings are slowly
+    blended into it, so things that stay still for long become background.
+
+    A pixel is foreground when it has a reading between the minimum and
+    maximum distance that is closer than its background by more than the
+    threshold. All the arrays are preallocated, so applying a frame
+    allocates no memory.
+    '''
+
+    def __init__(self, size, min_distance, max_distance, threshold=100,
+                 learning_rate=0.005, pool_size=3):
+        '''
+        Inputs:
+
+            size - The (width, height) of the frames.
+
+            min_distance, max_distance - The range of distances, in
+                millimetres, where foreground is looked for.
+
+            threshold - How much closer than the background, in
+                millimetres, a reading must be to be foreground.
+
+            learning_rate - The weight of each frame in the background.
+
+            pool_size - The number of foreground buffers, see
+                framepool.FramePool.
+        '''
+
+        width, height = size
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        self.threshold = threshold
+        self.learning_rate = learning_rate
+        # (height, width) buffers seen [x, y], like the kinect's frames
+        shape = (height, width)
+        self.background = np.zeros(shape, dtype=np.float32).T
+        self._depth = np.empty(shape, dtype=np.float32).T
+        self._difference = np.empty(shape, dtype=np.float32).T
+        self._offset = np.empty(shape, dtype=np.uint16).T
+        self._in_range = np.empty(shape, dtype=bool).T
+        self._closer = np.empty(shape, dtype=bool).T
+        self.pool = FramePool(shape, dtype=np.uint8, size=pool_size)
+
+    def reset(self):
+        '''
+        Forget the background, which is learned again from the next frame.
+        '''
+
+        self.background.fill(0)
+
+    def apply(self, depth):
+        '''
+        Update the background with a frame and return its foreground.
+
+        Inputs:
+
+            depth - A uint16 array indexed [x, y] with the depth in
+                millimetres, where 0 means no reading.
+
+        Returns: The next uint8 buffer of the pool, indexed [x, y], that is
+            255 in the foreground and 0 elsewhere.
+        '''
+
+        d = self._depth
+        difference = self._difference
+        background = self.background
+        in_range = self._in_range
+        closer = self._closer
+        np.copyto(d, depth, casting='unsafe')
+        # readings farther than the background replace it
+        np.maximum(background, d, out=background)
+        np.subtract(background, d, out=difference)
+        np.greater(difference, self.threshold, out=closer)
+        # depth - min_distance wraps around for the readings closer than
+        # min_distance, 0 included, so a single unsigned comparison checks
+        # that a reading is within the range
+        min_distance = max(int(math.ceil(self.min_distance)), 1)
+        max_distance = int(math.floor(self.max_distance))
+        np.subtract(depth, min_distance, out=self._offset, casting='unsafe')
+        np.less_equal(self._offset, max(max_distance - min_distance, -1),
+                      out=in_range)
+        out = self.pool.next_buffer().T
+        np.bitwise_and(closer.view(np.uint8), in_range.view(np.uint8),
+                       out=out)
+        out *= 255
+        # background += learning_rate * (depth - background), where there
+        # is a reading. The depth is in whole millimetres, so
+        # min(depth, learning_rate) is the learning rate where there is a
+        # reading and 0 elsewhere, which costs less than where=
+        np.minimum(d, self.learning_rate, out=d)
+        difference *= d
+        background -= difference
+        return out
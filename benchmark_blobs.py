@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Compare the blob finding backends on synthetic depth frames.
+
+Frames imitate the kinect's 8 bit depth: a floor getting farther away with
+the lines of the image, a few people-sized blobs closer to the sensor and
+speckles of invalid (255) pixels. The SimpleCV backend is skipped when
+SimpleCV can't be imported.
+'''
+
+import sys
+import timeit
+import numpy as np
+from blobs import BLOB_BACKENDS
+
+try:
+    import SimpleCV as scv
+except ImportError:
+    scv = None
+
+
+def synthetic_depth_frames(num_frames, num_people=4, width=640, height=480,
+                           seed=0):
+    '''
+    Return a list of uint8 depth arrays, indexed [x, y].
+    '''
+
+    random = np.random.RandomState(seed)
+    xs, ys = np.mgrid[0:width, 0:height]
+    floor = (190 + 50 * ys / float(height)).astype(np.uint8)
+    # people walk up and down in their own lane, so they never merge
+    lanes = (np.arange(num_people) + 0.5) * width / float(num_people)
+    ys_people = random.uniform(80, height - 80, num_people)
+    velocities = random.uniform(-4, 4, num_people)
+    frames = []
+    for i in range(num_frames):
+        frame = floor.copy()
+        ys_people += velocities
+        bounce = (ys_people < 60) | (ys_people > height - 60)
+        velocities[bounce] *= -1
+        for x, y in zip(lanes, ys_people):
+            person = ((xs - x) / 30.0) ** 2 + ((ys - y) / 55.0) ** 2 < 1
+            frame[person] = 90 + random.randint(0, 20)
+        speckles = random.random_sample(frame.shape) < 0.01
+        frame[speckles] = 255
+        frames.append(frame)
+    return frames
+
+
+def run(backend, frames, min_area=1500):
+    counts = []
+    t0 = timeit.default_timer()
+    for f in frames:
+        blobs, morphed = backend.find_blobs(f, min_area=min_area)
+        counts.append(0 if blobs is None else len(blobs))
+    elapsed = timeit.default_timer() - t0
+    return elapsed * 1000.0 / len(frames), np.mean(counts)
+
+
+# (label, backend name, backend keyword arguments)
+CONFIGURATIONS = [
+    ('simplecv', 'simplecv', {}),
+    ('ndimage', 'ndimage', {}),
+    ('pyramid x2', 'pyramid', {'factor' : 2}),
+    ('pyramid x2 refined', 'pyramid', {'factor' : 2, 'refine' : True}),
+    ('pyramid x4', 'pyramid', {'factor' : 4}),
+    ('pyramid x4 refined', 'pyramid', {'factor' : 4, 'refine' : True}),
+]
+
+
+def main(num_frames=50):
+    frames = synthetic_depth_frames(num_frames)
+    print('%-20s %12s %12s' % ('backend', 'ms/frame', 'blobs/frame'))
+    for label, name, kwargs in CONFIGURATIONS:
+        backend = BLOB_BACKENDS[name](**kwargs)
+        inputs = frames
+        if name == 'simplecv':
+            if scv is None:
+                print('%-20s %12s' % (label, 'skipped (no SimpleCV)'))
+                continue
+            inputs = [scv.Image(f) for f in frames]
+        ms, blobs = run(backend, inputs)
+        print('%-20s %12.3f %12.1f' % (label, ms, blobs))
+
+
+if __name__ == '__main__':
+    num_frames = 50
+    if len(sys.argv) > 1:
+        num_frames = int(sys.argv[1])
+    main(num_frames)
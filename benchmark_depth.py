@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark the conversion of the kinect's raw depth frames to 8 bit arrays.
+
+Compares the original Kinect.getDepth() path (clip, shift, astype and
+transpose on every frame) with the preallocated FramePool and lookup table
+path used by Kinect.getDepthArray(), and with the millimetre path used by
+Kinect.getMetricDepthArray(), alone and followed by the background model
+that Detector applies with metric_depth. Raw frames are synthetic, so no
+kinect is needed.
+'''
+
+import sys
+import timeit
+import numpy as np
+from framepool import DepthConverter, DEPTH_8BIT_LUT, DEPTH_MM_LUT
+from background import DepthBackground
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+SHAPE = (480, 640)
+
+
+def legacy_depth(raw):
+    np.clip(raw, 0, 2**10 - 1, raw)
+    raw >>= 2
+    return raw.astype(np.uint8).transpose()
+
+
+def pooled_depth(raw, converter):
+    return converter.convert(raw).transpose()
+
+
+def metric_foreground(raw, converter, background):
+    return background.apply(converter.convert(raw).transpose())
+
+
+def make_frames(num_frames):
+    frames = np.random.randint(0, 2048, size=(num_frames,) + SHAPE)
+    return [f for f in frames.astype(np.uint16)]
+
+
+def run(convert, frames):
+    '''
+    Return a tuple with the time per frame, in milliseconds, and the number
+    of bytes allocated per frame (or None if it can't be measured).
+    '''
+
+    t0 = timeit.default_timer()
+    for f in frames:
+        convert(f)
+    elapsed = timeit.default_timer() - t0
+    allocated = None
+    if tracemalloc is not None and hasattr(tracemalloc, 'reset_peak'):
+        total = 0
+        tracemalloc.start()
+        for f in frames:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            convert(f)
+            total += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+        allocated = total / float(len(frames))
+    return elapsed * 1000.0 / len(frames), allocated
+
+
+def main(num_frames=100):
+    converter = DepthConverter(DEPTH_8BIT_LUT, SHAPE, pool_size=3)
+    metric = DepthConverter(DEPTH_MM_LUT, SHAPE, pool_size=3)
+    background = DepthBackground(SHAPE[::-1], 400, 4500)
+    pooled_frames = make_frames(num_frames)
+    # the legacy path modifies the raw frames in place, so give it copies
+    legacy_frames = [f.copy() for f in pooled_frames]
+    assert (legacy_depth(legacy_frames[0].copy()) ==
+            pooled_depth(pooled_frames[0], converter)).all()
+    results = [
+        ('legacy getDepth', run(legacy_depth, legacy_frames)),
+        ('pooled getDepthArray', run(lambda f: pooled_depth(f, converter),
+                                     pooled_frames)),
+        ('pooled metric', run(lambda f: pooled_depth(f, metric),
+                              pooled_frames)),
+        ('metric + background', run(lambda f: metric_foreground(f, metric,
+                                                                background),
+                                    pooled_frames)),
+    ]
+    print('%-22s %12s %16s' % ('path', 'ms/frame', 'bytes alloc/frame'))
+    for name, (ms, allocated) in results:
+        if allocated is None:
+            allocated = 'n/a'
+        else:
+            allocated = '%d' % allocated
+        print('%-22s %12.3f %16s' % (name, ms, allocated))
+
+
+if __name__ == '__main__':
+    frames = 100
+    if len(sys.argv) > 1:
+        frames = int(sys.argv[1])
+    main(frames)
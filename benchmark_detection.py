@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark every Detector.detect mode, stage by stage.
+
+Each mode is run twice, with centroids only and with centroids and
+boundaries, over a recording replayed as fast as possible. Without a
+recording a synthetic one is generated first. For each run the time spent
+per frame in each stage, as measured by the Detector's instrumentation, and
+the resulting frames per second are reported.
+
+Results can be saved as a baseline and later runs compared against it, to
+spot regressions:
+
+    python benchmark_detection.py --save-baseline baseline.json
+    python benchmark_detection.py --compare baseline.json
+'''
+
+import sys
+import json
+import shutil
+import timeit
+import argparse
+import tempfile
+import numpy as np
+from recording import FrameRecorder, ReplayKinect
+from detection import Detector
+
+# streams captured by each detection mode
+MODES = [
+    ('depth', {'depth' : True}),
+    ('image', {'image' : True}),
+    ('motion_depth', {'depth' : True}),
+    ('motion_image', {'image' : True}),
+    ('combine_image_motion_image', {'image' : True}),
+    ('combine_depth_motion_depth', {'depth' : True}),
+]
+
+STAGES = ['capture', 'segmentation', 'blobs', 'centroids', 'boundaries',
+          'grid_update', 'grid_image', 'detect']
+
+
+def make_synthetic_recording(path, num_frames=100, num_people=4, seed=0):
+    '''
+    Write a recording of people walking in front of the kinect.
+
+    Depth frames hold raw 11 bit values: the floor gets farther away with
+    the lines of the image, people are closer and 1% of the pixels are
+    invalid (2047). RGB frames show the people in red over a gray floor.
+    '''
+
+    random = np.random.RandomState(seed)
+    height, width = 480, 640
+    ys, xs = np.mgrid[0:height, 0:width]
+    floor = (760 + 200 * ys / float(height)).astype(np.uint16)
+    lanes = (np.arange(num_people) + 0.5) * width / float(num_people)
+    ys_people = random.uniform(80, height - 80, num_people)
+    velocities = random.uniform(-4, 4, num_people)
+    with FrameRecorder(path) as recorder:
+        for i in range(num_frames):
+            depth = floor.copy()
+            image = np.empty((height, width, 3), dtype=np.uint8)
+            image[...] = 90
+            ys_people += velocities
+            bounce = (ys_people < 60) | (ys_people > height - 60)
+            velocities[bounce] *= -1
+            for x, y in zip(lanes, ys_people):
+                person = ((xs - x) / 30.0) ** 2 + ((ys - y) / 55.0) ** 2 < 1
+                depth[person] = 400
+                image[person] = (200, 30, 30)
+            depth[random.random_sample(depth.shape) < 0.01] = 2047
+            recorder.add_frame(depth=depth, image=image,
+                               capturetime=i / 30.0)
+
+
+def time_segmentation(detector, timings):
+    '''
+    Time the segmentation models, which the Detector's instrumentation
+    leaves out, as the 'segmentation' stage.
+    '''
+
+    def timed(original):
+        def wrapper(*args, **kwargs):
+            with timings.stage('segmentation'):
+                return original(*args, **kwargs)
+        return wrapper
+
+    for model in (detector.segmentation_model_depth,
+                  detector.segmentation_model_image):
+        for method_name in ('addImage', 'getSegmentedImage'):
+            setattr(model, method_name, timed(getattr(model, method_name)))
+
+
+def run_mode(recording_path, mode, streams, boundaries, num_frames,
+             blob_backend):
+    '''
+    Return a dictionary with the mean milliseconds per frame of each stage
+    and the frames per second.
+    '''
+
+    kinect = ReplayKinect(recording_path, realtime=False)
+    detector = Detector(kinect=kinect, blob_backend=blob_backend)
+    # keep the durations of every frame
+    detector.timings.window = None
+    detector.enable_timings()
+    time_segmentation(detector, detector.timings)
+    # the first frames warm up the segmentation models
+    for i in range(2):
+        detector.capture(**streams)
+    detector.timings.reset()
+    t0 = timeit.default_timer()
+    for i in range(num_frames):
+        detector.capture(**streams)
+        detector.detect(mode=mode, centroids=True, boundaries=boundaries)
+        detector.get_results()
+    elapsed = timeit.default_timer() - t0
+    summary = detector.timing_summary()
+    result = dict()
+    for stage in STAGES:
+        stats = summary.get(stage, {'mean' : 0, 'count' : 0})
+        result[stage] = stats['mean'] * stats['count'] / num_frames
+    result['fps'] = num_frames / elapsed
+    return result
+
+
+def run_all(recording_path, num_frames, blob_backend):
+    results = dict()
+    for mode, streams in MODES:
+        for boundaries in (False, True):
+            name = '%s/%s' % (mode, 'boundaries' if boundaries else
+                              'centroids')
+            results[name] = run_mode(recording_path, mode, streams,
+                                     boundaries, num_frames, blob_backend)
+    return results
+
+
+def print_results(results):
+    header = '%-38s' % 'mode' + ''.join('%14s' % s for s in STAGES) + \
+            '%8s' % 'fps'
+    print(header)
+    for name in sorted(results.keys()):
+        r = results[name]
+        print('%-38s' % name + ''.join('%14.3f' % r[s] for s in STAGES) +
+              '%8.1f' % r['fps'])
+
+
+def compare(results, baseline, tolerance=0.1):
+    '''
+    Print the change of each stage against a baseline, flagging the stages
+    that got slower by more than `tolerance`.
+
+    Returns: The number of regressions found.
+    '''
+
+    regressions = 0
+    print('%-38s %-12s %10s %10s %8s' % ('mode', 'stage', 'baseline',
+                                         'current', 'change'))
+    for name in sorted(results.keys()):
+        if name not in baseline:
+            continue
+        for stage in STAGES:
+            old = baseline[name].get(stage, 0)
+            new = results[name][stage]
+            if old <= 0:
+                continue
+            change = (new - old) / old
+            flag = ''
+            if change > tolerance:
+                flag = ' REGRESSION'
+                regressions += 1
+            print('%-38s %-12s %10.3f %10.3f %+7.1f%%%s' % (
+                  name, stage, old, new, change * 100, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--recording', help='A recording directory. If '
+                        'missing a synthetic recording is used.')
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--blob-backend', default='simplecv')
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative slowdown reported as a regression.')
+    args = parser.parse_args(argv)
+    recording_path = args.recording
+    tmp_dir = None
+    if recording_path is None:
+        tmp_dir = tempfile.mkdtemp()
+        recording_path = tmp_dir
+        make_synthetic_recording(recording_path, num_frames=args.frames + 2)
+    try:
+        results = run_all(recording_path, args.frames, args.blob_backend)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+    print_results(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+    regressions = 0
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, args.tolerance)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
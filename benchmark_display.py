@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark the cost per frame of preparing images for display.
+
+The original path serialized each image with SimpleCV's toString(), an RGB
+string built from the image's channels, before wrapping it in a QImage. It
+is emulated here with numpy, which underestimates it. The new path is
+display.FrameDisplay, which writes into reused 32 bit buffers through a
+colour lookup table. When PyQt4 is available, building the QImage and the
+QPixmap upload are timed too.
+'''
+
+import sys
+import timeit
+import numpy as np
+from display import FrameDisplay
+
+try:
+    from PyQt4.QtGui import QApplication, QImage, QPixmap
+except ImportError:
+    QApplication = None
+
+SIZE = (640, 480)
+
+
+def legacy_string(array):
+    '''
+    Emulate SimpleCV's toString(): an RGB string of the image, with gray
+    and metric images expanded to three channels first.
+    '''
+
+    if array.ndim == 2:
+        if array.dtype == np.uint16:
+            array = np.minimum(array // 40, 255).astype(np.uint8)
+        array = np.dstack((array, array, array))
+    return array.transpose(1, 0, 2).tobytes()
+
+
+def legacy_qimage(array):
+    data = legacy_string(array)
+    width, height = array.shape[:2]
+    return QImage(data, width, height, 3 * width, QImage.Format_RGB888)
+
+
+def make_images(random):
+    return {
+        'depth' : random.randint(0, 256, SIZE[::-1]).astype(np.uint8).T,
+        'metric' : random.randint(0, 10000, SIZE[::-1]).astype(np.uint16).T,
+        'image' : random.randint(0, 256, SIZE + (3,)).astype(np.uint8),
+    }
+
+
+def best_time(func, repeat=50):
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000.0
+
+
+def main():
+    random = np.random.RandomState(0)
+    images = make_images(random)
+    display = FrameDisplay()
+    qt = QApplication is not None
+    if qt:
+        app = QApplication(sys.argv)
+    print('%-8s %16s %16s' % ('image', 'legacy ms', 'FrameDisplay ms'))
+    for name in ('depth', 'metric', 'image'):
+        image = images[name]
+        colorize = name == 'depth'
+        if qt:
+            legacy = lambda: QPixmap.fromImage(legacy_qimage(image))
+            new = lambda: QPixmap.fromImage(display.to_qimage(image,
+                                                              colorize))
+        else:
+            legacy = lambda: legacy_string(image)
+            new = lambda: display.to_array(image, colorize)
+        print('%-8s %16.3f %16.3f' % (name, best_time(legacy),
+                                      best_time(new)))
+    if not qt:
+        print('PyQt4 is not available: QImage and QPixmap are not timed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark the fusion of several kinects into a single world.
+
+Devices stand on a circle around a 10x10 metre floor, looking at its
+center, and people walk around it. Each frame every device reports the
+centroids of the people in its field of view, as a Detector with metric
+depth would, and optionally a point cloud. The time per frame of adding
+them to a fusion.Fusion and updating it is measured for a growing number of
+devices, together with the number of people the world ends up tracking.
+'''
+
+import sys
+import timeit
+import numpy as np
+from fusion import Fusion, Extrinsics
+from pointcloud import KINECT_DEPTH_INTRINSICS
+
+NUM_PEOPLE = 10
+
+
+def devices_on_circle(num_devices, radius=7.0, height=2.5, pitch=-20):
+    extrinsics = dict()
+    for i in range(num_devices):
+        angle = 2 * np.pi * i / num_devices
+        position = (radius * np.sin(angle), 5 - radius * np.cos(angle),
+                    height)
+        extrinsics[i] = Extrinsics(position, yaw=np.degrees(-angle),
+                                   pitch=pitch)
+    return extrinsics
+
+
+def to_camera(extrinsics, world):
+    return (world - extrinsics.position).dot(extrinsics.rotation)
+
+
+def device_centroids(extrinsics, people, random, intrinsics=
+                     KINECT_DEPTH_INTRINSICS):
+    '''
+    Return the (x, z, y) centroids, in pixels and millimetres, of the people
+    a device sees.
+    '''
+
+    camera = to_camera(extrinsics, people)
+    z = camera[:, 2]
+    column = camera[:, 0] / z * intrinsics.fx + intrinsics.cx
+    line = camera[:, 1] / z * intrinsics.fy + intrinsics.cy
+    visible = (z > 0.5) & (column >= 0) & (column < 640) & (line >= 0) & \
+              (line < 480)
+    noise = random.normal(0, 10, visible.sum())
+    return np.column_stack((np.rint(column[visible]),
+                            np.rint(line[visible]),
+                            z[visible] * 1000 + noise))
+
+
+def device_points(extrinsics, people, random, points_per_person=2000):
+    world = np.repeat(people, points_per_person, axis=0)
+    world += random.normal(0, 0.15, world.shape)
+    return to_camera(extrinsics, world).astype(np.float32)
+
+
+def run(num_devices, num_frames, clouds, random):
+    extrinsics = devices_on_circle(num_devices)
+    world = Fusion(extrinsics, point_clouds=clouds)
+    people = np.column_stack((random.uniform(0, 10, NUM_PEOPLE) - 5,
+                              random.uniform(0, 10, NUM_PEOPLE),
+                              np.ones(NUM_PEOPLE)))
+    frames = []
+    for f in range(num_frames):
+        people[:, :2] += random.normal(0, 0.03, (NUM_PEOPLE, 2))
+        frame = []
+        for d, e in extrinsics.items():
+            points = device_points(e, people, random) if clouds else None
+            frame.append((d, device_centroids(e, people, random), points))
+        frames.append(frame)
+    tracked = []
+    t0 = timeit.default_timer()
+    for frame in frames:
+        for d, centroids, points in frame:
+            world.add_centroids(d, centroids)
+            if points is not None:
+                world.add_points(d, points)
+        world.update()
+        tracked.append(len(world.actor_manager.points))
+    elapsed = timeit.default_timer() - t0
+    return elapsed * 1000.0 / num_frames, np.mean(tracked)
+
+
+def main(device_counts=(1, 2, 4, 8), num_frames=100):
+    random = np.random.RandomState(0)
+    print('%d people' % NUM_PEOPLE)
+    print('%-8s %14s %14s %14s' % ('devices', 'centroids ms', '+clouds ms',
+                                   'tracked'))
+    for num_devices in device_counts:
+        centroids_ms, tracked = run(num_devices, num_frames, False, random)
+        clouds_ms = run(num_devices, num_frames, True, random)[0]
+        print('%-8i %14.3f %14.3f %14.1f' % (num_devices, centroids_ms,
+                                             clouds_ms, tracked))
+
+
+if __name__ == '__main__':
+    device_counts = (1, 2, 4, 8)
+    if len(sys.argv) > 1:
+        device_counts = [int(a) for a in sys.argv[1:]]
+    main(device_counts)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Micro-benchmark of Grid.update_grid.
+
+Compares the batched update_grid with the original per point loop, for
+10, 1000 and 100000 random points, and checks that both mark the same cells.
+Then compares dense and sparse grids, updating them and reading their
+points, and reading their dense xy grid every frame.
+'''
+
+import sys
+import timeit
+import numpy as np
+from grid import Grid
+
+
+def legacy_update_grid(grid, points):
+    '''
+    The original per point implementation of Grid.update_grid.
+    '''
+
+    grid.xy_grid.fill(255)
+    grid.xz_grid.fill(255)
+    for p in points:
+        the_point = grid._rescale_point(p)
+        if the_point is not None:
+            x, y, z = the_point
+            warped_z, warped_x = grid.xz_warper.get_coords(int(z), int(x))
+            grid_x = int(np.round(warped_x * (grid.WIDTH - 1)))
+            grid_z = int(np.round(warped_z * (grid.DEPTH - 1)))
+            grid.xz_grid[grid_z, grid_x] = grid.DEPTH_VALUE_POINT
+            grid.xy_grid[int(y), grid_x] = grid.DEPTH_VALUE_POINT
+
+
+def random_points(num_points, random):
+    x = random.uniform(-10, 650, num_points)
+    y = random.uniform(-10, 490, num_points)
+    z = random.uniform(190, 260, num_points)
+    z[::10] = 0
+    return np.column_stack((x, y, z))
+
+
+def best_time(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main(sizes=(10, 1000, 100000)):
+    random = np.random.RandomState(0)
+    legacy = Grid(cols=640, lines=480, depth=480)
+    batch = Grid(cols=640, lines=480, depth=480)
+    print('%-8s %14s %14s %10s' % ('points', 'loop ms', 'batch ms',
+                                   'speedup'))
+    for size in sizes:
+        points = random_points(size, random)
+        point_list = [tuple(p) for p in points]
+        legacy_update_grid(legacy, point_list)
+        batch.update_grid(points)
+        assert (legacy.xy_grid == batch.xy_grid).all()
+        assert (legacy.xz_grid == batch.xz_grid).all()
+        repeat = 3 if size > 10000 else 20
+        loop = best_time(lambda: legacy_update_grid(legacy, point_list),
+                         repeat)
+        vectorized = best_time(lambda: batch.update_grid(points), repeat)
+        print('%-8i %14.3f %14.3f %10.1f' % (size, loop * 1000,
+                                             vectorized * 1000,
+                                             loop / vectorized))
+    sparse = Grid(cols=640, lines=480, depth=480, sparse=True)
+    print('')
+    print('%-8s %14s %14s %14s' % ('points', 'dense ms', 'sparse ms',
+                                   'sparse+xy ms'))
+    for size in sizes:
+        points = random_points(size, random)
+        batch.update_grid(points)
+        sparse.update_grid(points)
+        assert (batch.xy_grid == sparse.xy_grid).all()
+        assert (batch.xz_grid == sparse.xz_grid).all()
+        repeat = 3 if size > 10000 else 20
+        def dense_frame():
+            batch.update_grid(points)
+            batch.get_points()
+        def sparse_frame():
+            sparse.update_grid(points)
+            sparse.get_points()
+        def sparse_xy_frame():
+            sparse.update_grid(points)
+            sparse.xy_grid
+        print('%-8i %14.3f %14.3f %14.3f' % (
+              size, best_time(dense_frame, repeat) * 1000,
+              best_time(sparse_frame, repeat) * 1000,
+              best_time(sparse_xy_frame, repeat) * 1000))
+
+
+if __name__ == '__main__':
+    sizes = (10, 1000, 100000)
+    if len(sys.argv) > 1:
+        sizes = [int(a) for a in sys.argv[1:]]
+    main(sizes)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Compare sending a frame's results as one OSC message per value with sending
+them as bundles.
+
+Messages are sent to a UDP sink on the loopback interface, running on a
+thread that counts the datagrams and bytes it receives. Each frame has a
+number of centroids and of boundaries with a number of points each.
+'''
+
+import sys
+import socket
+import timeit
+import threading
+import numpy as np
+from osccommunicator import OSCCommunicator
+
+
+class UDPSink(threading.Thread):
+
+    def __init__(self, host='127.0.0.1'):
+        super(UDPSink, self).__init__()
+        self.daemon = True
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        self.socket.bind((host, 0))
+        self.socket.settimeout(0.1)
+        self.address = self.socket.getsockname()
+        self.datagrams = 0
+        self.bytes = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try:
+                data = self.socket.recv(65536)
+            except socket.timeout:
+                continue
+            self.datagrams += 1
+            self.bytes += len(data)
+
+    def reset(self):
+        self.datagrams = 0
+        self.bytes = 0
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.socket.close()
+
+
+def synthetic_results(num_centroids, num_boundaries, boundary_points,
+                      seed=0):
+    random = np.random.RandomState(seed)
+    centroids = [tuple(int(v) for v in c) for c in \
+                 random.randint(0, 480, (num_centroids, 3))]
+    boundaries = [[tuple(float(v) for v in p) for p in \
+                   random.uniform(0, 480, (boundary_points, 3))] for \
+                  i in range(num_boundaries)]
+    return {'capturetime' : 0, 'centroids' : centroids,
+            'boundaries' : boundaries}
+
+
+def send_per_value(communicator, results):
+    '''
+    The unbatched way: one message per centroid and per boundary point.
+    '''
+
+    for index, c in enumerate(results['centroids']):
+        communicator.send_message('/kinect/centroids/%i' % index, *c)
+    for index, boundary in enumerate(results['boundaries']):
+        for pt in boundary:
+            communicator.send_message('/kinect/boundaries/%i' % index, *pt)
+
+
+def send_bundled(communicator, results):
+    communicator.send_results(results)
+
+
+def run(communicator, sink, send, results, num_frames):
+    sink.reset()
+    t0 = timeit.default_timer()
+    for i in range(num_frames):
+        send(communicator, results)
+    elapsed = timeit.default_timer() - t0
+    # give the sink some time to read what is still queued
+    previous = -1
+    while previous != sink.datagrams:
+        previous = sink.datagrams
+        threading.Event().wait(0.2)
+    return (num_frames / elapsed, sink.datagrams / float(num_frames),
+            sink.bytes / float(num_frames))
+
+
+def main(num_frames=200):
+    sink = UDPSink()
+    sink.start()
+    host, port = sink.address
+    communicator = OSCCommunicator(client_ip=host, client_port=port,
+                                   server_ip='127.0.0.1', server_port=0,
+                                   threaded=False)
+    scenes = [(4, 0, 0), (16, 0, 0), (4, 4, 40), (16, 16, 60)]
+    print('%-28s %-10s %12s %16s %14s' % ('scene', 'method', 'frames/s',
+                                          'datagrams/frame', 'bytes/frame'))
+    try:
+        for num_centroids, num_boundaries, points in scenes:
+            results = synthetic_results(num_centroids, num_boundaries,
+                                        points)
+            scene = '%i centroids, %i x %i points' % (num_centroids,
+                                                      num_boundaries, points)
+            for name, send in (('per value', send_per_value),
+                               ('bundled', send_bundled)):
+                fps, datagrams, size = run(communicator, sink, send, results,
+                                           num_frames)
+                print('%-28s %-10s %12.1f %16.1f %14.1f' % (
+                      scene, name, fps, datagrams, size))
+    finally:
+        sink.stop()
+        communicator.close()
+
+
+if __name__ == '__main__':
+    num_frames = 200
+    if len(sys.argv) > 1:
+        num_frames = int(sys.argv[1])
+    main(num_frames)
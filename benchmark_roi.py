@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Measure the saving of detecting inside a region of interest.
+
+Runs the blob finding and depth statistics steps of the Detector on
+synthetic depth frames, on the full frame and cropped to a floor-shaped
+region of interest, as Detector does when it has one. The SimpleCV backend
+is skipped when SimpleCV can't be imported.
+'''
+
+import sys
+import timeit
+import numpy as np
+from blobs import BLOB_BACKENDS, INVALID_DEPTH_VALUES, as_gray_array, \
+                  blob_labels, blob_depth_statistics
+from roi import RegionOfInterest
+from benchmark_blobs import synthetic_depth_frames
+
+try:
+    import SimpleCV as scv
+except ImportError:
+    scv = None
+
+# a trapezoid covering the floor in the lower part of the frame
+FLOOR = [(40, 479), (600, 479), (520, 200), (120, 200)]
+
+
+def detect(backend, frame, roi=None, wrap=None, min_area=1500):
+    '''
+    Return the number of blobs with a valid depth in a frame.
+    '''
+
+    image = depth = frame
+    if roi is not None:
+        image = roi.prepare(frame, fill=255)
+        depth = roi.prepare(frame, fill=INVALID_DEPTH_VALUES[0])
+    if wrap is not None:
+        image = wrap(image)
+    blobs, morphed = backend.find_blobs(image, min_area=min_area)
+    if blobs is None:
+        return 0
+    labels, label_ids = blob_labels(blobs, as_gray_array(depth).shape)
+    stats = blob_depth_statistics(labels, depth, label_ids)
+    return int((stats['count'] > 0).sum())
+
+
+def run(backend, frames, roi=None, wrap=None):
+    counts = []
+    t0 = timeit.default_timer()
+    for f in frames:
+        counts.append(detect(backend, f, roi, wrap))
+    elapsed = timeit.default_timer() - t0
+    return elapsed * 1000.0 / len(frames), np.mean(counts)
+
+
+def main(num_frames=50):
+    frames = synthetic_depth_frames(num_frames)
+    roi = RegionOfInterest(frames[0].shape, polygon=FLOOR)
+    box_area = roi.size[0] * roi.size[1]
+    print('region: %i pixels, bounding box %ix%i (%.0f%% of the frame)' % (
+          roi.mask.sum(), roi.size[0], roi.size[1],
+          100.0 * box_area / frames[0].size))
+    print('%-10s %-6s %12s %12s' % ('backend', 'area', 'ms/frame',
+                                    'blobs/frame'))
+    for name in sorted(BLOB_BACKENDS.keys()):
+        backend = BLOB_BACKENDS[name]()
+        wrap = None
+        if name == 'simplecv':
+            if scv is None:
+                print('%-10s %12s' % (name, 'skipped (no SimpleCV)'))
+                continue
+            wrap = scv.Image
+        full_ms, full_blobs = run(backend, frames, wrap=wrap)
+        roi_ms, roi_blobs = run(backend, frames, roi, wrap)
+        print('%-10s %-6s %12.3f %12.1f' % (name, 'frame', full_ms,
+                                            full_blobs))
+        print('%-10s %-6s %12.3f %12.1f' % (name, 'roi', roi_ms, roi_blobs))
+        print('%-10s %-6s %11.1fx' % (name, 'saving', full_ms / roi_ms))
+
+
+if __name__ == '__main__':
+    num_frames = 50
+    if len(sys.argv) > 1:
+        num_frames = int(sys.argv[1])
+    main(num_frames)
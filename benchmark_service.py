@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark the startup time and memory of the headless service and the GUI.
+
+Each entry point runs in a fresh interpreter, replaying a synthetic
+recording with depth detection. Startup is the time from launching the
+interpreter until the first frame has been detected, so it includes the
+imports. Memory is the peak resident set size after a number of frames.
+The GUI is only measured when PyQt4 is available.
+'''
+
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DETECTOR_KWARGS = {'blob_backend' : 'ndimage'}
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on Mac OS X
+    if sys.platform == 'darwin':
+        return peak / 1024.0 ** 2
+    return peak / 1024.0
+
+
+def run_service(recording_path, launched, num_frames):
+    import service
+    config = {
+        'devices' : [{'recording' : recording_path,
+                      'detector' : DETECTOR_KWARGS}],
+        'report_interval' : None,
+    }
+    detection_service = service.DetectionService(config)
+    detection_service.start()
+    startup = None
+    try:
+        while True:
+            detection_service.step()
+            processed = detection_service.scheduler.device(0).processed
+            if processed > 0 and startup is None:
+                startup = time.time() - launched
+            if processed >= num_frames:
+                break
+            time.sleep(detection_service.scheduler.next_interval())
+    finally:
+        detection_service.close()
+    return startup
+
+
+def run_gui(recording_path, launched, num_frames):
+    try:
+        from PyQt4.QtCore import QTimer
+        from PyQt4.QtGui import QApplication
+    except ImportError:
+        return None
+    import detection
+    import multiplekinects
+    from recording import ReplayKinect
+    app = QApplication(sys.argv)
+    kinect = ReplayKinect(recording_path)
+    detector = detection.Detector(kinect=kinect, **DETECTOR_KWARGS)
+    dlg = multiplekinects.MultipleKinectsDlg(kinects=[detector])
+    dlg.kinects[0]['detection_method'] = 'depth'
+    dlg.kinects[0]['status'] = True
+    dlg.show()
+    result = {'startup' : None}
+
+    def poll():
+        processed = dlg.scheduler_report()[0]['processed']
+        if processed > 0 and result['startup'] is None:
+            result['startup'] = time.time() - launched
+        if processed >= num_frames:
+            dlg.close()
+            app.quit()
+
+    timer = QTimer()
+    timer.timeout.connect(poll)
+    timer.start(1)
+    app.exec_()
+    return result['startup']
+
+
+def child(entry_point, recording_path, launched, num_frames):
+    run = run_service if entry_point == 'service' else run_gui
+    startup = run(recording_path, launched, num_frames)
+    print(json.dumps({'startup' : startup, 'memory' : peak_memory_mb()}))
+
+
+def measure(entry_point, recording_path, num_frames):
+    launched = time.time()
+    output = subprocess.check_output([sys.executable, __file__, '--child',
+                                      entry_point, recording_path,
+                                      repr(launched), str(num_frames)])
+    result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    if result['startup'] is None:
+        return None
+    return result
+
+
+def main(num_frames=30):
+    from benchmark_detection import make_synthetic_recording
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        make_synthetic_recording(tmp_dir, num_frames=num_frames + 2)
+        print('%-10s %12s %16s' % ('entry', 'startup s', 'peak memory MB'))
+        for entry_point in ('service', 'gui'):
+            result = measure(entry_point, tmp_dir, num_frames)
+            if result is None:
+                print('%-10s %12s %16s' % (entry_point, 'n/a', 'n/a'))
+                continue
+            memory = 'n/a'
+            if result['memory'] is not None:
+                memory = '%.1f' % result['memory']
+            print('%-10s %12.2f %16s' % (entry_point, result['startup'],
+                                         memory))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3], float(sys.argv[4]),
+              int(sys.argv[5]))
+    else:
+        num_frames = 30
+        if len(sys.argv) > 1:
+            num_frames = int(sys.argv[1])
+        main(num_frames)
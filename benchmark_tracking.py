@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark ActorManager.update_points on synthetic crowds.
+
+Each scene has actors walking with random velocities; every frame a few of
+them leave and a few new ones enter. For each crowd size the time per update
+and the fraction of actors that kept their identity are reported, for each
+matching method and for the original nested loop matching.
+'''
+
+import sys
+import timeit
+import numpy as np
+import scipy.spatial as spatial
+from tracking import ActorManager, Actor
+
+
+class LegacyActorManager(object):
+    '''
+    The original ActorManager, with greedy nearest neighbour matching.
+    '''
+
+    def __init__(self):
+        self.points = []
+
+    def update_points(self, coordinates, distance_threshold=100):
+        num_points_changes = len(coordinates) - len(self.points)
+        if num_points_changes > 0:
+            if len(self.points) == 0:
+                self.points = [Actor(c) for c in coordinates]
+            else:
+                matches = self._find_nearest_coordinate(coordinates)
+                used_coordinates = []
+                for pt, value in matches.items():
+                    coords, dist = value
+                    used_coordinates.append(coords)
+                    if dist is not None and dist < distance_threshold:
+                        pt.moved(coords)
+                unused_coordinates = [c for c in coordinates if c not in \
+                                      used_coordinates]
+                for c in unused_coordinates:
+                    self.points.append(Actor(c))
+        elif num_points_changes < 0:
+            coord_matches = self._find_nearest_point(coordinates)
+            used_points = []
+            for coord, value in coord_matches.items():
+                point, dist = value
+                used_points.append(point)
+                point.moved(coord)
+            self.points = used_points
+        else:
+            matches = self._find_nearest_point(coordinates)
+            for c, values in matches.items():
+                pt, dist = values
+                if dist < distance_threshold:
+                    pt.moved(c)
+
+    def _find_nearest_point(self, coordinates):
+        matches = dict()
+        for c in coordinates:
+            nearest_point = None
+            the_dist = None
+            for p in self.points:
+                dist = spatial.distance.euclidean(p.location, np.asarray(c))
+                if the_dist is None or dist <= the_dist:
+                    the_dist = dist
+                    nearest_point = p
+            matches[c] = (nearest_point, the_dist)
+        return matches
+
+    def _find_nearest_coordinate(self, coordinates):
+        matches = dict()
+        for p in self.points:
+            nearest_coord = None
+            the_dist = None
+            for c in coordinates:
+                dist = spatial.distance.euclidean(p.location, np.asarray(c))
+                if the_dist is None or dist <= the_dist:
+                    the_dist = dist
+                    nearest_coord = c
+            matches[p] = (nearest_coord, the_dist)
+        return matches
+
+
+class Scene(object):
+
+    def __init__(self, num_actors, random, size=5000.0, speed=15.0,
+                 turnover=0.02):
+        self.random = random
+        self.size = size
+        self.speed = speed
+        self.turnover = turnover
+        self.next_id = 0
+        self.ids = np.array([], dtype=int)
+        self.positions = np.zeros((0, 3))
+        self.velocities = np.zeros((0, 3))
+        self._spawn(num_actors)
+
+    def _spawn(self, num):
+        self.ids = np.concatenate((self.ids, self.next_id + np.arange(num)))
+        self.next_id += num
+        positions = self.random.uniform(0, self.size, (num, 3))
+        positions[:, 2] = 0
+        velocities = self.random.uniform(-self.speed, self.speed, (num, 3))
+        velocities[:, 2] = 0
+        self.positions = np.vstack((self.positions, positions))
+        self.velocities = np.vstack((self.velocities, velocities))
+
+    def step(self):
+        self.positions += self.velocities
+        num_changes = int(round(len(self.ids) * self.turnover))
+        if num_changes > 0:
+            keep = self.random.permutation(len(self.ids))[num_changes:]
+            keep.sort()
+            self.ids = self.ids[keep]
+            self.positions = self.positions[keep]
+            self.velocities = self.velocities[keep]
+            self._spawn(num_changes)
+        return [tuple(p) for p in self.positions]
+
+
+def identity_accuracy(manager, scene, previous):
+    '''
+    Return the fraction of the scene's surviving actors whose tracked Actor
+    is the same object as in the previous frame.
+    '''
+
+    current = dict()
+    for p in manager.points:
+        current[tuple(np.round(p.location, 6))] = p
+    by_id = dict()
+    for scene_id, pos in zip(scene.ids, scene.positions):
+        actor = current.get(tuple(np.round(pos, 6)))
+        if actor is not None:
+            by_id[scene_id] = actor
+    survivors = [i for i in by_id if i in previous]
+    kept = sum(1 for i in survivors if by_id[i] is previous[i])
+    accuracy = kept / float(len(survivors)) if survivors else 1.0
+    return accuracy, by_id
+
+
+def run(manager, num_actors, num_frames):
+    random = np.random.RandomState(num_actors)
+    scene = Scene(num_actors, random)
+    manager.update_points(scene.step())
+    previous = identity_accuracy(manager, scene, {})[1]
+    elapsed = 0.0
+    accuracies = []
+    for i in range(num_frames):
+        coords = scene.step()
+        t0 = timeit.default_timer()
+        manager.update_points(coords)
+        elapsed += timeit.default_timer() - t0
+        accuracy, previous = identity_accuracy(manager, scene, previous)
+        accuracies.append(accuracy)
+    return elapsed * 1000.0 / num_frames, np.mean(accuracies)
+
+
+def main(sizes=(10, 100, 500, 1000, 2000), num_frames=20, max_legacy=500):
+    managers = [
+        ('optimal', lambda: ActorManager(method='optimal')),
+        ('kdtree', lambda: ActorManager(method='kdtree')),
+        ('auto', lambda: ActorManager()),
+        ('legacy', LegacyActorManager),
+    ]
+    print('%-8s %-8s %12s %10s' % ('actors', 'method', 'ms/update',
+                                   'identity'))
+    for size in sizes:
+        for name, factory in managers:
+            if name == 'legacy' and size > max_legacy:
+                continue
+            if name == 'optimal' and size > 1000:
+                continue
+            ms, accuracy = run(factory(), size, num_frames)
+            print('%-8i %-8s %12.3f %9.1f%%' % (size, name, ms,
+                                                accuracy * 100))
+
+
+if __name__ == '__main__':
+    sizes = (10, 100, 500, 1000, 2000)
+    if len(sys.argv) > 1:
+        sizes = [int(a) for a in sys.argv[1:]]
+    main(sizes)
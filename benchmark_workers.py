@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark detection throughput with one worker process per device.
+
+Each simulated device renders synthetic depth frames with a few moving
+people-sized blobs and detects them with scipy.ndimage. The total frames per
+second for 1 to N devices is measured with all detectors running serially in
+this process and with one ProcessDetector per device.
+'''
+
+import sys
+import time
+import numpy as np
+import scipy.ndimage as ndimage
+from workers import ProcessDetector
+
+
+class SyntheticDetector(object):
+
+    def __init__(self, kinect_device=0, width=640, height=480, num_blobs=4):
+        self.device_number = kinect_device
+        self.random = np.random.RandomState(kinect_device)
+        self.width = width
+        self.height = height
+        self.positions = self.random.uniform(50, 400, (num_blobs, 2))
+        self.velocities = self.random.uniform(-5, 5, (num_blobs, 2))
+        self.xs, self.ys = np.mgrid[0:width, 0:height]
+        self.frame = 0
+        self.results = {}
+
+    def capture(self, depth=False, image=False):
+        self.positions += self.velocities
+        np.clip(self.positions, 40, min(self.width, self.height) - 40,
+                self.positions)
+        depth_frame = np.full((self.width, self.height), 255, dtype=np.uint8)
+        for x, y in self.positions:
+            inside = (self.xs - x) ** 2 + (self.ys - y) ** 2 < 35 ** 2
+            depth_frame[inside] = 120
+        self.frame += 1
+        self.results = {'frame' : self.frame, 'capturetime' : time.time(),
+                        'depth' : depth_frame}
+        return True
+
+    def detect(self, mode='depth', centroids=True, boundaries=False):
+        foreground = self.results['depth'] < 255
+        morphed = ndimage.binary_dilation(foreground, iterations=5)
+        labels, num = ndimage.label(morphed)
+        points = ndimage.center_of_mass(morphed, labels, range(1, num + 1))
+        self.results['centroids'] = [(x, y, 120) for x, y in points]
+
+    def get_results(self):
+        return self.results
+
+
+def serial_fps(num_devices, duration):
+    detectors = [SyntheticDetector(i) for i in range(num_devices)]
+    frames = 0
+    start = time.time()
+    while time.time() - start < duration:
+        for d in detectors:
+            d.capture(depth=True)
+            d.detect()
+            d.get_results()
+            frames += 1
+    return frames / (time.time() - start)
+
+
+def process_fps(num_devices, duration):
+    detectors = [ProcessDetector(i, factory=SyntheticDetector,
+                                 factory_kwargs={'kinect_device' : i},
+                                 capture_depth=True, capture_image=False) \
+                 for i in range(num_devices)]
+    for d in detectors:
+        d.start_capture(depth=True)
+    # let the workers start up before measuring
+    time.sleep(1.0)
+    first = [d.shared.frame_number() for d in detectors]
+    start = time.time()
+    while time.time() - start < duration:
+        for d in detectors:
+            if d.capture():
+                d.get_results()
+        time.sleep(0.001)
+    elapsed = time.time() - start
+    last = [d.shared.frame_number() for d in detectors]
+    for d in detectors:
+        d.stop_capture()
+    return (sum(last) - sum(first)) / elapsed
+
+
+def main(max_devices=4, duration=3.0):
+    print('%-8s %14s %14s' % ('devices', 'serial fps', 'processes fps'))
+    for n in range(1, max_devices + 1):
+        print('%-8i %14.1f %14.1f' % (n, serial_fps(n, duration),
+                                     process_fps(n, duration)))
+
+
+if __name__ == '__main__':
+    max_devices = 4
+    if len(sys.argv) > 1:
+        max_devices = int(sys.argv[1])
+    main(max_devices)
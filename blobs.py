@@ -0,0 +1,563 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Blob finding backends for the Detector.
+
+The SimpleCV backend is the original implementation. The ndimage backend
+works directly on numpy arrays with scipy.ndimage, giving areas, centroids,
+bounding boxes and label masks without building SimpleCV images or blobs.
+
+Arrays follow SimpleCV's convention and are indexed [x, y].
+'''
+
+import numpy as np
+import scipy.ndimage as ndimage
+
+# 3x3 square structuring element, like the kernel used by SimpleCV's dilate
+SQUARE = np.ones((3, 3), dtype=bool)
+
+# depth values that are not real sensor measurements, in the 8 bit and in
+# the raw 11 bit depth
+INVALID_DEPTH_VALUES = (255, 2047)
+
+# depth values without a sensor measurement in the depth in millimetres
+INVALID_METRIC_DEPTH_VALUES = (0,)
+
+# neighbour offsets, in clockwise order, used when tracing contours
+_NEIGHBOURS = ((-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1),
+               (-1, -1))
+
+
+def as_gray_array(image):
+    '''
+    Return a 2D numpy array with the grayscale values of a SimpleCV.Image,
+    or the array itself.
+    '''
+
+    if hasattr(image, 'getGrayNumpy'):
+        return image.getGrayNumpy()
+    return np.asarray(image)
+
+
+def otsu_threshold(gray):
+    '''
+    Return the Otsu threshold of an 8 bit grayscale array.
+    '''
+
+    hist = np.bincount(gray.ravel(), minlength=256)[:256].astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 0
+    levels = np.arange(256)
+    weight_background = np.cumsum(hist)
+    weight_foreground = total - weight_background
+    cumulative_mean = np.cumsum(hist * levels)
+    mean_background = cumulative_mean / np.maximum(weight_background, 1)
+    mean_foreground = ((cumulative_mean[-1] - cumulative_mean) /
+                       np.maximum(weight_foreground, 1))
+    between = (weight_background * weight_foreground *
+               (mean_background - mean_foreground) ** 2)
+    return int(np.argmax(between))
+
+
+def trace_contour(mask):
+    '''
+    Trace the outer contour of the single blob in a boolean mask.
+
+    Inputs:
+
+        mask - A 2D boolean array.
+
+    Returns: A list of (i, j) tuples with the indexes of the contour's
+        pixels, in clockwise order.
+    '''
+
+    padded = np.pad(mask, 1, mode='constant')
+    foreground = np.argwhere(padded)
+    if len(foreground) == 0:
+        return []
+    start = (int(foreground[0][0]), int(foreground[0][1]))
+    contour = [start]
+    current = start
+    # the pixel above the first foreground pixel is always background
+    backtrack = 0
+    first_move = None
+    for i in range(4 * padded.size):
+        for k in range(1, 9):
+            direction = (backtrack + k) % 8
+            di, dj = _NEIGHBOURS[direction]
+            candidate = (current[0] + di, current[1] + dj)
+            if padded[candidate]:
+                break
+        else:
+            # isolated pixel
+            break
+        # the last background neighbour checked, seen from the candidate
+        bi, bj = _NEIGHBOURS[(direction - 1) % 8]
+        previous = (current[0] + bi - candidate[0],
+                    current[1] + bj - candidate[1])
+        move = (current, candidate)
+        if first_move is None:
+            first_move = move
+        elif move == first_move:
+            break
+        backtrack = _NEIGHBOURS.index(previous)
+        current = candidate
+        if current != start:
+            contour.append(current)
+    return [(i - 1, j - 1) for i, j in contour]
+
+
+def blob_labels(blobs, shape):
+    '''
+    Return a label image for a set of blobs.
+
+    Inputs:
+
+        blobs - A BlobSet or SimpleCV blobs.
+
+        shape - The shape of the label image, indexed [x, y].
+
+    Returns: A tuple (labels, label_ids) with an integer array where the
+        pixels of each blob hold its label and an array with the label of
+        each blob, in the same order as the blobs.
+    '''
+
+    if isinstance(blobs, BlobSet):
+        return blobs.labels, blobs.label_ids
+    labels = np.zeros(shape, dtype=np.int32)
+    for i, b in enumerate(blobs):
+        x, y, w, h = [int(v) for v in b.boundingBox()]
+        mask = b.blobMask().getGrayNumpy()[:w, :h] > 0
+        labels[x:x + w, y:y + h][mask] = i + 1
+    return labels, np.arange(1, len(blobs) + 1)
+
+
+def blob_depth_statistics(labels, depth, label_ids, percentiles=(),
+                          invalid_values=INVALID_DEPTH_VALUES):
+    '''
+    Compute depth statistics for all blobs in one pass.
+
+    Inputs:
+
+        labels - An integer array with the label of each pixel, 0 being the
+            background.
+
+        depth - An array with the same shape as labels holding the depth.
+
+        label_ids - An array with the labels of the blobs to measure.
+
+        percentiles - A sequence of percentiles (between 0 and 100) to
+            compute, e.g. 50 for the median.
+
+        invalid_values - Depth values that are ignored.
+
+    Returns: A dictionary with arrays holding one value per label in
+        label_ids: 'count' has the number of valid pixels, 'mean' the mean
+        depth and each percentile, as a float key, its depth. Blobs without
+        valid pixels get nan.
+    '''
+
+    label_ids = np.asarray(label_ids, dtype=np.intp)
+    labels = labels.ravel()
+    depth = depth.ravel()
+    valid = labels > 0
+    for value in invalid_values:
+        valid &= depth != value
+    valid_labels = labels[valid]
+    valid_depth = depth[valid]
+    num_labels = max(int(label_ids.max()) if len(label_ids) else 0,
+                     int(valid_labels.max()) if len(valid_labels) else 0) + 1
+    counts = np.bincount(valid_labels, minlength=num_labels)
+    sums = np.bincount(valid_labels, weights=valid_depth,
+                       minlength=num_labels)
+    blob_counts = counts[label_ids]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = {
+            'count' : blob_counts,
+            'mean' : sums[label_ids] / blob_counts,
+        }
+    if len(percentiles) > 0:
+        # sort the valid pixels by label and then by depth, so the pixels
+        # of each label form a sorted run
+        order = np.lexsort((valid_depth, valid_labels))
+        sorted_depth = valid_depth[order].astype(np.float64)
+        starts = (np.cumsum(counts) - counts)[label_ids]
+        empty = blob_counts == 0
+        last = np.maximum(blob_counts - 1, 0)
+        for q in percentiles:
+            position = last * (q / 100.0)
+            low = np.floor(position).astype(np.intp)
+            high = np.minimum(low + 1, last)
+            fraction = position - low
+            if len(sorted_depth) > 0:
+                low_values = sorted_depth[np.minimum(starts + low,
+                                                     len(sorted_depth) - 1)]
+                high_values = sorted_depth[np.minimum(starts + high,
+                                                      len(sorted_depth) - 1)]
+                values = low_values + (high_values - low_values) * fraction
+            else:
+                values = np.zeros(len(label_ids))
+            values[empty] = np.nan
+            stats[float(q)] = values
+    return stats
+
+
+class LabeledBlob(object):
+    '''
+    A blob found by the ndimage backend.
+
+    It offers the parts of SimpleCV's Blob interface that the Detector and
+    the GUI use.
+    '''
+
+    def __init__(self, blob_set, index):
+        self.blob_set = blob_set
+        self.index = index
+        self.label = blob_set.label_ids[index]
+        self.slices = blob_set.slices[index]
+        self.image = blob_set.image
+
+    def area(self):
+        return self.blob_set.areas[self.index]
+
+    def centroid(self):
+        x, y = self.blob_set.centroids[self.index]
+        return x, y
+
+    def boundingBox(self):
+        '''
+        Return the blob's bounding box as (x, y, width, height).
+        '''
+
+        sx, sy = self.slices
+        return (sx.start, sy.start, sx.stop - sx.start, sy.stop - sy.start)
+
+    def mask(self):
+        '''
+        Return a boolean array with the blob's pixels inside its bounding
+        box.
+        '''
+
+        return self.blob_set.labels[self.slices] == self.label
+
+    def crop(self):
+        '''
+        Return the part of the blob's image inside its bounding box.
+        '''
+
+        return as_gray_array(self.image)[self.slices]
+
+    def contour(self):
+        x0, y0 = self.slices[0].start, self.slices[1].start
+        return [(x + x0, y + y0) for x, y in trace_contour(self.mask())]
+
+
+class BlobSet(object):
+    '''
+    The blobs found in an image by the ndimage backend.
+
+    Besides behaving like a list of LabeledBlobs, it keeps the label image
+    and per blob arrays with the areas, centroids and bounding boxes.
+    '''
+
+    def __init__(self, labels, label_ids, areas, centroids, slices,
+                 image=None):
+        '''
+        Inputs:
+
+            labels - An integer array with the label of each pixel, 0 being
+                the background.
+
+            label_ids - An array with the label of each blob.
+
+            areas - An array with the number of pixels of each blob.
+
+            centroids - An (N, 2) array with the (x, y) centroid of each
+                blob.
+
+            slices - A list with the bounding box of each blob, as a tuple of
+                slices into the label image.
+
+            image - The image where the blobs were found.
+        '''
+
+        self.labels = labels
+        self.label_ids = np.asarray(label_ids)
+        self.areas = np.asarray(areas)
+        self.centroids = np.asarray(centroids, dtype=np.float64).reshape(-1,
+                                                                         2)
+        self.slices = list(slices)
+        self.image = image
+
+    def __len__(self):
+        return len(self.label_ids)
+
+    def __getitem__(self, index):
+        return LabeledBlob(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield LabeledBlob(self, i)
+
+    def area(self):
+        return self.areas
+
+    def filter(self, selection):
+        '''
+        Return a new BlobSet with the blobs selected by a boolean array.
+        '''
+
+        indexes = np.flatnonzero(selection)
+        return BlobSet(self.labels, self.label_ids[indexes],
+                       self.areas[indexes], self.centroids[indexes],
+                       [self.slices[i] for i in indexes], self.image)
+
+
+class NdimageBlobBackend(object):
+
+    def __init__(self, threshold=None, dilation=5):
+        '''
+        Inputs:
+
+            threshold - The grayscale value above which pixels belong to
+                blobs. If None (the default) it is found with Otsu's method
+                on each image, like SimpleCV's findBlobs does.
+
+            dilation - The number of times the foreground is dilated with a
+                3x3 square before labeling.
+        '''
+
+        self.threshold = threshold
+        self.dilation = dilation
+
+    def find_blobs(self, image, min_area=0, invert_image=True):
+        '''
+        Find the blobs in an image.
+
+        Inputs:
+
+            image - A SimpleCV.Image or a 2D uint8 array, indexed [x, y].
+
+            min_area - Blobs with this number of pixels or fewer are dropped.
+
+            invert_image - A boolean indicating if the image should be
+                inverted first, so that dark pixels (near, in a depth image)
+                become blobs.
+
+        Returns: A tuple (blobs, morphed) with a BlobSet, or None if no blob
+            was found, and a uint8 array with the dilated foreground.
+        '''
+
+        gray = as_gray_array(image)
+        if invert_image:
+            gray = 255 - gray
+        threshold = self.threshold
+        if threshold is None:
+            threshold = otsu_threshold(gray)
+        foreground = gray > threshold
+        if self.dilation > 0:
+            foreground = ndimage.binary_dilation(foreground, SQUARE,
+                                                 iterations=self.dilation)
+        morphed = foreground.view(np.uint8) * np.uint8(255)
+        labels, num_labels = ndimage.label(foreground, SQUARE)
+        if num_labels == 0:
+            return None, morphed
+        areas = np.bincount(labels.ravel(), minlength=num_labels + 1)[1:]
+        label_ids = np.flatnonzero(areas > min_area) + 1
+        if len(label_ids) == 0:
+            return None, morphed
+        slices = ndimage.find_objects(labels)
+        centroids = ndimage.center_of_mass(foreground, labels, label_ids)
+        blobs = BlobSet(labels, label_ids, areas[label_ids - 1], centroids,
+                        [slices[i - 1] for i in label_ids], image)
+        return blobs, morphed
+
+
+def downsample(gray, factor):
+    '''
+    Return a uint8 array with the mean of each factor x factor block of a
+    grayscale array. Lines and columns that don't fill a block are left
+    out.
+    '''
+
+    w = gray.shape[0] // factor
+    h = gray.shape[1] // factor
+    blocks = gray[:w * factor, :h * factor].reshape(w, factor, h, factor)
+    sums = blocks.sum(axis=3, dtype=np.uint32).sum(axis=1)
+    return (sums // (factor * factor)).astype(np.uint8)
+
+
+def upsample(array, factor, shape):
+    '''
+    Repeat each element of an array in a factor x factor block, padding the
+    result with zeros up to shape.
+    '''
+
+    big = np.repeat(np.repeat(array, factor, axis=0), factor, axis=1)
+    if big.shape == tuple(shape):
+        return big
+    result = np.zeros(shape, dtype=array.dtype)
+    result[:big.shape[0], :big.shape[1]] = big
+    return result
+
+
+class PyramidBlobBackend(object):
+    '''
+    Finds blobs on a downsampled copy of the image, which is much cheaper
+    for people-sized blobs, and maps them back to full resolution.
+    '''
+
+    def __init__(self, factor=2, refine=False, threshold=None, dilation=5):
+        '''
+        Inputs:
+
+            factor - The downsampling factor: each factor x factor block of
+                pixels becomes a single pixel.
+
+            refine - A boolean indicating if the blobs' pixels are refined
+                at full resolution. If False the blobs are made of whole
+                blocks and their areas, centroids and bounding boxes are
+                scaled from the downsampled image. If True only the pixels
+                of the blocks that are above the threshold at full
+                resolution, dilated like NdimageBlobBackend does, are kept.
+
+            threshold - The grayscale value above which pixels belong to
+                blobs. If None (the default) it is found with Otsu's method
+                on the downsampled image.
+
+            dilation - The number of times the foreground would be dilated
+                at full resolution. It is divided by factor, rounding up,
+                for the downsampled image, so the blocks cover at least the
+                full resolution dilation.
+        '''
+
+        self.factor = int(factor)
+        self.refine = refine
+        self.threshold = threshold
+        self.dilation = dilation
+
+    def find_blobs(self, image, min_area=0, invert_image=True):
+        '''
+        Find the blobs in an image, like NdimageBlobBackend.find_blobs.
+
+        min_area is in full resolution pixels and is compared with the
+        blobs' area before refinement.
+
+        Returns: A tuple (blobs, morphed) with a BlobSet, in full resolution
+            coordinates, or None, and a full resolution uint8 array with the
+            dilated foreground.
+        '''
+
+        gray = as_gray_array(image)
+        if invert_image:
+            gray = 255 - gray
+        factor = self.factor
+        small = downsample(gray, factor)
+        threshold = self.threshold
+        if threshold is None:
+            threshold = otsu_threshold(small)
+        foreground = small > threshold
+        dilation = (int(self.dilation) + factor - 1) // factor
+        if dilation > 0:
+            foreground = ndimage.binary_dilation(foreground, SQUARE,
+                                                 iterations=dilation)
+        morphed = upsample(foreground.view(np.uint8) * np.uint8(255), factor,
+                           gray.shape)
+        labels, num_labels = ndimage.label(foreground, SQUARE)
+        if num_labels == 0:
+            return None, morphed
+        block_area = factor * factor
+        areas = np.bincount(labels.ravel(), minlength=num_labels + 1)[1:]
+        label_ids = np.flatnonzero(areas * block_area > min_area) + 1
+        if len(label_ids) == 0:
+            return None, morphed
+        full_labels = upsample(labels, factor, gray.shape)
+        small_slices = ndimage.find_objects(labels)
+        slices = []
+        for i in label_ids:
+            sx, sy = small_slices[i - 1]
+            slices.append((slice(sx.start * factor, sx.stop * factor),
+                           slice(sy.start * factor, sy.stop * factor)))
+        if self.refine:
+            return self._refine(image, gray, threshold, full_labels,
+                                label_ids, slices), morphed
+        # the center of a block is half a block from its first pixel
+        centroids = np.asarray(ndimage.center_of_mass(
+            foreground, labels, label_ids)).reshape(-1, 2)
+        centroids = (centroids + 0.5) * factor - 0.5
+        areas = areas[label_ids - 1] * block_area
+        blobs = BlobSet(full_labels, label_ids, areas, centroids, slices,
+                        image)
+        return blobs, morphed
+
+    def _refine(self, image, gray, threshold, labels, label_ids, slices):
+        '''
+        Keep the pixels of each blob that are above the threshold at full
+        resolution, dilated like NdimageBlobBackend dilates the foreground,
+        working only inside the blobs' bounding boxes. The blocks cover the
+        dilation, so it never reaches beyond a blob's pixels.
+
+        Returns: A BlobSet or None if no blob has pixels left.
+        '''
+
+        kept_ids = []
+        areas = []
+        centroids = []
+        kept_slices = []
+        for label, box in zip(label_ids, slices):
+            box_labels = labels[box]
+            blob = box_labels == label
+            above = gray[box] > threshold
+            if self.dilation > 0:
+                above = ndimage.binary_dilation(above, SQUARE,
+                                                iterations=self.dilation)
+            dropped = blob & ~above
+            box_labels[dropped] = 0
+            xs, ys = np.nonzero(blob & ~dropped)
+            if len(xs) == 0:
+                continue
+            x0, y0 = box[0].start, box[1].start
+            x1, y1 = x0 + int(xs.max()) + 1, y0 + int(ys.max()) + 1
+            kept_ids.append(label)
+            areas.append(len(xs))
+            centroids.append((xs.mean() + x0, ys.mean() + y0))
+            kept_slices.append((slice(x0 + int(xs.min()), x1),
+                                slice(y0 + int(ys.min()), y1)))
+        if len(kept_ids) == 0:
+            return None
+        return BlobSet(labels, kept_ids, areas, centroids, kept_slices,
+                       image)
+
+
+class SimpleCVBlobBackend(object):
+
+    def __init__(self, dilation=5):
+        self.dilation = dilation
+
+    def find_blobs(self, image, min_area=0, invert_image=True):
+        '''
+        Find the blobs in a SimpleCV.Image with SimpleCV's findBlobs.
+
+        Returns: A tuple (blobs, morphed) with a FeatureSet of blobs, or
+            None, and the dilated SimpleCV.Image.
+        '''
+
+        if invert_image:
+            im = image.invert()
+        else:
+            im = image
+        morphed = im.dilate(self.dilation)
+        blobs = morphed.findBlobs()
+        big_blobs = None
+        if blobs is not None:
+            big_blobs = blobs.filter(blobs.area() > min_area)
+        return big_blobs, morphed
+
+
+BLOB_BACKENDS = {
+    'simplecv' : SimpleCVBlobBackend,
+    'ndimage' : NdimageBlobBackend,
+    'pyramid' : PyramidBlobBackend,
+}
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Background capture of the kinect's frames.
+
+Each device gets a producer thread that keeps grabbing frames and publishes
+them into a FrameSlot. Consumers take the newest frame from the slot without
+waiting for the USB transfer.
+'''
+
+import time
+import threading
+
+
+class CaptureStats(object):
+
+    def __init__(self):
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_consumed = 0
+        self.errors = 0
+        self.last_latency = None
+        self.max_latency = None
+        self.total_latency = 0.0
+
+    def mean_latency(self):
+        if self.frames_consumed == 0:
+            return None
+        return self.total_latency / self.frames_consumed
+
+    def as_dict(self):
+        return {
+            'frames_captured' : self.frames_captured,
+            'frames_dropped' : self.frames_dropped,
+            'frames_consumed' : self.frames_consumed,
+            'errors' : self.errors,
+            'last_latency' : self.last_latency,
+            'mean_latency' : self.mean_latency(),
+            'max_latency' : self.max_latency,
+        }
+
+
+class FrameSlot(object):
+    '''
+    A lock protected slot that holds the latest captured frame.
+
+    Publishing a frame replaces the previous one. If the previous frame had
+    not been taken yet it is counted as dropped.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frame = None
+        self.capturetime = None
+        self.sequence = 0
+        self.consumed_sequence = 0
+        self.stats = CaptureStats()
+
+    def put(self, frame, capturetime=None):
+        if capturetime is None:
+            capturetime = time.time()
+        with self.lock:
+            if self.sequence > self.consumed_sequence:
+                self.stats.frames_dropped += 1
+            self.frame = frame
+            self.capturetime = capturetime
+            self.sequence += 1
+            self.stats.frames_captured += 1
+
+    def take(self):
+        '''
+        Return a tuple (frame, capturetime, sequence) with the newest frame,
+        or None if no new frame has been published since the last call.
+        '''
+
+        with self.lock:
+            if self.sequence == self.consumed_sequence:
+                return None
+            self.consumed_sequence = self.sequence
+            latency = time.time() - self.capturetime
+            stats = self.stats
+            stats.frames_consumed += 1
+            stats.last_latency = latency
+            stats.total_latency += latency
+            if stats.max_latency is None or latency > stats.max_latency:
+                stats.max_latency = latency
+            return self.frame, self.capturetime, self.sequence
+
+
+class CaptureThread(threading.Thread):
+    '''
+    A daemon thread that grabs frames from a device and publishes them into
+    a FrameSlot.
+    '''
+
+    def __init__(self, device, depth=True, image=False, slot=None,
+                 error_delay=0.1, metric=False):
+        '''
+        Inputs:
+
+            device - An object with getDepth() and getImage() methods, like
+                mykinect.Kinect.
+
+            depth - A boolean indicating if depth frames should be grabbed.
+
+            image - A boolean indicating if RGB frames should be grabbed.
+
+            slot - The FrameSlot where frames are published. If None (the
+                default) a new one is created.
+
+            error_delay - Seconds to wait before retrying after the device
+                raises an error.
+
+            metric - A boolean indicating if the depth is grabbed in
+                millimetres, with the device's getMetricDepthArray(), instead
+                of as an 8 bit image. Each metric frame is copied out of the
+                device's buffer pool, so it stays valid however many frames
+                the thread grabs before it is read.
+        '''
+
+        super(CaptureThread, self).__init__()
+        self.daemon = True
+        self.device = device
+        self.depth = depth
+        self.image = image
+        self.slot = slot if slot is not None else FrameSlot()
+        self.error_delay = error_delay
+        self.metric = metric
+        self._stop_event = threading.Event()
+
+    def grab(self):
+        '''
+        Return a dictionary with the 'depth' and 'image' of a new frame.
+        '''
+
+        frame = {'depth' : None, 'image' : None}
+        if self.depth:
+            if self.metric:
+                # the array is a view into the device's buffer pool, which
+                # this thread keeps refilling while the consumer reads it
+                frame['depth'] = self.device.getMetricDepthArray().copy(
+                    order='K')
+            else:
+                frame['depth'] = self.device.getDepth()
+        if self.image:
+            frame['image'] = self.device.getImage()
+        return frame
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                frame = self.grab()
+            except Exception:
+                self.slot.stats.errors += 1
+                self._stop_event.wait(self.error_delay)
+                continue
+            capturetime = getattr(self.device, 'capturetime', None)
+            self.slot.put(frame, capturetime)
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
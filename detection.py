@@ -4,170 +4,171 @@
 '''
 '''
 
+import time
 import numpy as np
-import scipy.spatial as spatial
 import SimpleCV as scv
 from shapely.geometry import Polygon
 from mykinect import Kinect
 from grid import Grid, GridWarper
 from osccommunicator import OSCCommunicator
+from capture import CaptureThread
+from tracking import ActorManager, Actor
+from blobs import BLOB_BACKENDS, INVALID_DEPTH_VALUES, \
+                  INVALID_METRIC_DEPTH_VALUES, as_gray_array, \
+                  blob_labels, blob_depth_statistics
+from instrumentation import StageTimings
+from pipeline import LazyPipeline, LazyValue
+from roi import RegionOfInterest
+from pointcloud import PointCloud
+from background import DepthBackground
+
+# the streams that each detection mode captures
+MODE_STREAMS = {
+    'depth' : ('depth',),
+    'image' : ('image',),
+    'motion_depth' : ('depth',),
+    'motion_image' : ('image',),
+    'combine_image_motion_image' : ('image',),
+    'combine_depth_motion_depth' : ('depth',),
+}
+
+# the images that are cropped to the bounding box of the region of interest,
+# which starts at the results' 'blobs_offset'
+ROI_IMAGES = ('depth_blob_source', 'image_blob_source', 'motion_depth',
+              'motion_depth_blob_source', 'motion_image',
+              'motion_image_blob_source')
+
+
+def capture_streams(mode, depth=False, image=False):
+    '''
+    Return a dictionary with the 'depth' and 'image' arguments of
+    Detector.start_capture() and Detector.capture() for a detection mode.
+    The depth and image inputs add streams that something else needs.
+    '''
+
+    streams = {'depth' : depth, 'image' : image}
+    for stream in MODE_STREAMS.get(str(mode), ('depth', 'image')):
+        streams[stream] = True
+    return streams
 
-class ActorManager(object):
-
-    def __init__(self):
-        self.points = []
+class KinectNotDetectedError(Exception):
+    pass
 
-    def update_points(self, coordinates, distance_threshold=100):
-        num_points_changes = len(coordinates) - len(self.points)
-        if num_points_changes > 0:
-            # there are new points to add
-            if len(self.points) == 0:
-                # all the points are new, add them
-                self.points = [Actor(c) for c in coordinates]
-            else:
-                # first, match the old points
-                matches = self._find_nearest_coordinate(coordinates)
-                used_coordinates = []
-                for pt, value in matches.iteritems():
-                    coords, dist = value
-                    used_coordinates.append(coords)
-                    if dist is not None and dist < distance_threshold:
-                        pt.moved(coords)
-                # now add the new points
-                unused_coordinates = [c for c in coordinates if c not in \
-                                      used_coordinates]
-                for c in unused_coordinates:
-                    self.points.append(Actor(c))
-        elif num_points_changes < 0:
-            # remove the points that are gone
-            if num_points_changes == (self.points * -1):
-                # all the points are gone
-                self.points = []
-            else:
-                coord_matches = self._find_nearest_point(coordinates)
-                used_points = []
-                for coord, value in coord_matches.iteritems():
-                    point, dist = value
-                    used_points.append(point)
-                    point.moved(coord)
-                self.points = used_points
-        else:
-            #existing points are the same, update them
-            matches = self._find_nearest_point(coordinates)
-            for c, values in matches.iteritems():
-                pt, dist = values
-                if dist < distance_threshold:
-                    pt.moved(c)
+class Detector(object):
 
-    def _find_nearest_point(self, coordinates):
+    def __init__(self, kinect_device=0, min_depth_value=200,
+                 blob_backend='simplecv', depth_statistic='mean',
+                 kinect=None, sparse_grids=False, roi_mask=None,
+                 roi_polygon=None, blob_backend_kwargs=None,
+                 metric_depth=False, min_distance=0.4, max_distance=4.5,
+                 background_threshold=0.1):
         '''
-        Find the nearest point to each coordinate.
-
         Inputs:
 
-            coordinates - A list of (x, z, y) tuples with the coordinates to match.
+            kinect_device - The number of the kinect device to use.
 
-        Returns: A dictionary with each input coordinate as key and a tuple
-            (point, distance) with the instance's point that is nearest to the
-            coordinate and the respective distance.
-        '''
+            min_depth_value - The minimum depth value used by the grids
+                with the 8 bit depth.
 
-        matches = dict()
-        for c in coordinates:
-            nearest_point = None
-            the_dist = None
-            for p in self.points:
-                dist = spatial.distance.euclidean(p.location, np.asarray(c))
-                if the_dist is None:
-                    the_dist = dist
-                else:
-                    the_dist = min(the_dist, dist)
-                if the_dist == dist:
-                    nearest_point = p
-            matches[c] = (nearest_point, the_dist)
-        return matches
+            blob_backend - A string with the name of the backend used to
+                find blobs, one of the keys of blobs.BLOB_BACKENDS.
 
-    def _find_nearest_coordinate(self, coordinates):
-        '''
-        Find the nearest coordinate to each point.
+            depth_statistic - The statistic of each blob's depth used as
+                its centroid's depth: 'mean', 'median' or a number between
+                0 and 100 with a percentile.
 
-        Inputs:
+            kinect - The device to capture from, for instance a
+                recording.ReplayKinect. If None (the default) the kinect
+                numbered kinect_device is used.
 
-            coordinates - A list of (x, z, y) tuples with the coordinates.
+            sparse_grids - A boolean indicating if the centroids and
+                boundaries grids only keep the coordinates of their points,
+                drawing the dense grids only when their images are read.
 
-        Returns: A dictionary with points as keys and a tuple with the 
-            nearest coordinate and the respective distance.
-        '''
+            roi_mask, roi_polygon - A region of interest where detection is
+                done. See set_roi().
 
-        matches = dict()
-        for p in self.points:
-            nearest_coord = None
-            the_dist = None
-            for c in coordinates:
-                dist = spatial.distance.euclidean(p.location, np.asarray(c))
-                if the_dist is None:
-                    the_dist = dist
-                else:
-                    the_dist = min(the_dist, dist)
-                if the_dist == dist:
-                    nearest_coord = c
-            matches[p] = (nearest_coord, the_dist)
-        return matches
-
-class Actor(object):
-
-    def __init__(self, coords, color=None):
-        if color is None:
-            self.color = scv.Color().getRandom()
-        else:
-            self.color = color
-        self.location = np.asarray(coords)
-        self.velocity = np.asarray([0, 0, 0])
-        self.acceleration = np.asarray([0, 0, 0])
-        self.direction = None
-        self.acceleration = 0
-
-    def moved(self, new_coords):
-        new_coords = np.asarray(new_coords)
-        vel = new_coords - self.location
-        accel = vel - self.velocity
-        self.acceleration = accel
-        self.velocity = vel
-        self.location = new_coords
+            blob_backend_kwargs - A dictionary with keyword arguments for
+                the blob backend. See set_blob_backend().
 
+            metric_depth - A boolean indicating if the depth is captured in
+                millimetres, from the kinect's 11 bit values, instead of as
+                an 8 bit image. Depth detection then finds the things
+                between min_distance and max_distance that are in front of
+                the learned background, see background.DepthBackground. The
+                centroids' and boundaries' depth is in millimetres and the
+                grids' depth axis goes from min_distance to max_distance.
 
-class KinectNotDetectedError(Exception):
-    pass
+            min_distance, max_distance - The range of distances, in metres,
+                used with metric_depth.
 
-class Detector(object):
+            background_threshold - How much closer than the background, in
+                metres, things must be to be detected with metric_depth.
+        '''
 
-    def __init__(self, kinect_device=0, min_depth_value=200):
-        #self.kinect = Kinect(kinect_device)
-        self.kinect = scv.Camera() # just for testing
-        try:
-            im = self.kinect.getImage()
-        except:
+        self.device_number = getattr(kinect, 'device_number', kinect_device)
+        if kinect is not None:
+            self.kinect = kinect
+        else:
+            #self.kinect = Kinect(kinect_device)
+            self.kinect = scv.Camera() # just for testing
+        im = None
+        for get_frame in (self.kinect.getImage, self.kinect.getDepth):
+            try:
+                im = get_frame()
+                break
+            except Exception:
+                pass
+        if im is None:
             raise KinectNotDetectedError
+        self.frame_size = (im.width, im.height)
+        self.metric_depth = metric_depth
+        if metric_depth:
+            self.min_distance_mm = max(int(round(min_distance * 1000)), 1)
+            self.max_distance_mm = int(round(max_distance * 1000))
+            self.depth_background = DepthBackground(
+                self.frame_size, self.min_distance_mm, self.max_distance_mm,
+                threshold=background_threshold * 1000)
+            self.invalid_depth_values = INVALID_METRIC_DEPTH_VALUES
+            grid_depth_range = {'real_min_depth' : self.min_distance_mm,
+                                'real_max_depth' : self.max_distance_mm}
+        else:
+            self.invalid_depth_values = INVALID_DEPTH_VALUES
+            grid_depth_range = {'real_min_depth' : min_depth_value}
         self.centroids_grid = Grid(cols=im.width, lines=im.height, 
                                    depth=im.height,
-                                   real_min_depth=min_depth_value)
+                                   sparse=sparse_grids,
+                                   **grid_depth_range)
         self.boundaries_grid = Grid(cols=im.width, lines=im.height, 
                                     depth=im.height,
-                                    real_min_depth=min_depth_value)
+                                    sparse=sparse_grids,
+                                    **grid_depth_range)
         self.segmentation_model_depth = scv.RunningSegmentation()
         self.segmentation_model_image = scv.RunningSegmentation()
-        self.image_pipeline = {
+        self.image_pipeline = LazyPipeline({
             'frame' : 0,
+            'capturetime' : None,
             'image' : None,
             'depth' : None,
-        }
+        })
         self.detected = {
             'blobs' : None,
+            'blobs_offset' : None,
             'centroids' : None,
             'boundaries' : None,
         }
         self.previous_depth = None
         self.previous_image = None
+        self.capture_thread = None
+        self.depth_statistic = depth_statistic
+        self.timings = StageTimings()
+        self.centroids_grid.timings = self.timings
+        self.boundaries_grid.timings = self.timings
+        self.set_blob_backend(blob_backend, **(blob_backend_kwargs or {}))
+        self.point_cloud = None
+        self.roi = None
+        if roi_mask is not None or roi_polygon is not None:
+            self.set_roi(mask=roi_mask, polygon=roi_polygon)
 
     @classmethod
     def detect_kinects(cls):
@@ -183,32 +184,114 @@ class Detector(object):
                 found = False
         return kinects
 
+    def set_blob_backend(self, name, **kwargs):
+        '''
+        Choose the backend used to find blobs.
+
+        Inputs:
+
+            name - A string with the name of the backend: 'simplecv',
+                'ndimage' or 'pyramid', which finds blobs on a downsampled
+                image.
+
+            kwargs - Keyword arguments for the backend's constructor, e.g.
+                factor and refine for 'pyramid'.
+        '''
+
+        self.blob_backend_name = name
+        self.blob_backend = BLOB_BACKENDS[name](**kwargs)
+
+    def set_roi(self, mask=None, polygon=None):
+        '''
+        Restrict detection to a region of interest.
+
+        Frames are cropped to the bounding box of the region before
+        segmentation, blob finding and depth statistics, and the pixels of
+        the box outside the region are ignored. Centroids and boundaries
+        are still given in frame coordinates, but blobs, blob sources and
+        motion images are relative to the bounding box, which starts at
+        roi.offset. The results carry that offset as 'blobs_offset'.
+
+        Inputs:
+
+            mask - A boolean array indexed [x, y] with the frame's size,
+                True inside the region.
+
+            polygon - A sequence of (x, y) vertices with the outline of the
+                region.
+
+            Without a mask or a polygon the whole frame is used again.
+        '''
+
+        if mask is None and polygon is None:
+            self.roi = None
+        else:
+            self.roi = RegionOfInterest(self.frame_size, mask=mask,
+                                        polygon=polygon)
+        # the models have learned frames of the previous size
+        self.segmentation_model_depth = scv.RunningSegmentation()
+        self.segmentation_model_image = scv.RunningSegmentation()
+
+    def enable_timings(self, enabled=True):
+        '''
+        Turn the timing of the capture and detection stages on or off.
+        '''
+
+        self.timings.enabled = enabled
+        if not enabled:
+            self.timings.reset()
+
+    def timing_summary(self):
+        '''
+        Return the percentiles of each stage's duration, as returned by
+        instrumentation.StageTimings.summary().
+        '''
+
+        return self.timings.summary()
+
     def _add_grids_to_image_pipeline(self):
-        c_xy_im = self.centroids_grid.get_image(grid_type='xy')
-        c_xz_im = self.centroids_grid.get_image(grid_type='xz')
-        b_xy_im = self.boundaries_grid.get_image(grid_type='xy')
-        b_xz_im = self.boundaries_grid.get_image(grid_type='xz')
-        self.image_pipeline['centroids_grid_xy'] = c_xy_im
-        self.image_pipeline['centroids_grid_xz'] = c_xz_im
-        self.image_pipeline['boundaries_grid_xy'] = b_xy_im
-        self.image_pipeline['boundaries_grid_xz'] = b_xz_im
+        '''
+        Add the grid images to the image pipeline.
+
+        They are only rendered when they are first read, from the cells of
+        this frame, so results kept past the next call to detect() still
+        show their own frame.
+        '''
+
+        c_get = self.centroids_grid.get_image
+        b_get = self.boundaries_grid.get_image
+        c_cells = self.centroids_grid.cells
+        b_cells = self.boundaries_grid.cells
+        self.image_pipeline['centroids_grid_xy'] = LazyValue(c_get, 'xy',
+                                                             c_cells)
+        self.image_pipeline['centroids_grid_xz'] = LazyValue(c_get, 'xz',
+                                                             c_cells)
+        self.image_pipeline['boundaries_grid_xy'] = LazyValue(b_get, 'xy',
+                                                              b_cells)
+        self.image_pipeline['boundaries_grid_xz'] = LazyValue(b_get, 'xz',
+                                                              b_cells)
 
     def _clear_pipeline(self):
-        for k, v in self.image_pipeline.iteritems():
+        for k in list(self.image_pipeline.keys()):
             if k != 'frame':
                 self.image_pipeline[k] = None
 
     def _clear_detected(self):
-        for k, v in self.detected.iteritems():
+        for k in self.detected:
             self.detected[k] = None
 
     def _detect_with_depth(self, centroids, boundaries):
-        d = self.image_pipeline['depth']
+        if self.metric_depth:
+            d = self.image_pipeline['depth_foreground']
+        else:
+            d = self.image_pipeline['depth']
         detected = self._single_image_detection(image=d,
                                                 blobs_area_filter=1500,
+                                                blobs_invert_image=\
+                                                    not self.metric_depth,
                                                 get_centroids=centroids,
                                                 get_boundaries=boundaries)
-        blob_image, centroids, boundaries = detected
+        blob_image, blobs, centroids, boundaries = detected
         self.image_pipeline['depth_blob_source'] = blob_image
         self.detected['depth_blobs'] = blobs
         self.detected['centroids'] = centroids
@@ -227,10 +310,16 @@ class Detector(object):
         self.detected['boundaries'] = boundaries
 
     def _detect_with_motion_depth(self, centroids, boundaries):
+        if self.metric_depth:
+            # only frames detected with motion are learned with metric depth
+            foreground = self.image_pipeline['depth_foreground']
+            self.segmentation_model_depth.addImage(
+                self._segmentation_input(scv.Image(foreground)))
         diff = self.segmentation_model_depth.getSegmentedImage(whiteFG=False)
         detected = self._single_image_detection(image=diff,
                                                 blobs_area_filter=1500,
                                                 blobs_invert_image=False,
+                                                cropped=True,
                                                 get_centroids=centroids,
                                                 get_boundaries=boundaries)
         blob_image, blobs, centroids, boundaries = detected
@@ -245,6 +334,7 @@ class Detector(object):
         detected = self._single_image_detection(image=diff,
                                                 blobs_area_filter=1500,
                                                 blobs_invert_image=False,
+                                                cropped=True,
                                                 get_centroids=centroids,
                                                 get_boundaries=boundaries)
         blob_image, blobs, centroids, boundaries = detected
@@ -266,114 +356,233 @@ class Detector(object):
 
     def _single_image_detection(self, image, blobs_area_filter=1500,
                                 blobs_invert_image=True, get_centroids=True,
-                                get_boundaries=False):
+                                get_boundaries=False, cropped=False):
+        '''
+        Inputs:
+
+            cropped - A boolean indicating if image has already been cropped
+                to the region of interest's bounding box, like the motion
+                images are. Ignored without a region of interest.
+        '''
+
+        depth = self.image_pipeline['depth']
+        offset = (0, 0)
+        if self.roi is not None:
+            image, depth = self._apply_roi(image, depth, blobs_invert_image,
+                                           cropped)
+            offset = self.roi.offset
         blobs, blob_image = self._get_blobs(image, min_area=blobs_area_filter,
                                             invert_image=blobs_invert_image)
+        self.detected['blobs'] = blobs
+        self.detected['blobs_offset'] = offset
         centroids = None
         boundaries = None
         if blobs is not None:
             if get_centroids:
-                centroids = self._get_centroids(blobs)
+                centroids = self._get_centroids(blobs, depth, offset)
                 self.detected['centroids'] = centroids
             if get_boundaries:
-                boundaries = self._get_boundaries(blobs)
+                boundaries = self._get_boundaries(blobs, offset=offset)
                 self.detected['boundaries'] = boundaries
         return blob_image, blobs, centroids, boundaries
 
-    def _get_blobs(self, image, min_area=0, invert_image=True):
-        if invert_image:
-            im = image.invert()
-        else:
-            im = image
-        morphed = im.dilate(5)
-        blobs = morphed.findBlobs()
-        big_blobs = None
-        if blobs is not None:
-            big_blobs = blobs.filter(blobs.area() > min_area)
-        return big_blobs, morphed
+    def _apply_roi(self, image, depth, invert_image, cropped):
+        '''
+        Return the image and depth cropped to the region of interest, with
+        the pixels outside the region set to the background: far (255) for
+        images that get inverted, where near is dark, and 0 otherwise. The
+        depth outside the region is marked as invalid.
+        '''
+
+        roi = self.roi
+        gray = as_gray_array(image)
+        if not cropped:
+            gray = roi.crop(gray)
+        gray = roi.apply(gray, fill=255 if invert_image else 0)
+        if depth is not None:
+            depth = roi.prepare(as_gray_array(depth),
+                                fill=self.invalid_depth_values[0])
+        return gray, depth
 
-    def _get_centroids(self, blobs, depth=None):
+    def _get_blobs(self, image, min_area=0, invert_image=True):
+        with self.timings.stage('blobs'):
+            if self.blob_backend_name == 'simplecv' and \
+                    isinstance(image, np.ndarray):
+                image = scv.Image(image)
+            blobs, morphed = self.blob_backend.find_blobs(
+                image, min_area=min_area, invert_image=invert_image)
+            if isinstance(morphed, np.ndarray):
+                morphed = LazyValue(scv.Image, morphed)
+        return blobs, morphed
+
+    def _get_centroids(self, blobs, depth=None, offset=(0, 0)):
         '''
         Inputs:
 
-            blobs -
-            depth - A SimpleCV.Image with the depth measured by the kinect
-            sensor or None. If None (the default) the returned centroids will
-            have their y (depth) coordinateset to zero.
+            blobs - The blobs found by the blob backend.
+            depth - A SimpleCV.Image or array with the depth measured by the
+            kinect sensor or None. If None (the default) the returned
+            centroids will have their y (depth) coordinate set to zero.
+            offset - The (x, z) position of the blobs' image in the frame.
+
+        Returns: A list of (x, z, y) tuples or None if there are no
+            centroids. With depth, the y coordinate is the depth statistic
+            of the blob's valid pixels and blobs without any valid pixel are
+            left out.
         '''
 
-        centroids = []
-        for b in blobs:
-            c = self._get_kinect_coords(depth, b)
-            if c is not None:
-                centroids.append(c)
-        if len(centroids) == 0:
-            centroids = None
+        with self.timings.stage('centroids'):
+            centroids = []
+            ox, oz = offset
+            if depth is None:
+                for b in blobs:
+                    x, z = b.centroid()
+                    centroids.append((x + ox, z + oz, 0))
+            else:
+                depth = as_gray_array(depth)
+                statistic = self.depth_statistic
+                if statistic == 'median':
+                    statistic = 50.0
+                percentiles = ()
+                if statistic != 'mean':
+                    statistic = float(statistic)
+                    percentiles = (statistic,)
+                labels, label_ids = blob_labels(blobs, depth.shape)
+                stats = blob_depth_statistics(
+                    labels, depth, label_ids, percentiles=percentiles,
+                    invalid_values=self.invalid_depth_values)
+                for b, count, value in zip(blobs, stats['count'],
+                                           stats[statistic]):
+                    if count > 0:
+                        x, z = b.centroid()
+                        centroids.append((int(x) + ox, int(z) + oz,
+                                          int(value)))
+            if len(centroids) == 0:
+                centroids = None
         return centroids
 
-    def _get_kinect_coords(self, depth, blob):
-        point = None
-        x, z = blob.centroid()
-        if depth is not None:
-            old_image = blob.image
-            blob.image = depth
-            cropped = blob.crop()
-            counts = self._count_pixels(cropped, remove_values=[255])
-            if len(counts) > 0:
-                avg_intensity = np.average(counts[:, 0], weights=counts[:, 1])
-                point = int(x), int(z), int(avg_intensity)
-            blob.image = old_image
-        else:
-            point = x, z, 0
-        return point
-
     def _get_point_depth(self, x, z):
-        x = np.round(x)
-        z = np.round(z)
+        depth = self.image_pipeline['depth']
+        if depth is None:
+            return 0
+        width, height = self.frame_size
+        x = min(max(int(round(x)), 0), width - 1)
+        z = min(max(int(round(z)), 0), height - 1)
         try:
-            depth = self.image_pipeline['depth'][x, z]
-        except TypeError:
-            depth = 0
-        return depth
-
-    def _count_pixels(self, image, only_useful=True, remove_values=[]):
-        im = image.getNumpy()
-        hist, bins = np.histogram(im, bins=range(256))
-        b = list(bins)
-        b.pop(0)
-        counts = zip(b, hist)
-        counts.sort(key=lambda item:item[1], reverse=True)
-        if only_useful:
-            counts = [c for c in counts if c[1] > 0]
-        result = np.asarray([c for c in counts if c[0] not in remove_values])
-        return result
-
-    def _get_boundaries(self, blobs, simplify=0.5):
-        boundaries = []
-        for b in blobs:
-            pol = Polygon(b.contour())
-            s = pol.simplify(tolerance=simplify, preserve_topology=False)
-            if s.type == 'Polygon' and s.exterior is not None:
-                boundary = []
-                for pt in s.exterior.coords:
-                    x, z = pt
-                    y = self._get_point_depth(x, z)
-                    boundary.append((x, z, y))
-                boundaries.append(boundary)
+            return depth[x, z]
+        except (TypeError, IndexError):
+            return 0
+
+    def _get_boundaries(self, blobs, simplify=0.5, offset=(0, 0)):
+        with self.timings.stage('boundaries'):
+            ox, oz = offset
+            boundaries = []
+            for b in blobs:
+                pol = Polygon([(x + ox, z + oz) for x, z in b.contour()])
+                s = pol.simplify(tolerance=simplify, preserve_topology=False)
+                if s.type == 'Polygon' and s.exterior is not None:
+                    boundary = []
+                    for pt in s.exterior.coords:
+                        x, z = pt
+                        y = self._get_point_depth(x, z)
+                        boundary.append((x, z, y))
+                    boundaries.append(boundary)
         return boundaries
 
+    def _get_depth_frame(self):
+        if self.metric_depth:
+            return self.kinect.getMetricDepthArray()
+        return self.kinect.getDepth()
+
+    def _segmentation_input(self, frame):
+        if self.roi is None:
+            return frame
+        return self.roi.crop_image(frame)
+
+    def start_capture(self, depth=False, image=False):
+        '''
+        Start grabbing frames from the kinect on a background thread.
+
+        While the thread runs, capture() takes the newest frame that the
+        thread has grabbed instead of reading from the device.
+        '''
+
+        self.stop_capture()
+        self.capture_thread = CaptureThread(self.kinect, depth=depth,
+                                            image=image,
+                                            metric=self.metric_depth)
+        self.capture_thread.start()
+
+    def stop_capture(self):
+        if self.capture_thread is not None:
+            self.capture_thread.stop()
+            self.capture_thread = None
+
+    def capture_stats(self):
+        '''
+        Return the CaptureStats of the background capture thread or None.
+        '''
+
+        if self.capture_thread is None:
+            return None
+        return self.capture_thread.slot.stats
+
     def capture(self, depth=False, image=False):
+        '''
+        Capture a new frame.
+
+        If a background capture thread is running this does not block: it
+        takes the newest frame grabbed by the thread, for the streams the
+        thread was started with.
+
+        Returns: True if a new frame was captured, False otherwise. When
+            False the previous frame is kept in the image pipeline.
+        '''
+
+        with self.timings.stage('capture'):
+            return self._capture(depth, image)
+
+    def _capture(self, depth, image):
+        if self.capture_thread is not None:
+            taken = self.capture_thread.slot.take()
+            if taken is None:
+                return False
+            frame, capturetime, sequence = taken
+            depth_frame = frame['depth']
+            image_frame = frame['image']
+        elif depth or image:
+            depth_frame = None
+            if depth:
+                depth_frame = self._get_depth_frame()
+            image_frame = self.kinect.getImage() if image else None
+            capturetime = getattr(self.kinect, 'capturetime', time.time())
+        else:
+            return False
         self.previous_depth = self.image_pipeline['depth']
         self.previous_image = self.image_pipeline['image']
         self._clear_pipeline()
-        if depth or image:
-            self.image_pipeline['frame'] += 1
-            if depth:
-                self.image_pipeline['depth'] = self.kinect.getDepth()
-                self.segmentation_model_depth.addImage(self.image_pipeline['depth'])
-            if image:
-                self.image_pipeline['image'] = self.kinect.getImage()
-                self.segmentation_model_image.addImage(self.image_pipeline['image'])
+        self.image_pipeline['frame'] += 1
+        self.image_pipeline['capturetime'] = capturetime
+        if depth_frame is not None:
+            self.image_pipeline['depth'] = depth_frame
+            if self.metric_depth:
+                self.image_pipeline['depth_foreground'] = \
+                        self.depth_background.apply(depth_frame)
+            else:
+                self.segmentation_model_depth.addImage(
+                    self._segmentation_input(depth_frame))
+        if image_frame is not None:
+            self.image_pipeline['image'] = image_frame
+            self.segmentation_model_image.addImage(
+                self._segmentation_input(image_frame))
+        return True
+
+    def latest_capturetime(self):
+        '''
+        Return the capturetime of the frame in the image pipeline or None.
+        '''
+
+        return self.image_pipeline['capturetime']
 
     def detect(self, mode='depth', centroids=True, boundaries=False):
         '''
@@ -396,6 +605,10 @@ class Detector(object):
                 calculated
         '''
 
+        with self.timings.stage('detect'):
+            self._detect(mode, centroids, boundaries)
+
+    def _detect(self, mode, centroids, boundaries):
         self._clear_detected()
         if mode == 'depth':
             self._detect_with_depth(centroids=centroids, boundaries=boundaries)
@@ -418,7 +631,7 @@ class Detector(object):
         if centroids:
             centroids_to_update = self.detected['centroids']
         if boundaries:
-            for boundary in self.detected['boundaries']:
+            for boundary in self.detected['boundaries'] or []:
                 for pt in boundary:
                     boundaries_to_update.append(pt)
         self.centroids_grid.update_grid(centroids_to_update)
@@ -426,13 +639,78 @@ class Detector(object):
         self._add_grids_to_image_pipeline()
 
     def get_results(self):
-        results = dict()
+        '''
+        Return a LazyPipeline with the image pipeline and the detected
+        features. Images that are costly to produce are only computed when
+        they are read.
+        '''
+
+        results = LazyPipeline()
         results.update(self.image_pipeline)
         results.update(self.detected)
         results.update({'centroids_grid' : self.centroids_grid,
                         'boundaries_grid' : self.boundaries_grid})
         return results
 
+    def get_point_cloud(self, blobs=False):
+        '''
+        Project the current metric depth frame into a point cloud, see
+        pointcloud.PointCloud.
+
+        Inputs:
+
+            blobs - A boolean indicating if only the pixels of the blobs
+                found by the last depth detection are projected.
+
+        Returns: An (N, 3) float32 array with the points, in metres, or
+            None without a depth frame. It is overwritten by the next
+            call.
+        '''
+
+        if not self.metric_depth:
+            raise ValueError('Point clouds need a Detector with '
+                             'metric_depth')
+        depth = self.image_pipeline['depth']
+        if depth is None:
+            return None
+        if self.point_cloud is None:
+            self.point_cloud = PointCloud(self.frame_size,
+                                          device_number=self.device_number)
+        if not blobs:
+            return self.point_cloud.from_depth(
+                depth, min_distance=self.min_distance_mm / 1000.0,
+                max_distance=self.max_distance_mm / 1000.0)
+        found = self.detected.get('depth_blobs')
+        origin = (0, 0)
+        shape = self.frame_size
+        if self.roi is not None:
+            origin = self.roi.offset
+            shape = self.roi.size
+        if found is None:
+            mask = np.zeros(shape, dtype=bool)
+        else:
+            labels, label_ids = blob_labels(found, shape)
+            mask = np.isin(labels, label_ids)
+        return self.point_cloud.from_mask(depth, mask, origin)
+
+    def send_osc_messages(self, osc_communicator, actors=None,
+                          timings=False):
+        '''
+        Send the current frame's centroids and boundaries, and the actors if
+        given, bundled by frame and tagged with the frame's capturetime.
+        With timings, the percentiles of each stage's duration are sent
+        too.
+        '''
+
+        results = {
+            'capturetime' : self.image_pipeline['capturetime'],
+            'centroids' : self.detected['centroids'],
+            'boundaries' : self.detected['boundaries'],
+        }
+        if timings:
+            results['timings'] = self.timing_summary()
+        return osc_communicator.send_results(results, actors=actors)
+
     def send_centroid_grid_coordinates(self, osc_client,
                                        message_name='/topview/centroids/xyz'):
         grid_points = self.centroids_grid.get_points()
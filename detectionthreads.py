@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Detection of the kinects on worker threads.
+
+Each kinect gets a DetectionWorker that lives on its own QThread. A timer of
+that thread runs the device's capture, detection and OSC output, scheduled
+by the worker's own FrameScheduler, and prepares a snapshot for display: a
+QImage of the base image with the overlays already drawn. Only the newest
+snapshot is kept and the GUI is told about it with a queued signal, so a GUI
+that is busy, e.g. while the window is moved, makes the worker drop
+snapshots instead of stalling detection.
+
+The centroids of all the devices are merged into the world by a
+FusionWorker, on another thread, after the devices deliver them.
+'''
+
+import timeit
+import threading
+import traceback
+from detection import ROI_IMAGES, capture_streams
+from osccommunicator import OSCCommunicator
+from PyQt4.QtCore import QObject, QThread, QTimer, SIGNAL, pyqtSlot
+from PyQt4.QtGui import QPainter
+from scheduler import FrameScheduler
+from display import FrameDisplay
+from overlays import OverlayRenderer
+
+# the methods of a detector that a DetectionWorker uses
+DETECTOR_METHODS = ('start_capture', 'stop_capture', 'capture', 'detect',
+                    'get_results')
+
+
+def supports_detection(detector):
+    '''
+    Return True if a detector, like a detection.Detector or a
+    workers.ProcessDetector, has everything a DetectionWorker uses.
+    '''
+
+    return all(hasattr(detector, name) for name in DETECTOR_METHODS)
+
+
+class ThreadedWorker(QObject):
+    '''
+    A QObject that lives on its own QThread and calls step() from a timer of
+    that thread. step() returns the number of seconds to wait before it is
+    called again, or None to wait until the timer is started again.
+
+    Exceptions raised by step() are printed and counted in `errors`, and
+    step() is called again after error_delay seconds, so that a failing
+    frame doesn't stop the worker for good.
+    '''
+
+    def __init__(self, error_delay=0.1):
+        super(ThreadedWorker, self).__init__()
+        self.error_delay = error_delay
+        self.errors = 0
+        self.timer = None
+        self.worker_thread = QThread()
+        self.moveToThread(self.worker_thread)
+        self.connect(self.worker_thread, SIGNAL('started()'),
+                     self._start_timer)
+
+    def start(self):
+        self.worker_thread.start()
+
+    def stop(self):
+        '''
+        Stop the worker's thread and wait for the current step to end.
+        '''
+
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+
+    @pyqtSlot()
+    def _start_timer(self):
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.connect(self.timer, SIGNAL('timeout()'), self._run_step)
+        self.timer.start(0)
+
+    @pyqtSlot()
+    def _run_step(self):
+        interval = self.error_delay
+        try:
+            interval = self.step()
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+        finally:
+            if interval is not None:
+                self.timer.start(int(round(interval * 1000)))
+
+    def step(self):
+        '''
+        Do the worker's work, which subclasses override.
+
+        Returns: The number of seconds to wait before the next step, or
+            None to wait until the timer is started again.
+        '''
+
+        return None
+
+
+class DetectionWorker(ThreadedWorker):
+    '''
+    Captures, detects and sends the OSC messages of a kinect on its own
+    thread.
+
+    Emits snapshotReady(int), with the worker's index, when a new snapshot
+    can be read with take_snapshot().
+
+    Detectors without the DETECTOR_METHODS, like the GUI's placeholder
+    tabs, are not supported and their workers are never started.
+    '''
+
+    def __init__(self, index, settings, world=None, world_lock=None,
+                 fusion_worker=None, show_timings=False, send_timings=False,
+                 target_fps=30, max_latency=0.1):
+        '''
+        Inputs:
+
+            index - The index of the device in the GUI.
+
+            settings - The device's settings dictionary of
+                multiplekinects.MultipleKinectsDlg, with its 'detector'.
+                The GUI changes its entries and the worker reads them before
+                each frame.
+
+            world - A fusion.Fusion where the device's centroids are added,
+                or None.
+
+            world_lock - The threading.Lock that protects the world.
+
+            fusion_worker - The FusionWorker that updates the world, told
+                about each frame added to it.
+
+            show_timings - A boolean indicating if the snapshots have the
+                timing summary of the detector.
+
+            send_timings - A boolean indicating if the timings are sent with
+                the OSC messages.
+
+            target_fps, max_latency - See scheduler.FrameScheduler.
+        '''
+
+        super(DetectionWorker, self).__init__()
+        self.index = index
+        self.settings = settings
+        self.detector = settings['detector']
+        self.supported = supports_detection(self.detector)
+        self.world = world
+        self.world_lock = world_lock
+        self.fusion_worker = fusion_worker
+        self.show_timings = show_timings
+        self.send_timings = send_timings
+        self.scheduler = FrameScheduler(target_fps=target_fps,
+                                        max_latency=max_latency)
+        self.visible = False
+        self.capturing = None
+        self.frame_display = FrameDisplay()
+        self.overlays = OverlayRenderer()
+        self.painter = QPainter()
+        self.lock = threading.Lock()
+        self._snapshot = None
+        self._osc_client = None
+
+    def start(self):
+        '''
+        Start the worker's thread, if its detector is supported.
+        '''
+
+        if self.supported:
+            super(DetectionWorker, self).start()
+
+    def stop(self):
+        super(DetectionWorker, self).stop()
+        self._toggle_capture(False)
+
+    def step(self):
+        '''
+        Process the newest frame of the device.
+
+        Returns: The number of seconds to wait before the next frame.
+        '''
+
+        self.scheduler.start_round()
+        self._update_osc_client()
+        self._toggle_capture(self.settings['status'])
+        if self.capturing is not None:
+            self._process()
+        return self.scheduler.next_interval()
+
+    def set_osc_client(self, client_ip, client_port):
+        '''
+        Send the device's OSC messages to another client.
+
+        The worker replaces its OSCCommunicator before its next frame, so it
+        is never closed while it is sending and the old one releases its
+        server port before the new one binds it.
+        '''
+
+        with self.lock:
+            self._osc_client = (client_ip, client_port)
+
+    def _update_osc_client(self):
+        with self.lock:
+            client, self._osc_client = self._osc_client, None
+        if client is None:
+            return
+        client_ip, client_port = client
+        self.settings['osc_communicator'].close()
+        self.settings['osc_communicator'] = OSCCommunicator(
+            client_ip=client_ip, client_port=client_port)
+
+    def _streams(self):
+        # the world is built from the depth
+        return capture_streams(self.settings['detection_method'],
+                               depth=self.world is not None)
+
+    def _toggle_capture(self, status):
+        '''
+        Start or stop the background capture thread of the kinect, so that
+        step() never waits for the device. The thread is restarted when
+        the detection method needs other streams.
+        '''
+
+        if status:
+            streams = self._streams()
+            if streams != self.capturing:
+                self.detector.start_capture(**streams)
+                self.capturing = streams
+        elif self.capturing is not None:
+            self.detector.stop_capture()
+            self.capturing = None
+
+    def _process(self):
+        settings = self.settings
+        kinect = self.detector
+        new_frame = kinect.capture(**self.capturing)
+        if not new_frame:
+            return
+        capturetime = None
+        if hasattr(kinect, 'latest_capturetime'):
+            capturetime = kinect.latest_capturetime()
+        if self.scheduler.is_stale(self.index, capturetime):
+            return
+        self.scheduler.started(self.index)
+        base_image = str(settings['base_image'])
+        process_centroids = self.world is not None
+        process_boundaries = False
+        if settings['overlay_centroids'] or base_image in \
+                ('centroids_grid_xy', 'centroids_grid_xz'):
+            process_centroids = True
+        if settings['overlay_boundaries'] or base_image in \
+                ('boundaries_grid_xy', 'boundaries_grid_xz'):
+            process_boundaries = True
+        kinect.detect(mode=settings['detection_method'],
+                      centroids=process_centroids,
+                      boundaries=process_boundaries)
+        results = kinect.get_results()
+        if self.world is not None:
+            points = None
+            if self.world.point_clouds and \
+                    getattr(kinect, 'metric_depth', False):
+                points = kinect.get_point_cloud(blobs=True)
+            with self.world_lock:
+                self.world.add_centroids(kinect.device_number,
+                                         results['centroids'],
+                                         results['capturetime'])
+                if points is not None:
+                    self.world.add_points(kinect.device_number, points,
+                                          results['capturetime'])
+            if self.fusion_worker is not None:
+                self.fusion_worker.delivered()
+        if settings['send_osc']:
+            kinect.send_osc_messages(settings['osc_communicator'],
+                                     timings=self.send_timings)
+        if self.visible:
+            self._publish(self._make_snapshot(results, base_image))
+        self.scheduler.finished(self.index, capturetime,
+                                self._frames_dropped())
+
+    def _frames_dropped(self):
+        '''
+        Return the number of frames the detector's source dropped before
+        they were processed, or None if it doesn't count them.
+        '''
+
+        if hasattr(self.detector, 'capture_stats'):
+            stats = self.detector.capture_stats()
+            if stats is not None:
+                return stats.frames_dropped
+        return getattr(self.detector, 'frames_dropped', None)
+
+    def _make_snapshot(self, results, base_image):
+        '''
+        Return a dictionary with everything the GUI paints for a frame.
+        '''
+
+        image = results[base_image]
+        if image is None:
+            return None
+        # the display buffers are reused, so the snapshot gets its own copy
+        qimage = self.frame_display.to_qimage(
+            image, colorize=base_image == 'depth').copy()
+        origin = (0, 0)
+        if base_image in ROI_IMAGES:
+            origin = results.get('blobs_offset') or (0, 0)
+        self.painter.begin(qimage)
+        self.overlays.draw(
+            self.painter, results, blobs=self.settings['overlay_blobs'],
+            centroids=self.settings['overlay_centroids'],
+            boundaries=self.settings['overlay_boundaries'], origin=origin)
+        self.painter.end()
+        snapshot = {
+            'index' : self.index,
+            'image' : qimage,
+            'frame' : results['frame'],
+            'capturetime' : results['capturetime'],
+            'timings' : None,
+            'schedule' : None,
+        }
+        if self.show_timings:
+            snapshot['timings'] = self.detector.timing_summary()
+            snapshot['schedule'] = self.report()
+        return snapshot
+
+    def _publish(self, snapshot):
+        if snapshot is None:
+            return
+        with self.lock:
+            pending = self._snapshot is not None
+            self._snapshot = snapshot
+        # the GUI has not taken the previous snapshot yet and will get this
+        # one instead
+        if not pending:
+            self.emit(SIGNAL('snapshotReady(int)'), self.index)
+
+    def take_snapshot(self):
+        '''
+        Return the newest snapshot, or None if it has already been taken.
+        '''
+
+        with self.lock:
+            snapshot, self._snapshot = self._snapshot, None
+        return snapshot
+
+    def report(self):
+        '''
+        Return the achieved fps, latencies and skipped frames of the device,
+        see scheduler.DeviceSchedule.as_dict().
+        '''
+
+        return self.scheduler.device(self.index).as_dict()
+
+
+class FusionWorker(ThreadedWorker):
+    '''
+    Merges the centroids that the DetectionWorkers add to the world and
+    sends the world's OSC messages, on its own thread.
+
+    The world is updated after the devices deliver frames, see delivered(),
+    at most once per period, so frames that several devices deliver close
+    together are merged by the same update.
+    '''
+
+    def __init__(self, world, world_lock, world_osc=None, target_fps=30):
+        '''
+        Inputs:
+
+            world - A fusion.Fusion.
+
+            world_lock - The threading.Lock that protects the world.
+
+            world_osc - The OSCCommunicator where the world's centroids and
+                actors are sent, or None.
+
+            target_fps - The highest rate at which the world is updated.
+        '''
+
+        super(FusionWorker, self).__init__()
+        self.world = world
+        self.world_lock = world_lock
+        self.world_osc = world_osc
+        self.period = 1.0 / target_fps
+        self._last_update = None
+        self.connect(self, SIGNAL('delivered()'), self._schedule)
+
+    def delivered(self):
+        '''
+        Tell the worker that a device has added a frame to the world. Can
+        be called from any thread.
+        '''
+
+        self.emit(SIGNAL('delivered()'))
+
+    @pyqtSlot()
+    def _schedule(self):
+        if self.timer is None or self.timer.isActive():
+            return
+        wait = 0
+        if self._last_update is not None:
+            wait = max(self._last_update + self.period -
+                       timeit.default_timer(), 0)
+        self.timer.start(int(round(wait * 1000)))
+
+    def step(self):
+        self._last_update = timeit.default_timer()
+        with self.world_lock:
+            if self.world.update() is not None and \
+                    self.world_osc is not None:
+                self.world.send_osc_messages(self.world_osc)
+        return None
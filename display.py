@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Conversion of the pipeline's images for display in Qt.
+
+A FrameDisplay writes each frame into a reused, contiguous numpy buffer of
+32 bit pixels with a single pass: grayscale and depth images go through a
+colour lookup table and RGB images are copied into the colour bytes. The QImage it
+returns wraps that buffer without copying it, so the only other copy is the
+upload done by QPixmap.fromImage().
+
+Images are SimpleCV.Images or numpy arrays indexed [x, y].
+'''
+
+import sys
+import numpy as np
+from framepool import DepthConverter, FramePool
+
+try:
+    from PyQt4.QtGui import QImage
+except ImportError:
+    QImage = None
+
+# the bytes of the red, green and blue channels in a Format_RGB32 pixel
+if sys.byteorder == 'little':
+    RGB32_CHANNELS = [2, 1, 0]
+else:
+    RGB32_CHANNELS = [1, 2, 3]
+
+# colour maps as (position, (r, g, b)) control points
+COLORMAPS = {
+    'gray' : [(0.0, (0, 0, 0)), (1.0, (255, 255, 255))],
+    'jet' : [(0.0, (0, 0, 128)), (0.125, (0, 0, 255)), (0.375, (0, 255, 255)),
+             (0.625, (255, 255, 0)), (0.875, (255, 0, 0)),
+             (1.0, (128, 0, 0))],
+}
+
+
+def pack_rgb32(red, green, blue):
+    '''
+    Return uint32 pixels in QImage.Format_RGB32, 0xffRRGGBB.
+    '''
+
+    red = np.asarray(red, dtype=np.uint32)
+    green = np.asarray(green, dtype=np.uint32)
+    blue = np.asarray(blue, dtype=np.uint32)
+    return (0xff000000 | (red << 16) | (green << 8) | blue).astype(np.uint32)
+
+
+def colormap_lut(name='jet', size=256, reverse=False, invalid=(),
+                 invalid_color=(0, 0, 0)):
+    '''
+    Return a lookup table with the Format_RGB32 colour of each value.
+
+    Inputs:
+
+        name - The name of the colour map, one of the keys of COLORMAPS.
+
+        size - The number of values in the table.
+
+        reverse - A boolean indicating if the map is reversed, e.g. to show
+            near depth values, which are low, with the map's last colours.
+
+        invalid - Values shown with invalid_color instead, like the depth
+            values without a reading.
+    '''
+
+    positions, colors = zip(*COLORMAPS[name])
+    colors = np.array(colors, dtype=np.float64)
+    values = np.linspace(0.0, 1.0, size)
+    if reverse:
+        values = values[::-1]
+    channels = [np.rint(np.interp(values, positions, colors[:, c])) for c \
+                in range(3)]
+    lut = pack_rgb32(*channels)
+    for value in invalid:
+        if 0 <= value < size:
+            lut[value] = pack_rgb32(*invalid_color)
+    return lut
+
+
+class FrameDisplay(object):
+    '''
+    Turns the pipeline's images into QImages that share reused buffers.
+
+    Buffers are allocated for each size of image the first time it is seen
+    and recycled every `pool_size` frames, so a returned QImage must be
+    converted to a QPixmap, or copied, before then.
+    '''
+
+    def __init__(self, gray_lut=None, depth_lut=None, metric_lut=None,
+                 pool_size=2):
+        '''
+        Inputs:
+
+            gray_lut - The lookup table of 8 bit grayscale images. Gray by
+                default.
+
+            depth_lut - The lookup table of 8 bit depth images, where 255
+                means no reading. A reversed jet map by default.
+
+            metric_lut - The lookup table of depth in millimetres, as
+                returned by a Detector with metric_depth. Values beyond the
+                table get its last colour. A reversed jet map up to 10
+                metres by default.
+
+            pool_size - The number of buffers of each kind.
+        '''
+
+        if gray_lut is None:
+            gray_lut = colormap_lut('gray')
+        if depth_lut is None:
+            depth_lut = colormap_lut('jet', reverse=True, invalid=(255,))
+        if metric_lut is None:
+            metric_lut = colormap_lut('jet', size=10001, reverse=True,
+                                      invalid=(0,))
+        self.luts = {
+            'gray' : gray_lut,
+            'depth' : depth_lut,
+            'metric' : metric_lut,
+        }
+        self.pool_size = pool_size
+        self.converters = dict()
+        self.rgb_pools = dict()
+
+    def _converter(self, kind, shape):
+        key = (kind, shape)
+        converter = self.converters.get(key)
+        if converter is None:
+            converter = self.converters[key] = DepthConverter(
+                self.luts[kind], shape, self.pool_size)
+        return converter
+
+    def _rgb_pool(self, shape):
+        pool = self.rgb_pools.get(shape)
+        if pool is None:
+            pool = self.rgb_pools[shape] = FramePool(shape + (4,), np.uint8,
+                                                     self.pool_size)
+            # the alpha bytes are never written again
+            for buffer in pool.buffers:
+                buffer.fill(255)
+        return pool
+
+    def to_array(self, image, colorize=False):
+        '''
+        Write an image into the next display buffer.
+
+        Inputs:
+
+            image - A SimpleCV.Image or a numpy array indexed [x, y]: 8 bit
+                grayscale, uint16 depth in millimetres or RGB.
+
+            colorize - A boolean indicating if an 8 bit image is a depth
+                image, shown through the depth lookup table.
+
+        Returns: A contiguous (height, width) uint32 array with Format_RGB32
+            pixels.
+        '''
+
+        if hasattr(image, 'getNumpy'):
+            array = image.getNumpy()
+            if colorize:
+                # a gray SimpleCV image has the same value in all channels
+                array = array[:, :, 0]
+        else:
+            array = np.asarray(image)
+        # buffers are (height, width), the layout QImage expects
+        if array.ndim == 3:
+            rgb = array.transpose(1, 0, 2)
+            out = self._rgb_pool(rgb.shape[:2]).next_buffer()
+            out[..., RGB32_CHANNELS] = rgb
+            return out.view(np.uint32)[..., 0]
+        if array.dtype == np.uint16:
+            kind = 'metric'
+        elif colorize:
+            kind = 'depth'
+        else:
+            kind = 'gray'
+        return self._converter(kind, array.T.shape).convert(array.T)
+
+    def to_qimage(self, image, colorize=False):
+        '''
+        Return a QImage that wraps the display buffer of an image, see
+        to_array(). The buffer is kept as the QImage's `array` attribute.
+        '''
+
+        array = self.to_array(image, colorize)
+        height, width = array.shape
+        qimage = QImage(array.data, width, height, array.strides[0],
+                        QImage.Format_RGB32)
+        qimage.array = array
+        return qimage
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Preallocated frame buffers and lookup tables for the kinect's depth stream.
+'''
+
+import numpy as np
+
+# the kinect's depth sensor returns 11 bit values
+RAW_DEPTH_VALUES = 2048
+
+
+def depth_8bit_lut():
+    '''
+    Return a lookup table that maps the kinect's raw 11 bit depth values to
+    the 8 bit values returned by Kinect.getDepth().
+
+    The low bits are stripped in the same way as SimpleCV does it: values
+    are clipped to 10 bits and then shifted right by 2.
+    '''
+
+    raw = np.arange(RAW_DEPTH_VALUES)
+    np.clip(raw, 0, 2**10 - 1, raw)
+    raw >>= 2
+    return raw.astype(np.uint8)
+
+
+DEPTH_8BIT_LUT = depth_8bit_lut()
+
+# the raw value reported by the sensor where it has no reading
+RAW_NO_DEPTH = 2047
+
+# the distance, in millimetres, given to raw values without a valid reading
+NO_DEPTH_MM = 0
+
+
+def depth_mm_lut(max_distance=10000):
+    '''
+    Return a lookup table that maps the kinect's raw 11 bit depth values to
+    distances in millimetres.
+
+    Uses the usual first order approximation of the sensor's disparity,
+    1 / (raw * -0.0030711016 + 3.3309495161) metres. Raw values without a
+    reading, or whose distance is not positive or is beyond max_distance
+    millimetres, are mapped to NO_DEPTH_MM.
+    '''
+
+    raw = np.arange(RAW_DEPTH_VALUES, dtype=np.float64)
+    inverse = raw * -0.0030711016 + 3.3309495161
+    mm = np.zeros(RAW_DEPTH_VALUES)
+    valid = inverse > 0
+    mm[valid] = np.round(1000.0 / inverse[valid])
+    mm[mm > max_distance] = NO_DEPTH_MM
+    mm[RAW_NO_DEPTH] = NO_DEPTH_MM
+    return mm.astype(np.uint16)
+
+
+DEPTH_MM_LUT = depth_mm_lut()
+
+
+class FramePool(object):
+    '''
+    A fixed ring of preallocated numpy arrays.
+
+    Each call to next_buffer() returns the following buffer in the ring, so a
+    buffer gets reused after `size` frames. Consumers that need to keep a
+    frame for longer than that must copy it.
+    '''
+
+    def __init__(self, shape, dtype=np.uint8, size=3):
+        '''
+        Inputs:
+
+            shape - A tuple with the shape of each frame.
+
+            dtype - The numpy dtype of each frame.
+
+            size - An integer with the number of buffers in the pool.
+        '''
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.size = int(size)
+        self.buffers = [np.empty(self.shape, dtype=self.dtype) for i in \
+                        range(self.size)]
+        self.index = -1
+
+    def next_buffer(self):
+        self.index = (self.index + 1) % self.size
+        return self.buffers[self.index]
+
+    def current_buffer(self):
+        '''
+        Return the last buffer handed out by next_buffer() or None.
+        '''
+
+        if self.index < 0:
+            return None
+        return self.buffers[self.index]
+
+
+class DepthConverter(object):
+    '''
+    Map raw depth frames through a lookup table into a FramePool.
+
+    The raw values are first copied into a preallocated index buffer, because
+    numpy would otherwise allocate a temporary array of indexes on every
+    call to take(). Converting a frame does not allocate any memory.
+    '''
+
+    def __init__(self, lut, shape, pool_size=3):
+        '''
+        Inputs:
+
+            lut - A 1D numpy array with one output value for each raw value.
+
+            shape - A tuple with the shape of the raw frames.
+
+            pool_size - An integer with the number of output buffers.
+        '''
+
+        self.lut = lut
+        self.pool = FramePool(shape, dtype=lut.dtype, size=pool_size)
+        self.indexes = np.empty(shape, dtype=np.intp)
+
+    def convert(self, raw):
+        '''
+        Return the next buffer of the pool, filled with the converted frame.
+        '''
+
+        np.copyto(self.indexes, raw, casting='unsafe')
+        out = self.pool.next_buffer()
+        np.take(self.lut, self.indexes, out=out, mode='clip')
+        return out
@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Fusion of several kinects into a single world.
+
+Each device has extrinsics, its position and orientation in the world.
+Its centroids, or point clouds, are transformed into world coordinates, the
+centroids that several devices see of the same person are merged and a
+single ActorManager tracks them. Point clouds are drawn on a top view grid
+of the world, which is sent with the world's OSC messages.
+
+World coordinates are in metres: x and y on the floor and z up. A device
+with no rotation looks along +y with its image's x going along +x.
+'''
+
+import json
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from tracking import ActorManager
+from pointcloud import get_ray_tables
+
+try:
+    import SimpleCV as scv
+except ImportError:
+    scv = None
+
+# maps the camera's axes (x right, y down, z forward) to the world's axes
+# for a device with no rotation
+_CAMERA_TO_WORLD = np.array([[1, 0, 0],
+                             [0, 0, 1],
+                             [0, -1, 0]], dtype=np.float64)
+
+
+def rotation_matrix(yaw=0, pitch=0, roll=0):
+    '''
+    Return the 3x3 matrix that rotates a device's camera coordinates into
+    world coordinates.
+
+    Inputs:
+
+        yaw - The heading, in degrees, counterclockwise around z.
+
+        pitch - The tilt, in degrees, positive when looking up.
+
+        roll - The rotation, in degrees, around the viewing direction.
+    '''
+
+    yaw, pitch, roll = np.radians([yaw, pitch, roll])
+    cz, sz = np.cos(yaw), np.sin(yaw)
+    cx, sx = np.cos(pitch), np.sin(pitch)
+    cy, sy = np.cos(roll), np.sin(roll)
+    around_z = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    around_x = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    around_y = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    return around_z.dot(around_x).dot(around_y).dot(_CAMERA_TO_WORLD)
+
+
+class Extrinsics(object):
+
+    def __init__(self, position=(0, 0, 0), yaw=0, pitch=0, roll=0,
+                 rotation=None):
+        '''
+        Inputs:
+
+            position - The (x, y, z) of the device in the world, in metres.
+
+            yaw, pitch, roll - The orientation of the device, in degrees.
+                See rotation_matrix().
+
+            rotation - A 3x3 matrix from camera to world coordinates, used
+                instead of yaw, pitch and roll.
+        '''
+
+        self.position = np.asarray(position, dtype=np.float64).reshape(3)
+        if rotation is None:
+            rotation = rotation_matrix(yaw, pitch, roll)
+        self.rotation = np.asarray(rotation, dtype=np.float64).reshape(3, 3)
+
+    def transform(self, points):
+        '''
+        Return an (N, 3) float64 array with camera coordinates, in metres,
+        transformed into world coordinates.
+        '''
+
+        points = np.asarray(points).reshape(-1, 3)
+        return points.dot(self.rotation.T) + self.position
+
+
+def load_extrinsics(path):
+    '''
+    Read the extrinsics of the devices from a JSON file.
+
+    The file has an object with an entry per device number, e.g.
+    {"0": {"position": [0, 0, 2.5], "yaw": 0, "pitch": -30}}.
+
+    Returns: A dictionary with the Extrinsics of each device number.
+    '''
+
+    with open(path) as fh:
+        config = json.load(fh)
+    extrinsics = dict()
+    for device_number, values in config.items():
+        extrinsics[int(device_number)] = Extrinsics(**values)
+    return extrinsics
+
+
+def merge_points(points, radius):
+    '''
+    Merge the points that are closer than radius, directly or through other
+    points.
+
+    Inputs:
+
+        points - An (N, 3) array.
+
+        radius - The merging distance.
+
+    Returns: A tuple with an (M, 3) array with the mean of each group of
+        points and an array with the group of each point.
+    '''
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    num_points = len(points)
+    if num_points < 2:
+        return points, np.zeros(num_points, dtype=np.intp)
+    pairs = cKDTree(points).query_pairs(radius, output_type='ndarray')
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+                       shape=(num_points, num_points))
+    num_groups, groups = connected_components(graph, directed=False)
+    counts = np.bincount(groups, minlength=num_groups).astype(np.float64)
+    merged = np.empty((num_groups, 3))
+    for axis in range(3):
+        merged[:, axis] = np.bincount(groups, points[:, axis],
+                                      minlength=num_groups) / counts
+    return merged, groups
+
+
+class WorldGrid(object):
+    '''
+    A top view occupancy grid of the world's floor.
+
+    Like Grid, empty cells are 255 and occupied cells are 0. The grid is
+    indexed [x, y].
+    '''
+
+    EMPTY = 255
+    OCCUPIED = 0
+
+    def __init__(self, bounds=((-5.0, 5.0), (0.0, 10.0)), cell_size=0.05,
+                 min_height=None, max_height=None):
+        '''
+        Inputs:
+
+            bounds - The ((xmin, xmax), (ymin, ymax)) of the floor covered
+                by the grid, in metres.
+
+            cell_size - The side of each cell, in metres.
+
+            min_height, max_height - Optional limits, in metres, of the
+                height of the points that are drawn, e.g. to leave out the
+                floor.
+        '''
+
+        (self.xmin, xmax), (self.ymin, ymax) = bounds
+        self.cell_size = float(cell_size)
+        self.shape = (int(np.ceil((xmax - self.xmin) / self.cell_size)),
+                      int(np.ceil((ymax - self.ymin) / self.cell_size)))
+        self.min_height = min_height
+        self.max_height = max_height
+        self.grid = np.empty(self.shape, dtype=np.uint8)
+        self.clear()
+
+    def clear(self):
+        self.grid.fill(self.EMPTY)
+
+    def cells(self, points):
+        '''
+        Return the (x, y) cell indexes of the world points inside the grid.
+        '''
+
+        points = np.asarray(points).reshape(-1, 3)
+        cx = np.floor((points[:, 0] - self.xmin) / self.cell_size)
+        cy = np.floor((points[:, 1] - self.ymin) / self.cell_size)
+        valid = (cx >= 0) & (cx < self.shape[0])
+        valid &= (cy >= 0) & (cy < self.shape[1])
+        if self.min_height is not None:
+            valid &= points[:, 2] >= self.min_height
+        if self.max_height is not None:
+            valid &= points[:, 2] <= self.max_height
+        return cx[valid].astype(np.intp), cy[valid].astype(np.intp)
+
+    def add_points(self, points):
+        self.grid[self.cells(points)] = self.OCCUPIED
+
+    def occupied(self):
+        '''
+        Return an (N, 2) array with the world (x, y) of the center of each
+        occupied cell.
+        '''
+
+        cell_x, cell_y = np.nonzero(self.grid == self.OCCUPIED)
+        return np.column_stack(self.to_world(cell_x, cell_y))
+
+    def to_world(self, cell_x, cell_y):
+        '''
+        Return the world (x, y) of the center of a cell.
+        '''
+
+        return (self.xmin + (cell_x + 0.5) * self.cell_size,
+                self.ymin + (cell_y + 0.5) * self.cell_size)
+
+    def get_image(self):
+        return scv.Image(self.grid)
+
+
+class Fusion(object):
+    '''
+    Combines the detections of several kinects in a single world.
+
+    Each device's latest centroids, and point clouds, are kept until it
+    delivers new ones. After adding those of one or more devices, call
+    update(), which merges the latest ones of every device and updates the
+    world's actors.
+    '''
+
+    def __init__(self, extrinsics=None, merge_radius=0.4,
+                 distance_threshold=0.5, grid_bounds=((-5.0, 5.0),
+                                                      (0.0, 10.0)),
+                 cell_size=0.05, min_height=0.1, max_height=None,
+                 tracking_method='auto', max_age=0.5, point_clouds=False):
+        '''
+        Inputs:
+
+            extrinsics - A dictionary with the Extrinsics of each device
+                number. More devices can be added with add_device().
+
+            merge_radius - Centroids closer than this, in metres, are the
+                same person.
+
+            distance_threshold - The largest distance, in metres, an actor
+                may move between two frames and still be tracked.
+
+            grid_bounds, cell_size, min_height, max_height - The world's
+                top view grid, see WorldGrid.
+
+            tracking_method - The matching method of the ActorManager.
+
+            max_age - Devices whose latest frame was captured more than
+                this many seconds before the newest frame of any device
+                are left out of the world. None keeps every device's latest
+                frame.
+
+            point_clouds - A boolean indicating if the devices' point
+                clouds should be added too, to draw the world's grid. The
+                producers of the world check it, see add_points().
+        '''
+
+        self.devices = dict()
+        for device_number, device_extrinsics in (extrinsics or {}).items():
+            self.add_device(device_number, device_extrinsics)
+        self.merge_radius = merge_radius
+        self.distance_threshold = distance_threshold
+        self.grid = WorldGrid(grid_bounds, cell_size, min_height, max_height)
+        self.actor_manager = ActorManager(method=tracking_method)
+        self.max_age = max_age
+        self.point_clouds = point_clouds
+        self.centroids = None
+        self.capturetime = None
+        self._delivered = False
+
+    def add_device(self, device_number, extrinsics, size=(640, 480),
+                   intrinsics=None):
+        '''
+        Inputs:
+
+            device_number - The number of the device.
+
+            extrinsics - Its Extrinsics.
+
+            size, intrinsics - The size of its depth frames and its depth
+                camera, used to project its centroids. See
+                pointcloud.get_ray_tables().
+        '''
+
+        self.devices[device_number] = {
+            'extrinsics' : extrinsics,
+            'rays' : get_ray_tables(size, intrinsics, device_number),
+            'centroids' : None,
+            'points' : None,
+            'capturetime' : None,
+        }
+
+    def _device(self, device_number):
+        try:
+            return self.devices[device_number]
+        except KeyError:
+            raise ValueError('Device %s has no extrinsics' % device_number)
+
+    def _deliver(self, device, capturetime):
+        device['capturetime'] = capturetime
+        self._delivered = True
+
+    def add_centroids(self, device_number, centroids, capturetime=None):
+        '''
+        Set the centroids a device detected in its newest frame.
+
+        Inputs:
+
+            device_number - The number of the device.
+
+            centroids - A list of (x, z, y) tuples, or an (N, 3) array, as
+                returned by a Detector with metric_depth: the pixel's column
+                and line and the depth, in millimetres. None means nothing
+                was detected.
+
+            capturetime - The time the device's frame was captured.
+        '''
+
+        device = self._device(device_number)
+        self._deliver(device, capturetime)
+        if centroids is None or len(centroids) == 0:
+            device['centroids'] = np.zeros((0, 3))
+            return
+        centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 3)
+        rays = device['rays']
+        width, height = rays.x.shape
+        columns = np.clip(np.rint(centroids[:, 0]).astype(np.intp), 0,
+                          width - 1)
+        lines = np.clip(np.rint(centroids[:, 1]).astype(np.intp), 0,
+                        height - 1)
+        z = centroids[:, 2] / 1000.0
+        camera = np.column_stack((rays.x[columns, lines] * z,
+                                  rays.y[columns, lines] * z, z))
+        device['centroids'] = device['extrinsics'].transform(camera[z > 0])
+
+    def add_points(self, device_number, points, capturetime=None):
+        '''
+        Set the point cloud of a device's newest frame, as returned by
+        pointcloud.PointCloud or Detector.get_point_cloud(). The world's
+        grid is drawn with the latest cloud of every device by update().
+
+        Returns: The points in world coordinates.
+        '''
+
+        device = self._device(device_number)
+        self._deliver(device, capturetime)
+        if points is None:
+            device['points'] = None
+            return None
+        device['points'] = device['extrinsics'].transform(points)
+        return device['points']
+
+    def _current_devices(self):
+        '''
+        Return the devices whose latest frame is recent enough, see
+        max_age.
+        '''
+
+        times = [d['capturetime'] for d in self.devices.values() if \
+                 d['capturetime'] is not None]
+        if self.max_age is None or len(times) == 0:
+            return list(self.devices.values())
+        newest = max(times)
+        return [d for d in self.devices.values() if \
+                d['capturetime'] is None or
+                newest - d['capturetime'] <= self.max_age]
+
+    def update(self):
+        '''
+        Merge the latest centroids of every device, update the actors and
+        redraw the grid, if any device has delivered a frame since the last
+        update. Otherwise nothing changes, so that the actors keep their
+        identities between rounds without new frames.
+
+        Returns: An (N, 3) array with the merged centroids, in world
+            coordinates, or None if nothing was delivered.
+        '''
+
+        if not self._delivered:
+            return None
+        self._delivered = False
+        devices = self._current_devices()
+        centroids = [d['centroids'] for d in devices if \
+                     d['centroids'] is not None]
+        if len(centroids) > 0:
+            centroids = np.concatenate(centroids)
+        else:
+            centroids = np.zeros((0, 3))
+        self.centroids = merge_points(centroids, self.merge_radius)[0]
+        self.actor_manager.update_points(self.centroids,
+                                         self.distance_threshold)
+        times = [d['capturetime'] for d in devices if \
+                 d['capturetime'] is not None]
+        self.capturetime = max(times) if len(times) > 0 else None
+        self.grid.clear()
+        for d in devices:
+            if d['points'] is not None:
+                self.grid.add_points(d['points'])
+        return self.centroids
+
+    def get_results(self):
+        return {
+            'capturetime' : self.capturetime,
+            'centroids' : self.centroids,
+            'actors' : self.actor_manager.points,
+            'grid' : self.grid,
+        }
+
+    def send_osc_messages(self, osc_communicator,
+                          base_address='/world', cells_per_message=64):
+        '''
+        Send the world's merged centroids and its actors as a single
+        frame. With point_clouds, the world (x, y) of the grid's occupied
+        cells are sent too, one after the other, in messages of up to
+        cells_per_message cells.
+        '''
+
+        frame = osc_communicator.frame(self.capturetime)
+        centroids = None
+        if self.centroids is not None:
+            centroids = self.centroids.tolist()
+        frame.add_centroids(centroids,
+                            base_address=base_address + '/centroids')
+        frame.add_actors(self.actor_manager.points,
+                         base_address=base_address + '/actors')
+        if self.point_clouds:
+            cells = self.grid.occupied()
+            for index, start in enumerate(range(0, len(cells),
+                                                cells_per_message)):
+                values = cells[start:start + cells_per_message].ravel()
+                frame.add_message('%s/grid/%i' % (base_address, index),
+                                  *values.tolist())
+        return osc_communicator.send_frame(frame)
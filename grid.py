@@ -3,6 +3,8 @@
 
 import numpy as np
 import SimpleCV as scv
+from gridwarper import warp_tables
+from instrumentation import stage
 
 class GridWarper(object):
 
@@ -13,33 +15,30 @@ class GridWarper(object):
     #XBMAX = 2.44 # distance from the farthest right corner to the middle
 
     def __init__(self, width=640, height=480, ymin=1.23, ymax=4.52, 
-                 xbmin=-2.44, xbmax=2.44):
+                 xbmin=-2.44, xbmax=2.44, cache_dir=None):
+        '''
+        Inputs:
+
+            width, height - The grid's dimensions.
+
+            ymin, ymax, xbmin, xbmax - The kinect calibration distances.
+
+            cache_dir - A directory where the warp tables are persisted as
+                memory-mapped .npy files, or None. See gridwarper.warp_tables.
+        '''
+
         self.width = int(width)
         self.height = int(height)
         self.ymin = ymin
         self.ymax = ymax
         self.xbmin = xbmin
-        self.xbmax = xbma=2.44
+        self.xbmax = xbmax
+        self.cache_dir = cache_dir
         self.norm_x, self.norm_y = self._compute_warp()
 
     def _compute_warp(self):
-        # m_a: matrix degrees
-        xb = np.linspace(self.xbmin, self.xbmax, self.width)
-        yb = np.ones(self.width) * self.ymax
-        a = np.arctan(xb / yb)
-        m_a = np.zeros((self.height, self.width))
-        for line in range(self.height):
-            m_a[line, :] = a[:]
-        # m_y: matrix y
-        y = np.linspace(self.ymin, self.ymax, self.height)
-        m_y = np.zeros((self.height, self.width))
-        for col in range(self.width):
-            m_y[:, col]  = y[:]
-        m_x = m_y * np.tan(m_a)
-        #normalized map coordinates
-        norm_x = (m_x[:] - self.xbmin) / (self.xbmax - self.xbmin)
-        norm_y = (m_y[:] - self.ymin) / (self.ymax - self.ymin)
-        return norm_x, norm_y
+        return warp_tables(self.width, self.height, self.ymin, self.ymax,
+                           self.xbmin, self.xbmax, cache_dir=self.cache_dir)
 
     def get_coords(self, raw_y, raw_x):
         warped_x = self.norm_x[raw_y, raw_x]
@@ -52,7 +51,7 @@ class Grid(object):
     def __init__(self, lines=480, cols=640, depth=100,
                  real_min_width=0, real_max_width=640,
                  real_min_height=0, real_max_height=480,
-                 real_min_depth=200, real_max_depth=254):
+                 real_min_depth=200, real_max_depth=254, sparse=False):
         '''
         Inputs:
 
@@ -65,6 +64,15 @@ class Grid(object):
             real_max_height - The maximum height value returned by the sensor.
             real_min_depth - The minimum depth value returned by the sensor.
             real_max_depth - The maximum depth value returned by the sensor.
+            sparse - A boolean indicating if the grids only keep the
+                coordinates of their occupied cells. Dense grids are then
+                drawn when xy_grid or xz_grid are read, clearing only the
+                cells drawn before, so the cost of a frame depends on the
+                number of points instead of the size of the grids.
+
+        The occupied cells of each update are kept in `cells`, which is
+        replaced, never changed, by the next update, so it can be passed
+        to get_image() to draw the grids of that update later.
 
         '''
 
@@ -81,9 +89,59 @@ class Grid(object):
         self.real_width_range = real_max_width - real_min_width
         self.real_height_range = real_max_height - real_min_height
         self.real_depth_range = real_max_depth - real_min_depth
-        self.xy_grid = np.ones((self.HEIGHT, self.WIDTH), dtype=np.int8) * 255
-        self.xz_grid = np.ones((self.DEPTH, self.WIDTH), dtype=np.int8) * 255
+        self.sparse = sparse
+        self.shapes = {
+            'xy' : (int(self.HEIGHT), int(self.WIDTH)),
+            'xz' : (int(self.DEPTH), int(self.WIDTH)),
+        }
+        # (rows, cols) index arrays with the occupied cells of each grid
+        no_cells = (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp))
+        self.cells = {'xy' : no_cells, 'xz' : no_cells}
+        # the dense grids and the cells drawn on them
+        self._dense = dict()
+        self._drawn = dict()
+        if not sparse:
+            for grid_type in ('xy', 'xz'):
+                self._dense_grid(grid_type)
         self.xz_warper = GridWarper(width=self.WIDTH, height=self.DEPTH)
+        # an instrumentation.StageTimings, set by the Detector that owns
+        # the grid
+        self.timings = None
+
+    @property
+    def xy_grid(self):
+        return self._get_grid('xy')
+
+    @property
+    def xz_grid(self):
+        return self._get_grid('xz')
+
+    def _dense_grid(self, grid_type):
+        grid = self._dense.get(grid_type)
+        if grid is None:
+            grid = np.empty(self.shapes[grid_type], dtype=np.uint8)
+            grid.fill(255)
+            self._dense[grid_type] = grid
+            self._drawn[grid_type] = None
+        return grid
+
+    def _get_grid(self, grid_type, cells=None):
+        '''
+        Return the dense grid with the given cells drawn on it, by default
+        the cells of the last update.
+        '''
+
+        if cells is None:
+            cells = self.cells
+        cells = cells[grid_type]
+        grid = self._dense_grid(grid_type)
+        drawn = self._drawn[grid_type]
+        if drawn is not cells:
+            if drawn is not None:
+                grid[drawn] = 255
+            grid[cells] = self.DEPTH_VALUE_POINT
+            self._drawn[grid_type] = cells
+        return grid
 
     def _rescale_point(self, point):
         '''
@@ -112,46 +170,111 @@ class Grid(object):
             result = [r_x, r_y, r_z]
         return result
 
+    def _rescale_points(self, points):
+        '''
+        Rescale an array of points, according to the grid's dimensions.
+
+        Inputs:
+
+            points - A sequence of (x, y, z) points or an (N, 3) array.
+
+        Returns: An (M, 3) float array with the rescaled points that fall
+            inside the grid. Points with z == 0 (2d images, without depth)
+            are placed on the grid's last depth line, like _rescale_point()
+            does.
+        '''
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        x = points[:, 0]
+        y = points[:, 1]
+        z = points[:, 2]
+        r_x = (x - self.REAL_MIN_WIDTH) * self.WIDTH / self.real_width_range
+        r_y = ((y - self.REAL_MIN_HEIGHT) * self.HEIGHT /
+               self.real_height_range)
+        r_z = (z - self.REAL_MIN_DEPTH) * self.DEPTH / self.real_depth_range
+        flat = z == 0
+        r_z[flat] = self.DEPTH - 1
+        valid = (r_x > 0) & (r_x < self.WIDTH) & \
+                (r_y > 0) & (r_y < self.HEIGHT) & \
+                (((r_z > 0) & (r_z < self.DEPTH)) | flat)
+        return np.column_stack((r_x[valid], r_y[valid], r_z[valid]))
+
     def update_grid(self, points):
         '''
         Update the detected points' coordinates on the grid.
 
+        The points are rescaled, range checked, warped and quantized as a
+        single batch of numpy operations.
+
         Inputs
 
             points - a list of points with the raw x, y, z coordinates
-                read from the Kinect sensor
+                read from the Kinect sensor or an (N, 3) array. None is
+                treated as an empty list.
 
         Returns: Nothing
         '''
 
-        self.xy_grid.fill(255)
-        self.xz_grid.fill(255)
-        for p in points:
-            #print('old coordinates: %s,' % (p,))
-            the_point = self._rescale_point(p)
-            if the_point is not None:
-                x, y, z = the_point
-                #print('rescaled coordinates: %s, %s, %s' % (x, y, z))
-                warped_z, warped_x = self.xz_warper.get_coords(z, x)
-                #print('warped coordinates: %s, %s' % (warped_x, warped_z))
-                grid_x = np.round(warped_x * (self.WIDTH - 1))
-                grid_z = np.round(warped_z * (self.DEPTH - 1))
-                self.xz_grid[grid_z, grid_x] = self.DEPTH_VALUE_POINT
-                self.xy_grid[y, grid_x] = self.DEPTH_VALUE_POINT
-
-    def get_image(self, grid_type='xz'):
-        if grid_type == 'xy':
-            grid = self.xy_grid
-        elif grid_type == 'xz':
-            grid = self.xz_grid
-        grid_im = scv.Image(grid.transpose())
-        morphed = grid_im.erode(10)
+        with stage(self.timings, 'grid_update'):
+            self._update_grid(points)
+
+    def _update_grid(self, points):
+        if points is None or len(points) == 0:
+            self._set_cells(np.zeros(0, dtype=np.intp),
+                            np.zeros(0, dtype=np.intp),
+                            np.zeros(0, dtype=np.intp))
+            return
+        rescaled = self._rescale_points(points)
+        # the rescaled coordinates are positive, so casting truncates them
+        # in the same way as indexing with floats used to
+        indexes = rescaled.astype(np.intp)
+        warped_z, warped_x = self.xz_warper.get_coords(indexes[:, 2],
+                                                       indexes[:, 0])
+        grid_x = np.rint(warped_x * (self.WIDTH - 1)).astype(np.intp)
+        grid_z = np.rint(warped_z * (self.DEPTH - 1)).astype(np.intp)
+        self._set_cells(grid_x, indexes[:, 1], grid_z)
+
+    def _set_cells(self, grid_x, grid_y, grid_z):
+        self.cells = {'xy' : (grid_y, grid_x), 'xz' : (grid_z, grid_x)}
+        if not self.sparse:
+            for grid_type in ('xy', 'xz'):
+                grid = self._dense[grid_type]
+                grid.fill(255)
+                grid[self.cells[grid_type]] = self.DEPTH_VALUE_POINT
+                self._drawn[grid_type] = self.cells[grid_type]
+
+    def get_image(self, grid_type='xz', cells=None):
+        '''
+        Return a SimpleCV.Image of a grid.
+
+        Inputs:
+
+            grid_type - 'xy' or 'xz'.
+
+            cells - The `cells` of an earlier update, to draw the grid as it
+                was then, or None for the last update.
+        '''
+
+        grid = self._get_grid(grid_type, cells)
+        with stage(self.timings, 'grid_image'):
+            grid_im = scv.Image(grid.transpose())
+            morphed = grid_im.erode(10)
         return morphed
 
     def get_points(self):
         '''
         Return the coordinates on the grids of points.
         '''
+        if self.sparse:
+            grid_y, grid_x = self.cells['xy']
+            grid_z = self.cells['xz'][0]
+            # points that fall on the same cell are one point, like on the
+            # dense grids
+            cells = np.unique(np.column_stack((grid_x, grid_y, grid_z)),
+                              axis=0)
+            return list(zip(cells[:, 0] / self.WIDTH,
+                            cells[:, 1] / self.HEIGHT,
+                            cells[:, 2] / self.DEPTH))
         coords_xz = np.argwhere(self.xz_grid == self.DEPTH_VALUE_POINT)
         coords_xy = np.argwhere(self.xy_grid == self.DEPTH_VALUE_POINT)
         points = []
@@ -160,6 +283,7 @@ class Grid(object):
             y = coords_xy[pt, 0] / self.HEIGHT
             z = coords_xz[pt, 0] / self.DEPTH
             points.append((x, y, z))
+        return points
 
     #def send_coordinates(self, osc_client, message_name):
     #    coords_xz = np.argwhere(self.xz_grid == self.DEPTH_VALUE_POINT)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 # -*- coding : utf-8 -*- 
+import os
+import threading
 import numpy as np
 #
 ## grid dimension
@@ -30,6 +32,100 @@ import numpy as np
 #norm_X=(m_x[:]-xbmin)/(xbmax-xbmin)
 #norm_Y=(m_y[:]-ymin)/(ymax-ymin)
 #
+
+# process-wide cache of warp tables, keyed by
+# (width, height, ymin, ymax, xbmin, xbmax)
+_WARP_CACHE = dict()
+_WARP_CACHE_LOCK = threading.Lock()
+
+# directory where warp tables are persisted as .npy files, or None
+WARP_CACHE_DIR = None
+
+
+def _compute_warp_tables(width, height, ymin, ymax, xbmin, xbmax):
+    # a: the angle of each column
+    xb = np.linspace(xbmin, xbmax, width)
+    a = np.arctan(xb / ymax)
+    # y: the distance of each line
+    y = np.linspace(ymin, ymax, height)
+    m_x = y[:, np.newaxis] * np.tan(a)[np.newaxis, :]
+    #normalized map coordinates
+    norm_x = (m_x - xbmin) / (xbmax - xbmin)
+    norm_y = (y - ymin) / (ymax - ymin)
+    return norm_x, norm_y
+
+
+def _table_paths(cache_dir, key):
+    name = 'warp_%ix%i_%r_%r_%r_%r' % key
+    return (os.path.join(cache_dir, name + '_x.npy'),
+            os.path.join(cache_dir, name + '_y.npy'))
+
+
+def _save_table(path, table):
+    # write to a temporary file first, so other processes never load a
+    # partially written table
+    tmp_path = '%s.%i.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as fh:
+        np.save(fh, table)
+    os.rename(tmp_path, path)
+
+
+def warp_tables(width=640, height=480, ymin=1.23, ymax=4.52, xbmin=-2.44,
+                xbmax=2.44, cache_dir=None):
+    '''
+    Return the normalized warp tables for a grid.
+
+    Tables are computed once per process for each combination of inputs and
+    shared by every GridWarper. If a cache directory is used they are also
+    saved there as .npy files and memory-mapped on later runs, so several
+    processes share the same pages.
+
+    Inputs:
+
+        width, height - The grid's dimensions.
+
+        ymin, ymax, xbmin, xbmax - The kinect calibration distances.
+
+        cache_dir - The directory where tables are persisted. If None (the
+            default) the module's WARP_CACHE_DIR is used, and when that is
+            None as well tables are only kept in memory.
+
+    Returns: A tuple (norm_x, norm_y) of read-only (height, width) arrays.
+    '''
+
+    key = (int(width), int(height), float(ymin), float(ymax), float(xbmin),
+           float(xbmax))
+    with _WARP_CACHE_LOCK:
+        tables = _WARP_CACHE.get(key)
+        if tables is None:
+            tables = _load_or_compute(key, cache_dir or WARP_CACHE_DIR)
+            _WARP_CACHE[key] = tables
+    return tables
+
+
+def _load_or_compute(key, cache_dir):
+    width, height = key[:2]
+    norm_x = norm_y = None
+    if cache_dir is not None:
+        x_path, y_path = _table_paths(cache_dir, key)
+        if os.path.isfile(x_path) and os.path.isfile(y_path):
+            norm_x = np.load(x_path, mmap_mode='r')
+            norm_y = np.load(y_path, mmap_mode='r')
+    if norm_x is None:
+        norm_x, norm_y = _compute_warp_tables(*key)
+        if cache_dir is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            _save_table(x_path, norm_x)
+            _save_table(y_path, norm_y)
+        norm_x.flags.writeable = False
+        norm_y.flags.writeable = False
+    # norm_y only varies along the lines, so it is broadcast to the grid's
+    # shape without using any memory
+    norm_y = np.broadcast_to(norm_y[:, np.newaxis], (height, width))
+    return norm_x, norm_y
+
+
 class GridWarper(object):
 
     # kinect calibration distances for the grid
@@ -38,29 +134,15 @@ class GridWarper(object):
     XBMIN = -2.44 # distance from the farthest left corner to the middle
     XBMAX = 2.44 # distance from the farthest right corner to the middle
 
-    def __init__(self, width=640, height=480):
+    def __init__(self, width=640, height=480, cache_dir=None):
         self.width = int(width)
         self.height = int(height)
+        self.cache_dir = cache_dir
         self.norm_x, self.norm_y = self._compute_warp()
 
     def _compute_warp(self):
-        # m_a: matrix degrees
-        xb = np.linspace(self.XBMIN, self.XBMAX, self.width)
-        yb = np.ones(self.width) * self.YMAX
-        a = np.arctan(xb / yb)
-        m_a = np.zeros((self.height, self.width))
-        for line in range(self.height):
-            m_a[line, :] = a[:]
-        # m_y: matrix y
-        y = np.linspace(self.YMIN, self.YMAX, self.height)
-        m_y = np.zeros((self.height, self.width))
-        for col in range(self.width):
-            m_y[:, col]  = y[:]
-        m_x = m_y * np.tan(m_a)
-        #normalized map coordinates
-        norm_x = (m_x[:] - self.XBMIN) / (self.XBMAX - self.XBMIN)
-        norm_y = (m_y[:] - self.YMIN) / (self.YMAX - self.YMIN)
-        return norm_x, norm_y
+        return warp_tables(self.width, self.height, self.YMIN, self.YMAX,
+                           self.XBMIN, self.XBMAX, cache_dir=self.cache_dir)
 
     def get_coords(self, raw_y, raw_x):
         warped_x = self.norm_x[raw_y, raw_x]
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Per stage timing of the detection hot path.
+
+A StageTimings keeps the durations of the last frames of each stage and
+reports their percentiles. It is off by default: while disabled, timing a
+stage costs an attribute lookup and a call to an empty context manager.
+'''
+
+import timeit
+from collections import deque
+import numpy as np
+
+# the stages timed by the Detector and its grids, in pipeline order
+STAGES = ('capture', 'detect', 'blobs', 'centroids', 'boundaries',
+          'grid_update', 'grid_image')
+
+PERCENTILES = (50, 95, 99)
+
+
+class _NullStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+
+    __slots__ = ('samples', 'start')
+
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __enter__(self):
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *args):
+        self.samples.append(timeit.default_timer() - self.start)
+        return False
+
+
+class StageTimings(object):
+
+    def __init__(self, window=300, enabled=False):
+        '''
+        Inputs:
+
+            window - The number of most recent durations kept for each
+                stage.
+
+            enabled - A boolean indicating if stages are timed.
+        '''
+
+        self.window = window
+        self.enabled = enabled
+        self.samples = dict()
+
+    def stage(self, name):
+        '''
+        Return a context manager that times the code it wraps as the stage
+        `name`.
+        '''
+
+        if not self.enabled:
+            return NULL_STAGE
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+        return _Stage(samples)
+
+    def reset(self):
+        self.samples = dict()
+
+    def summary(self, percentiles=PERCENTILES):
+        '''
+        Return a dictionary with a dictionary for each timed stage, holding
+        the number of durations kept ('count'), their mean ('mean') and
+        their percentiles ('p50', 'p95', ...), in milliseconds.
+        '''
+
+        summary = dict()
+        for name, samples in list(self.samples.items()):
+            # the detection thread may be appending to the deque, so it is
+            # copied in one go before it is looked at
+            samples = list(samples)
+            if len(samples) == 0:
+                continue
+            durations = np.array(samples) * 1000.0
+            stats = {'count' : len(durations), 'mean' : durations.mean()}
+            for q, value in zip(percentiles,
+                                np.percentile(durations, percentiles)):
+                stats['p%i' % q] = value
+            summary[name] = stats
+        return summary
+
+
+def stage(timings, name):
+    '''
+    Time a stage with timings, which may be None.
+    '''
+
+    if timings is None:
+        return NULL_STAGE
+    return timings.stage(name)
+
+
+def format_summary(summary, percentiles=PERCENTILES):
+    '''
+    Return a list of lines with a stage's percentiles each, in pipeline
+    order.
+    '''
+
+    names = [s for s in STAGES if s in summary]
+    names += sorted(s for s in summary if s not in STAGES)
+    lines = []
+    for name in names:
+        stats = summary[name]
+        values = ' '.join('p%i %6.2f' % (q, stats['p%i' % q]) for \
+                          q in percentiles)
+        lines.append('%-12s %s ms' % (name, values))
+    return lines
@@ -9,11 +9,12 @@ detection.
 import sys
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
-import qimage2ndarray
 from shapely.geometry import Polygon, Point, MultiPolygon
 from shapely.prepared import prep
 import ui_detector
 import detection
+from osccommunicator import OSCCommunicator
+from display import FrameDisplay
 from multiplekinects import Kinect
 
 class DetectorDlg(QDialog, ui_detector.Ui_DetectorDialog):
@@ -32,6 +33,7 @@ class DetectorDlg(QDialog, ui_detector.Ui_DetectorDialog):
         self.overlay_boundary_points = False
         self.detector = detector
         self.painter = QPainter()
+        self.frame_display = FrameDisplay()
         self.connect(self.image_rb, SIGNAL('toggled(bool)'),
                      self.toggle_output_image)
         self.connect(self.depth_rb, SIGNAL('toggled(bool)'),
@@ -114,9 +116,8 @@ class DetectorDlg(QDialog, ui_detector.Ui_DetectorDialog):
 
     def update_display(self, output_image, blobs, centroids, 
                        points, boundaries):
-        out_qim = QImage(output_image.toString(), output_image.width,
-                    output_image.height, 3*output_image.width,
-                    QImage.Format_RGB888)
+        out_qim = self.frame_display.to_qimage(
+            output_image, colorize=self.display == 'depth')
         pixmap = QPixmap.fromImage(out_qim)
         if self.overlay_blobs and blobs is not None:
             blobs_pix = QPixmap.fromImage(blobs)
@@ -169,13 +170,21 @@ class DetectorDlg(QDialog, ui_detector.Ui_DetectorDialog):
 
     def update_OSC_client(self):
         host, port = self.server_le.text().split(':')
-        self.OSC_client = OSCSender(host, port)
-
-    def send_centroids_osc_messages(self, centroids):
-        base_address = '/kinect/centroids'
-        for index, c in enumerate(centroids):
-            address = '/'.join((base_address, index, 'xy'))
-            self.osc_client.send_message(address, c[0], c[1])
+        # release the sender thread and the server port before rebinding it
+        if self.OSC_client is not None:
+            self.OSC_client.close()
+        self.OSC_client = OSCCommunicator(client_ip=str(host),
+                                          client_port=int(port))
+
+    def closeEvent(self, event):
+        if self.OSC_client is not None:
+            self.OSC_client.close()
+            self.OSC_client = None
+
+    def send_centroids_osc_messages(self, centroids, capturetime=None):
+        frame = self.OSC_client.frame(capturetime)
+        frame.add_centroids(centroids)
+        self.OSC_client.send_frame(frame)
 
 def detect_kinects():
     dev_number = 0
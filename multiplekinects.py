@@ -7,16 +7,20 @@ detection.
 '''
 
 import sys
+import threading
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 import SimpleCV as scv
-import qimage2ndarray
 from shapely.geometry import Polygon, Point, MultiPolygon
 from shapely.prepared import prep
 import ui_multiplekinects
 import ui_oscsettings
 import detection
+import workers
 from osccommunicator import OSCCommunicator
+from instrumentation import format_summary
+from detectionthreads import DetectionWorker, FusionWorker
+import fusion
 
 try:
     _fromUtf8 = QString.fromUtf8
@@ -32,25 +36,62 @@ class OSCSettingsDlg(QDialog, ui_oscsettings.Ui_OSCSettingsDialog):
 
 class MultipleKinectsDlg(QDialog, ui_multiplekinects.Ui_MultipleKinectsDialog):
 
+    # the base images are keys of Detector.get_results()
     DETECTION_METHODS = {
-        'depth' : ['depth', 'blob_source'],
-        'image' : ['image', 'blob_source', 'centroids_grid_xy',
+        'depth' : ['depth', 'depth_blob_source'],
+        'image' : ['image', 'image_blob_source', 'centroids_grid_xy',
                    'centroids_grid_xz', 'boundaries_grid_xy',
                    'boundaries_grid_xz'],
-        'motion_depth' : ['depth', 'motion_depth', 'blob_source'],
-        'motion_image' :['image', 'motion_image', 'blob_source'],
+        'motion_depth' : ['depth', 'motion_depth',
+                          'motion_depth_blob_source'],
+        'motion_image' :['image', 'motion_image', 'motion_image_blob_source'],
     }
 
-    def __init__(self, kinects, parent=None):
+    def __init__(self, kinects, parent=None, show_timings=False,
+                 send_timings=False, world=None, world_osc=None,
+                 target_fps=30, max_latency=0.1):
+        '''
+        Each kinect is captured, detected and sent on its own thread by a
+        detectionthreads.DetectionWorker. The dialog only paints the
+        snapshots that the workers send for the current tab.
+
+        Inputs:
+
+            kinects - A list of Detectors or ProcessDetectors.
+
+            show_timings - A boolean indicating if the detection stages are
+                timed and their percentiles shown over the base image.
+
+            send_timings - A boolean indicating if the timings are also
+                sent with the OSC messages.
+
+            world - A fusion.Fusion that merges the centroids of all the
+                kinects, identified by their device_number, or None.
+                The kinects should detect with metric depth.
+
+            world_osc - The OSCCommunicator where the world's centroids and
+                actors are sent, or None.
+
+            target_fps, max_latency - The detection rate aimed for and the
+                latency bound of the scheduler of each kinect. See
+                scheduler.FrameScheduler.
+        '''
+
         super(MultipleKinectsDlg, self).__init__(parent)
         self.setupUi(self)
         self.painter = QPainter()
+        self.show_timings = show_timings
+        self.send_timings = send_timings
+        self.world = world
+        self.world_osc = world_osc
+        self.world_lock = threading.Lock()
+        self.fusion_worker = None
         self.kinects = dict()
         tab_idx = self.kinects_tw.currentIndex()
         first_page = self.kinects_tw.widget(tab_idx)
         self.tabs = [first_page]
         self.current_tab = tab_idx
-        self.connect(self.kinects_tw, SIGNAL('currentChanged()'),
+        self.connect(self.kinects_tw, SIGNAL('currentChanged(int)'),
                         self.toggle_current_tab)
         for index, k in enumerate(kinects):
             self.kinects[index] = dict()
@@ -113,8 +154,31 @@ class MultipleKinectsDlg(QDialog, ui_multiplekinects.Ui_MultipleKinectsDialog):
                         self.set_osc_settings)
         self.load_settings(kinects)
         self.restore_gui()
+        if world is not None:
+            self.fusion_worker = FusionWorker(world, self.world_lock,
+                                              world_osc=world_osc,
+                                              target_fps=target_fps)
+            self.fusion_worker.start()
+        for index, ks in self.kinects.iteritems():
+            if (show_timings or send_timings) and \
+                    hasattr(ks['detector'], 'enable_timings'):
+                ks['detector'].enable_timings()
+            worker = DetectionWorker(index, ks, world=world,
+                                     world_lock=self.world_lock,
+                                     fusion_worker=self.fusion_worker,
+                                     show_timings=show_timings,
+                                     send_timings=send_timings,
+                                     target_fps=target_fps,
+                                     max_latency=max_latency)
+            worker.visible = index == self.current_tab
+            self.connect(worker, SIGNAL('snapshotReady(int)'),
+                         self.show_snapshot)
+            ks['worker'] = worker
+            # placeholder tabs can't be enabled
+            ks['widgets']['enable_kinect_cb'].setEnabled(worker.supported)
         #self.kinects[0]['widgets']['enable_kinect_cb'].setChecked(True)
-        self.startTimer(35)
+        for index, ks in self.kinects.iteritems():
+            ks['worker'].start()
 
     def load_settings(self, kinects):
         the_settings = dict()
@@ -143,6 +207,10 @@ class MultipleKinectsDlg(QDialog, ui_multiplekinects.Ui_MultipleKinectsDialog):
                 'osc_server_port' : osc_client_port,
                 'osc_communicator' : OSCCommunicator(client_ip=osc_client_ip, client_port=osc_client_port),
             })
+            # settings saved when the blob sources were all 'blob_source'
+            if self.kinects[i]['base_image'] == 'blob_source':
+                self.kinects[i]['base_image'] = '%s_blob_source' % \
+                        self.kinects[i]['detection_method']
 
     def restore_gui(self):
         for index, ks in self.kinects.iteritems():
@@ -160,8 +228,11 @@ class MultipleKinectsDlg(QDialog, ui_multiplekinects.Ui_MultipleKinectsDialog):
             gui['overlay_centroids_cb'].setChecked(ks['overlay_centroids'])
             gui['overlay_boundaries_cb'].setChecked(ks['overlay_boundaries'])
 
-    def toggle_current_tab(self):
+    def toggle_current_tab(self, index=None):
         self.current_tab = self.kinects_tw.currentIndex()
+        for i, ks in self.kinects.iteritems():
+            if 'worker' in ks:
+                ks['worker'].visible = i == self.current_tab
 
     def _find_cb_b_index(self, cb, text):
         the_index = None
@@ -174,6 +245,8 @@ class MultipleKinectsDlg(QDialog, ui_multiplekinects.Ui_MultipleKinectsDialog):
     def closeEvent(self, event):
         settings = QSettings()
         for index, ks in self.kinects.iteritems():
+            ks['worker'].stop()
+            ks['osc_communicator'].close()
             settings.setValue('kinect%i/status' % index, QVariant(ks['status']))
             settings.setValue('kinect%i/send_osc' % index, QVariant(ks['send_osc']))
             settings.setValue('kinect%i/send_osc_centroids_grid' % index, QVariant(ks['send_osc_centroids_grid']))
@@ -192,6 +265,10 @@ class MultipleKinectsDlg(QDialog, ui_multiplekinects.Ui_MultipleKinectsDialog):
                               QVariant(ks['osc_server_ip']))
             settings.setValue('kinect%i/osc_server_port' % index,
                               QVariant(ks['osc_server_port']))
+        if self.fusion_worker is not None:
+            self.fusion_worker.stop()
+        if self.world_osc is not None:
+            self.world_osc.close()
 
     def set_osc_settings(self):
         index, s = self._get_index_settings()
@@ -203,13 +280,12 @@ class MultipleKinectsDlg(QDialog, ui_multiplekinects.Ui_MultipleKinectsDialog):
             client_port = dialog.osc_server_port_le.text()
             s['osc_server_ip'] = client_ip
             s['osc_server_port'] = client_port
-            settings['osc_communicator'] = OSCCommunicator(
-                client_ip=client_ip,
-                client_port=client_port
-            )
+            # the worker replaces the communicator it is sending with
+            s['worker'].set_osc_client(str(client_ip), int(client_port))
 
     def toggle_enable_kinect(self, toggled):
         index, settings = self._get_index_settings()
+        # the kinect's worker starts or stops capturing before its next frame
         settings['status'] = settings['widgets']['enable_kinect_cb'].isChecked()
 
     def toggle_send_osc(self, toggled):
@@ -245,80 +321,56 @@ class MultipleKinectsDlg(QDialog, ui_multiplekinects.Ui_MultipleKinectsDialog):
         index, settings = self._get_index_settings()
         settings['overlay_boundaries'] = settings['widgets']['overlay_boundaries_cb'].isChecked()
 
-    def timerEvent(self, event):
-        current_page = self.kinects_tw.currentIndex()
-        for index, ks in self.kinects.iteritems():
-            if ks['status']:
-                kinect = ks['detector']
-                #kinect.capture(image=True, depth=True)
-                kinect.capture(image=True) # just for testing
-                process_centroids = False
-                process_boundaries = False
-                if ks['overlay_centroids'] or ks['base_image'] in ('centroids_grid_xy',
-                        'centroids_grid_xz'):
-                    process_centroids = True
-                if ks['overlay_boundaries'] or ks['base_image'] in \
-                        ('boundaries_grid_xy', 'boundaries_grid_xz'):
-                    process_boundaries = True
-                kinect.detect(mode=ks['detection_method'], 
-                              centroids=process_centroids,
-                              boundaries=process_boundaries)
-                results = kinect.get_results()
-                if ks['send_osc']:
-                    kinect.send_osc_messages(ks['osc_communicator'])
-                if index == current_page:
-                    self.update_display(ks, results)
-
-    def update_display(self, settings, results):
-        to_display = results[str(settings['base_image'])]
-        the_label = settings['widgets']['base_image_lab']
-        if to_display is not None:
-            pixmap = self._update_base_image(to_display)
-            if settings['overlay_blobs'] and results['blobs'] is not None:
-                self._draw_blobs(results['blobs'], pixmap)
-            if settings['overlay_centroids']:
-                self._draw_centroids(results['centroids'], pixmap)
-            if settings['overlay_boundaries']:
-                self._draw_boundaries(results['boundaries'], pixmap)
-            the_label.setPixmap(pixmap)
-
-    def _update_base_image(self, image):
-        qim = QImage(image.toString(), image.width, image.height, 
-                     3*image.width, QImage.Format_RGB888)
-        return QPixmap.fromImage(qim)
-
-    def _draw_blobs(self, blobs, pixmap, color=QColor(255, 0, 0, 100)):
-        brush = QBrush(color)
-        self.painter.begin(pixmap)
-        self.painter.setPen(color)
-        self.painter.setBrush(brush)
-        for b in blobs:
-            pol = QPolygon([QPoint(pt[0], pt[1]) for pt in b.contour()])
-            self.painter.drawPolygon(pol)
-        self.painter.end()
-
-    def _draw_centroids(self, centroids, pixmap,
-                        color=QColor(0, 255, 0, 100),
-                        size=5):
-        brush = QBrush(color)
-        self.painter.begin(pixmap)
+    def scheduler_report(self):
+        '''
+        Return the achieved fps, latencies and skipped frames of each
+        kinect, see detectionthreads.DetectionWorker.report().
+        '''
+
+        return dict((index, ks['worker'].report()) for index, ks in \
+                    self.kinects.iteritems())
+
+    def show_snapshot(self, index):
+        '''
+        Paint the newest snapshot of a kinect's worker, see
+        detectionthreads.DetectionWorker.
+        '''
+
+        settings = self.kinects[index]
+        snapshot = settings['worker'].take_snapshot()
+        if snapshot is None or index != self.current_tab:
+            return
+        pixmap = QPixmap.fromImage(snapshot['image'])
+        if snapshot['timings'] is not None:
+            self.painter.begin(pixmap)
+            self._draw_timings(snapshot['timings'], snapshot['schedule'])
+            self.painter.end()
+        settings['widgets']['base_image_lab'].setPixmap(pixmap)
+
+    def _draw_timings(self, summary, schedule=None,
+                      color=QColor(255, 255, 255),
+                      background=QColor(0, 0, 0, 150)):
+        '''
+        Draw the timings with the active painter.
+        '''
+
+        lines = format_summary(summary)
+        if schedule is not None and schedule['fps'] is not None:
+            lines.insert(0, '%5.1f fps  %i skipped  latency %.0f ms' % (
+                         schedule['fps'], schedule['skipped'],
+                         (schedule['last_latency'] or 0) * 1000))
+        if len(lines) == 0:
+            return
+        self.painter.setFont(QFont('Monospace', 8))
+        metrics = self.painter.fontMetrics()
+        line_height = metrics.height()
+        width = max(metrics.width(l) for l in lines) + 10
+        self.painter.fillRect(0, 0, width, line_height * len(lines) + 10,
+                              background)
         self.painter.setPen(color)
-        self.painter.setBrush(brush)
-        for c in centroids:
-            self.painter.drawEllipse(QPoint(c[0], c[1]), size, size)
-        self.painter.end()
-
-    def _draw_boundaries(self, boundaries, pixmap,
-                         color=QColor(0, 0, 255, 100),
-                         size=3):
-        brush = QBrush(color)
-        self.painter.begin(pixmap)
-        self.painter.setPen(color)
-        self.painter.setBrush(brush)
-        for b in boundaries:
-            for pt in b:
-                self.painter.drawEllipse(QPoint(pt[0], pt[1]), size, size)
-        self.painter.end()
+        for i, line in enumerate(lines):
+            self.painter.drawText(5, 5 + metrics.ascent() + i * line_height,
+                                  line)
 
     def add_tab(self, name, index):
         t = QWidget()
@@ -409,18 +461,49 @@ def test_data():
     k1 = DummyKinect(1)
     return [k0, k1]
 
+def process_data(num_devices):
+    '''
+    Return a ProcessDetector for each device, so that each kinect is
+    captured and detected in its own worker process.
+    '''
+
+    return [workers.ProcessDetector(i) for i in range(num_devices)]
+
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     app.setOrganizationName('rixilva')
     app.setOrganizationDomain('rixilva.pt')
     app.setApplicationName('Kinect Detection')
     #kinects = detection.Detector.detect_kinects()
-    kinects = test_data() # just for testing
+    if '--config' in sys.argv:
+        # view the devices of a headless service config
+        import service
+        config_path = sys.argv[sys.argv.index('--config') + 1]
+        config = service.load_config(config_path)
+        kinects = [d for c, d in service.enumerate_devices(config)]
+    elif '--processes' in sys.argv:
+        num_devices = int(sys.argv[sys.argv.index('--processes') + 1])
+        kinects = process_data(num_devices)
+    else:
+        kinects = test_data() # just for testing
     if len(kinects) == 0:
         box = QMessageBox()
         box.setText('No Kinects have been detected.')
         box.exec_()
         raise SystemExit
-    dlg = MultipleKinectsDlg(kinects=kinects)
+    world = None
+    world_osc = None
+    if '--fusion' in sys.argv:
+        extrinsics_path = sys.argv[sys.argv.index('--fusion') + 1]
+        world = fusion.Fusion(fusion.load_extrinsics(extrinsics_path),
+                              point_clouds='--fusion-clouds' in sys.argv)
+        if '--fusion-osc' in sys.argv:
+            address = sys.argv[sys.argv.index('--fusion-osc') + 1]
+            host, port = address.split(':')
+            world_osc = OSCCommunicator(client_ip=host, client_port=int(port))
+    dlg = MultipleKinectsDlg(kinects=kinects,
+                             show_timings='--timings' in sys.argv,
+                             send_timings='--osc-timings' in sys.argv,
+                             world=world, world_osc=world_osc)
     dlg.show()
     sys.exit(app.exec_())
@@ -2,12 +2,32 @@ import SimpleCV as scv
 import freenect
 import time
 import numpy as np
+from framepool import DepthConverter, DEPTH_8BIT_LUT, DEPTH_MM_LUT
 
 class Kinect(scv.Kinect):
 
-    def  __init__(self, device_number=0):
+    DEPTH_SHAPE = (480, 640)
+
+    def  __init__(self, device_number=0, pool_size=None):
+        '''
+        Inputs:
+
+            device_number - The number of the kinect device to use.
+
+            pool_size - An integer with the number of preallocated buffers
+                to use for the depth frames, or None. If None (the default)
+                each depth frame is a newly allocated array.
+        '''
+
         scv.Kinect.__init__(self)
         self.device_number = device_number
+        self.depth_converter = None
+        self.metric_converter = None
+        self.pool_size = pool_size
+        if pool_size is not None:
+            self.depth_converter = DepthConverter(DEPTH_8BIT_LUT,
+                                                  self.DEPTH_SHAPE,
+                                                  pool_size=pool_size)
 
     def getImage(self):
         """
@@ -45,8 +65,16 @@ class Kinect(scv.Kinect):
         >>>   img = k.getImage()
         >>>   result = img.sideBySide(d)
         >>>   result.show()
+
+        With a depth pool the frame is converted like getDepthArray() does,
+        but SimpleCV.Image still copies the pooled buffer, so this costs one
+        copy per frame. The copy is what keeps the image valid after the
+        pool wraps around, e.g. when it is grabbed by a capture thread. Use
+        getDepthArray() to avoid it.
         """
 
+        if self.depth_converter is not None:
+            return scv.Image(self.getDepthArray(), self)
         depth = freenect.sync_get_depth(self.device_number)[0]
         self.capturetime = time.time()
         np.clip(depth, 0, 2**10 - 1, depth)
@@ -54,6 +82,52 @@ class Kinect(scv.Kinect):
         depth = depth.astype(np.uint8).transpose()
         return scv.Image(depth, self) 
 
+    def getDepthArray(self):
+        '''
+        Return the kinect's depth as an 8 bit numpy array.
+
+        The raw frame is mapped through a lookup table straight into one of
+        the buffers of the depth pool and a transposed view of that buffer is
+        returned, so no memory is allocated per frame. The view is indexed
+        [x, y], like the arrays used by SimpleCV. It is only valid until the
+        pool wraps around, after `pool_size` more frames.
+        '''
+
+        if self.depth_converter is None:
+            self.depth_converter = DepthConverter(DEPTH_8BIT_LUT,
+                                                  self.DEPTH_SHAPE)
+        raw = freenect.sync_get_depth(self.device_number)[0]
+        self.capturetime = time.time()
+        return self.depth_converter.convert(raw).transpose()
+
+    def getMetricDepthArray(self):
+        '''
+        Return the kinect's depth in millimetres, as a uint16 numpy array
+        indexed [x, y].
+
+        The raw 11 bit frame is mapped through framepool.DEPTH_MM_LUT into
+        a preallocated buffer, like getDepthArray() does, so it costs the
+        same per frame. Pixels without a valid reading are 0.
+        '''
+
+        if self.metric_converter is None:
+            self.metric_converter = DepthConverter(
+                DEPTH_MM_LUT, self.DEPTH_SHAPE,
+                pool_size=self.pool_size or 3)
+        raw = freenect.sync_get_depth(self.device_number)[0]
+        self.capturetime = time.time()
+        return self.metric_converter.convert(raw).transpose()
+
+    def getImageMatrix(self):
+        '''
+        Return the kinect's RGB image as the (480, 640, 3) array returned by
+        freenect.
+        '''
+
+        video = freenect.sync_get_video(self.device_number)[0]
+        self.capturetime = time.time()
+        return video
+
     #we're going to also support a higher-resolution (11-bit) depth matrix
     #if you want to actually do computations with the depth
     def getDepthMatrix(self):
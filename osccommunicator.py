@@ -1,11 +1,274 @@
 import OSC
+import time
 import socket
+import threading
+from collections import deque
+
+# the largest UDP payload that fits in a 1500 bytes ethernet frame
+MAX_DATAGRAM_SIZE = 1472
+
+# what OSCSenderThread does with messages that don't fit in its queue
+DROP_POLICIES = ('drop_oldest', 'coalesce')
+
+# every bundle starts with the '#bundle' string and an 8 byte timetag
+BUNDLE_HEADER_SIZE = 16
+
+
+def _osc_value(value):
+    '''
+    Convert numpy scalars to the python types that OSC messages know about.
+    '''
+
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+class OSCFrame(object):
+    '''
+    The OSC messages describing a single frame.
+
+    Messages are encoded as they are added and sent together, packed in as
+    few bundles as fit in a datagram.
+    '''
+
+    def __init__(self, capturetime=None):
+        '''
+        Inputs:
+
+            capturetime - The time the frame was captured, in seconds since
+                the epoch. It is used as the timetag of the bundles. If None
+                (the default) the bundles are tagged to be processed
+                immediately.
+        '''
+
+        self.capturetime = capturetime
+        self.messages = []
+
+    def __len__(self):
+        return len(self.messages)
+
+    def add_message(self, address, *values):
+        message = OSC.OSCMessage(address)
+        for v in values:
+            message.append(_osc_value(v))
+        self.messages.append(message.getBinary())
+
+    def add_centroids(self, centroids, base_address='/kinect/centroids'):
+        '''
+        Add a message with the (x, z, y) coordinates of each centroid.
+        '''
+
+        for index, c in enumerate(centroids or []):
+            self.add_message('%s/%i' % (base_address, index), *c)
+
+    def add_boundaries(self, boundaries, base_address='/kinect/boundaries'):
+        '''
+        Add a message for each boundary, with the (x, z, y) coordinates of
+        all its points one after the other.
+        '''
+
+        for index, boundary in enumerate(boundaries or []):
+            values = [v for pt in boundary for v in pt]
+            self.add_message('%s/%i' % (base_address, index), *values)
+
+    def add_actors(self, actors, base_address='/kinect/actors'):
+        '''
+        Add a message with the location and velocity of each actor.
+        '''
+
+        for index, actor in enumerate(actors or []):
+            values = list(actor.location) + list(actor.velocity)
+            self.add_message('%s/%i' % (base_address, index), *values)
+
+    def add_timings(self, summary, base_address='/kinect/timings'):
+        '''
+        Add a message for each stage of an instrumentation summary, with
+        its p50, p95 and p99 durations in milliseconds.
+        '''
+
+        for name in sorted((summary or {}).keys()):
+            stats = summary[name]
+            self.add_message('%s/%s' % (base_address, name), stats['p50'],
+                             stats['p95'], stats['p99'])
+
+    def datagrams(self, max_size=MAX_DATAGRAM_SIZE):
+        '''
+        Pack the messages in bundles.
+
+        Inputs:
+
+            max_size - The largest size of a bundle, in bytes. A message
+                that doesn't fit in a bundle of this size on its own is
+                still sent, alone in its bundle.
+
+        Returns: A list with the binary bundles.
+        '''
+
+        timetag = self.capturetime or 0
+        header = OSC.OSCString('#bundle') + OSC.OSCTimeTag(timetag)
+        datagrams = []
+        elements = []
+        size = BUNDLE_HEADER_SIZE
+        for binary in self.messages:
+            element = OSC.OSCBlob(binary)
+            if len(elements) > 0 and size + len(element) > max_size:
+                datagrams.append(header + b''.join(elements))
+                elements = []
+                size = BUNDLE_HEADER_SIZE
+            elements.append(element)
+            size += len(element)
+        if len(elements) > 0:
+            datagrams.append(header + b''.join(elements))
+        return datagrams
+
+
+class OSCSendStats(object):
+
+    def __init__(self):
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.last_latency = None
+        self.max_latency = None
+        self.total_latency = 0.0
+
+    def mean_latency(self):
+        if self.sent == 0:
+            return None
+        return self.total_latency / self.sent
+
+    def as_dict(self):
+        return {
+            'queued' : self.queued,
+            'sent' : self.sent,
+            'dropped' : self.dropped,
+            'coalesced' : self.coalesced,
+            'errors' : self.errors,
+            'last_latency' : self.last_latency,
+            'mean_latency' : self.mean_latency(),
+            'max_latency' : self.max_latency,
+        }
+
+
+class OSCSenderThread(threading.Thread):
+    '''
+    A daemon thread that sends queued OSC datagrams, so that a slow or
+    unreachable receiver never blocks the caller.
+
+    The queue is bounded. When it is full the oldest entry is dropped. With
+    the 'coalesce' policy a new entry also replaces a queued entry with the
+    same key, so only the newest value of each OSC address (or frame) is
+    sent.
+    '''
+
+    def __init__(self, sock, max_queue=64, policy='drop_oldest'):
+        '''
+        Inputs:
+
+            sock - A connected UDP socket.
+
+            max_queue - The largest number of entries waiting to be sent.
+
+            policy - One of DROP_POLICIES.
+        '''
+
+        if policy not in DROP_POLICIES:
+            raise ValueError('Unknown drop policy: %s' % policy)
+        super(OSCSenderThread, self).__init__()
+        self.daemon = True
+        self.socket = sock
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue = deque()
+        self.pending = dict()
+        self.condition = threading.Condition()
+        self.stats = OSCSendStats()
+        self._stopped = False
+
+    def put(self, key, datagrams):
+        '''
+        Queue a list of binary datagrams to be sent together.
+
+        Inputs:
+
+            key - The OSC address or frame the datagrams belong to, used by
+                the 'coalesce' policy.
+
+            datagrams - A list of binary OSC messages or bundles.
+        '''
+
+        with self.condition:
+            stats = self.stats
+            stats.queued += 1
+            if self.policy == 'coalesce' and key in self.pending:
+                entry = self.pending[key]
+                entry[1] = datagrams
+                entry[2] = time.time()
+                stats.coalesced += 1
+                return
+            if len(self.queue) >= self.max_queue:
+                oldest = self.queue.popleft()
+                if self.pending.get(oldest[0]) is oldest:
+                    del self.pending[oldest[0]]
+                stats.dropped += 1
+            entry = [key, datagrams, time.time()]
+            self.queue.append(entry)
+            if self.policy == 'coalesce':
+                self.pending[key] = entry
+            self.condition.notify()
+
+    def _take(self):
+        with self.condition:
+            while len(self.queue) == 0 and not self._stopped:
+                self.condition.wait()
+            if self._stopped:
+                return None
+            entry = self.queue.popleft()
+            if self.pending.get(entry[0]) is entry:
+                del self.pending[entry[0]]
+            return entry
+
+    def run(self):
+        while True:
+            entry = self._take()
+            if entry is None:
+                break
+            key, datagrams, queued_time = entry
+            try:
+                for d in datagrams:
+                    self.socket.send(d)
+            except socket.error:
+                self.stats.errors += 1
+                continue
+            latency = time.time() - queued_time
+            stats = self.stats
+            stats.sent += 1
+            stats.last_latency = latency
+            stats.total_latency += latency
+            if stats.max_latency is None or latency > stats.max_latency:
+                stats.max_latency = latency
+
+    def stop(self, timeout=1.0):
+        '''
+        Stop the thread. Entries still in the queue are discarded.
+        '''
+
+        with self.condition:
+            self._stopped = True
+            self.condition.notify()
+        if self.is_alive():
+            self.join(timeout)
+
 
 class OSCCommunicator(object):
 
     def __init__(self, client_ip, server_ip=None,
                  server_port=9000, client_port=8000,
-                 send_OSC=True):
+                 send_OSC=True, threaded=True, max_queue=64,
+                 drop_policy='drop_oldest'):
         '''
         Inputs:
 
@@ -19,6 +282,15 @@ class OSCCommunicator(object):
 
             client_port - An integer specifying the port number of the
                 machine that will receive our sent OSC messages.
+
+            threaded - A boolean indicating if messages are sent by a
+                background OSCSenderThread. If False they are sent before
+                the send methods return.
+
+            max_queue - The size of the background thread's queue.
+
+            drop_policy - What the background thread does when it can't keep
+                up, one of DROP_POLICIES.
         '''
 
         if server_ip is None:
@@ -31,6 +303,12 @@ class OSCCommunicator(object):
         self.client = OSC.OSCClient()
         self.client.connect((client_ip, client_port))
         self.send_OSC = send_OSC
+        self.sender = None
+        if threaded:
+            self.sender = OSCSenderThread(self.client.socket,
+                                          max_queue=max_queue,
+                                          policy=drop_policy)
+            self.sender.start()
 
     def _find_own_ip(self, client_ip):
         '''
@@ -55,7 +333,69 @@ class OSCCommunicator(object):
         message = OSC.OSCMessage(address)
         for v in values:
             message.append(v)
-        self.client.send(message)
+        self._send(address, [message.getBinary()])
+
+    def _send(self, key, datagrams):
+        if self.sender is not None:
+            self.sender.put(key, datagrams)
+            return
+        try:
+            for d in datagrams:
+                self.client.socket.send(d)
+        except socket.error as e:
+            raise OSC.OSCClientError('while sending: %s' % e)
+
+    def stats(self):
+        '''
+        Return the OSCSendStats of the background sender thread or None.
+        '''
+
+        if self.sender is None:
+            return None
+        return self.sender.stats
+
+    def close(self):
+        if self.sender is not None:
+            self.sender.stop()
+            self.sender = None
+        self.server.close()
+
+    def frame(self, capturetime=None):
+        return OSCFrame(capturetime)
+
+    def send_frame(self, frame, max_size=MAX_DATAGRAM_SIZE):
+        '''
+        Send all the messages of an OSCFrame, with one send per bundle.
+
+        Returns: The number of datagrams sent, or queued to be sent.
+        '''
+
+        datagrams = frame.datagrams(max_size)
+        self._send('#bundle', datagrams)
+        return len(datagrams)
+
+    def send_results(self, results, actors=None):
+        '''
+        Send the centroids and boundaries of a detector's results, and the
+        actors if given, as the bundles of a single frame.
+
+        Inputs:
+
+            results - A dictionary like the ones returned by
+                Detector.get_results(). If it has 'timings', a timing
+                summary, it is sent too.
+
+            actors - A list of tracking.Actor or None.
+
+        Returns: The number of datagrams sent, or queued to be sent.
+        '''
+
+        frame = self.frame(results.get('capturetime'))
+        frame.add_centroids(results.get('centroids'))
+        frame.add_boundaries(results.get('boundaries'))
+        frame.add_actors(actors)
+        frame.add_timings(results.get('timings'))
+        return self.send_frame(frame)
 
     def _print_msg(self, address, tags, data, client_address):
         print('address: %s' % address)
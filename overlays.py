@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Batched drawing of the detection overlays.
+
+Each overlay layer is built from numpy arrays into a single Qt primitive: a
+QPainterPath with the outline of every blob and QPolygonFs with every
+centroid and every boundary point, which are drawn with one drawPoints()
+call each.
+'''
+
+import numpy as np
+from PyQt4.QtCore import Qt, QPointF
+from PyQt4.QtGui import QBrush, QColor, QPainterPath, QPen, QPolygonF
+
+
+def points_to_polygon(points):
+    '''
+    Return a QPolygonF with the (x, y) of the first two columns of an
+    (N, 2+) array, written straight into the polygon's memory.
+    '''
+
+    points = np.asarray(points, dtype=np.float64)
+    polygon = QPolygonF(len(points))
+    if len(points) == 0:
+        return polygon
+    try:
+        pointer = polygon.data()
+        pointer.setsize(len(points) * 2 * 8)
+        memory = np.frombuffer(pointer, dtype=np.float64)
+    except (AttributeError, TypeError):
+        return QPolygonF([QPointF(x, y) for x, y in points[:, :2]])
+    memory.reshape(-1, 2)[...] = points[:, :2]
+    return polygon
+
+
+class OverlayRenderer(object):
+    '''
+    Draws the blobs, centroids and boundaries of a detector's results.
+    '''
+
+    def __init__(self, blob_color=QColor(255, 0, 0, 100),
+                 centroid_color=QColor(0, 255, 0, 100), centroid_size=5,
+                 boundary_color=QColor(0, 0, 255, 100), boundary_size=3):
+        '''
+        Inputs:
+
+            blob_color, centroid_color, boundary_color - The colour of each
+                layer.
+
+            centroid_size, boundary_size - The radius of the centroids and
+                of the boundary points.
+        '''
+
+        self.blob_brush = QBrush(blob_color)
+        self.blob_pen = QPen(blob_color)
+        self.centroid_pen = self._point_pen(centroid_color, centroid_size)
+        self.boundary_pen = self._point_pen(boundary_color, boundary_size)
+
+    def _point_pen(self, color, radius):
+        pen = QPen(color)
+        pen.setWidthF(2.0 * radius)
+        pen.setCapStyle(Qt.RoundCap)
+        return pen
+
+    def _build_blobs(self, blobs):
+        path = QPainterPath()
+        path.setFillRule(Qt.WindingFill)
+        for b in blobs:
+            contour = np.asarray(b.contour(), dtype=np.float64)
+            if len(contour) > 2:
+                path.addPolygon(points_to_polygon(contour))
+                path.closeSubpath()
+        return path
+
+    def _build_centroids(self, centroids):
+        return points_to_polygon(np.asarray(centroids).reshape(-1, 3))
+
+    def _build_boundaries(self, boundaries):
+        points = [np.asarray(b, dtype=np.float64).reshape(-1, 3) for b in \
+                  boundaries]
+        if len(points) == 0:
+            return QPolygonF()
+        return points_to_polygon(np.concatenate(points))
+
+    def draw(self, painter, results, blobs=True, centroids=True,
+             boundaries=True, origin=(0, 0)):
+        '''
+        Draw the chosen layers with an active painter.
+
+        Inputs:
+
+            painter - A QPainter that has begun painting.
+
+            results - A dictionary with the 'blobs', 'centroids' and
+                'boundaries', like the ones returned by
+                Detector.get_results(). Blobs are placed at the results'
+                'blobs_offset', if any, which is where a region of interest
+                starts.
+
+            blobs, centroids, boundaries - Booleans indicating which layers
+                are drawn.
+
+            origin - The frame coordinates of the painted image's top left
+                corner, e.g. the 'blobs_offset' for images cropped to a
+                region of interest.
+        '''
+
+        painter.save()
+        painter.translate(-origin[0], -origin[1])
+        if blobs and results.get('blobs') is not None:
+            path = self._build_blobs(results['blobs'])
+            offset = results.get('blobs_offset') or (0, 0)
+            painter.save()
+            painter.translate(offset[0], offset[1])
+            painter.setPen(self.blob_pen)
+            painter.setBrush(self.blob_brush)
+            painter.drawPath(path)
+            painter.restore()
+        if centroids and results.get('centroids') is not None:
+            polygon = self._build_centroids(results['centroids'])
+            painter.setPen(self.centroid_pen)
+            painter.drawPoints(polygon)
+        if boundaries and results.get('boundaries') is not None:
+            polygon = self._build_boundaries(results['boundaries'])
+            painter.setPen(self.boundary_pen)
+            painter.drawPoints(polygon)
+        painter.restore()
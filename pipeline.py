@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Lazily computed entries for the Detector's image pipeline.
+
+Producing some of the pipeline's images, like the grid images, is costly
+and most frames only a few of them are looked at. Those entries are stored
+as LazyValues, which a LazyPipeline computes the first time they are read.
+'''
+
+
+class LazyValue(object):
+    '''
+    A value computed by calling a function the first time it is needed.
+
+    The result is kept, so copies of a pipeline holding the same LazyValue
+    only compute it once.
+    '''
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+        self.computed = False
+        self.value = None
+
+    def get(self):
+        if not self.computed:
+            self.value = self.function(*self.args)
+            self.computed = True
+            self.function = None
+            self.args = None
+        return self.value
+
+
+class LazyPipeline(dict):
+    '''
+    A dictionary that computes its LazyValues when they are read.
+
+    Reading an entry with [], get(), pop(), setdefault(), items() or
+    values() returns the computed value. Copying the pipeline with copy(),
+    dict.update() or dict() copies the LazyValues themselves, so nothing is
+    computed.
+    '''
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, LazyValue):
+            value = value.get()
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def copy(self):
+        return LazyPipeline(self)
+
+    def pop(self, key, *default):
+        value = dict.pop(self, key, *default)
+        if isinstance(value, LazyValue):
+            value = value.get()
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        if isinstance(value, LazyValue):
+            value = value.get()
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            dict.__setitem__(self, key, default)
+        return self[key]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def iteritems(self):
+        for k in list(self.keys()):
+            yield k, self[k]
+
+    def itervalues(self):
+        for k in list(self.keys()):
+            yield self[k]
+
+    def is_computed(self, key):
+        '''
+        Return False if the entry is a LazyValue that has not been computed
+        yet, True otherwise.
+        '''
+
+        value = dict.__getitem__(self, key)
+        return not isinstance(value, LazyValue) or value.computed
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Projection of depth frames into 3D point clouds.
+
+Each pixel of the depth camera looks along a ray. Ray tables hold, for every
+pixel, the x and y of that ray at a distance of 1, so projecting a pixel is
+multiplying them by its distance. The tables are computed once per device and
+resolution and shared by every PointCloud that uses them.
+
+Points are (x, y, z) in metres in the camera's frame: x grows to the right of
+the image, y down the image and z away from the sensor. Depth frames are in
+millimetres, like mykinect.Kinect.getMetricDepthArray() returns them, and
+arrays follow SimpleCV's convention and are indexed [x, y].
+'''
+
+import numpy as np
+
+
+class DepthIntrinsics(object):
+    '''
+    The pinhole model of a depth camera.
+    '''
+
+    def __init__(self, fx, fy, cx, cy, size=(640, 480)):
+        '''
+        Inputs:
+
+            fx, fy - The focal lengths, in pixels.
+
+            cx, cy - The principal point, in pixels.
+
+            size - The (width, height) of the frames the values are given
+                for.
+        '''
+
+        self.fx = float(fx)
+        self.fy = float(fy)
+        self.cx = float(cx)
+        self.cy = float(cy)
+        self.size = tuple(size)
+
+    def scaled(self, size):
+        '''
+        Return the intrinsics for frames of another (width, height).
+        '''
+
+        sx = float(size[0]) / self.size[0]
+        sy = float(size[1]) / self.size[1]
+        return DepthIntrinsics(self.fx * sx, self.fy * sy,
+                               (self.cx + 0.5) * sx - 0.5,
+                               (self.cy + 0.5) * sy - 0.5, size)
+
+    def key(self):
+        return (self.fx, self.fy, self.cx, self.cy, self.size)
+
+
+# the usual calibration of the kinect's depth camera
+KINECT_DEPTH_INTRINSICS = DepthIntrinsics(594.21, 591.04, 339.31, 242.74)
+
+
+class RayTables(object):
+    '''
+    The x and y of each pixel's ray at a distance of 1.
+
+    Both tables are float32 arrays indexed [x, y] that are transposed views
+    of (height, width) arrays, like the kinect's depth arrays.
+    '''
+
+    def __init__(self, intrinsics):
+        self.intrinsics = intrinsics
+        width, height = intrinsics.size
+        columns = (np.arange(width) - intrinsics.cx) / intrinsics.fx
+        lines = (np.arange(height) - intrinsics.cy) / intrinsics.fy
+        self.x = np.empty((height, width), dtype=np.float32).T
+        self.y = np.empty((height, width), dtype=np.float32).T
+        self.x[...] = columns[:, np.newaxis]
+        self.y[...] = lines[np.newaxis, :]
+        self.x.flags.writeable = False
+        self.y.flags.writeable = False
+
+
+_ray_tables = dict()
+
+
+def get_ray_tables(size=(640, 480), intrinsics=None, device_number=0):
+    '''
+    Return the RayTables of a device for frames of a given size, computing
+    them the first time they are asked for.
+
+    Inputs:
+
+        size - The (width, height) of the frames.
+
+        intrinsics - The DepthIntrinsics of the device. If None (the
+            default) KINECT_DEPTH_INTRINSICS is used. They are scaled to
+            size if they were given for another one.
+
+        device_number - The number of the device.
+    '''
+
+    if intrinsics is None:
+        intrinsics = KINECT_DEPTH_INTRINSICS
+    size = tuple(size)
+    if intrinsics.size != size:
+        intrinsics = intrinsics.scaled(size)
+    key = (device_number, size, intrinsics.key())
+    tables = _ray_tables.get(key)
+    if tables is None:
+        tables = _ray_tables[key] = RayTables(intrinsics)
+    return tables
+
+
+def _flat(array):
+    '''
+    Return a 1D view of an array indexed [x, y], in the memory order of the
+    transposed arrays used for frames, copying only arrays laid out
+    otherwise.
+    '''
+
+    return array.ravel(order='F')
+
+
+class PointCloud(object):
+    '''
+    Projects depth frames, or parts of them, into (N, 3) point clouds.
+
+    The points are written into a float32 buffer that is reused on every
+    call, so a returned cloud is only valid until the next projection;
+    copy it to keep it. A cloud is a transposed view of a (3, N) buffer:
+    each of its columns is contiguous.
+    '''
+
+    def __init__(self, size=(640, 480), intrinsics=None, device_number=0,
+                 scale=0.001):
+        '''
+        Inputs:
+
+            size - The (width, height) of the depth frames.
+
+            intrinsics, device_number - The depth camera, see
+                get_ray_tables().
+
+            scale - The factor that converts depth values to metres. The
+                default is for depth in millimetres.
+        '''
+
+        self.size = tuple(size)
+        self.scale = scale
+        self.rays = get_ray_tables(self.size, intrinsics, device_number)
+        self.buffer = np.empty((3, self.size[0] * self.size[1]),
+                               dtype=np.float32)
+        self._valid = np.empty(self.size[::-1], dtype=bool).T
+
+    def from_depth(self, depth, min_distance=None, max_distance=None):
+        '''
+        Project the pixels of a depth frame that have a reading.
+
+        Inputs:
+
+            depth - An array indexed [x, y] with the frame's size.
+
+            min_distance, max_distance - Optional limits, in metres, of the
+                depth of the projected pixels.
+
+        Returns: An (N, 3) float32 array with the points, in metres.
+        '''
+
+        depth = np.asarray(depth)
+        if depth.shape != self.size:
+            raise ValueError('The depth has shape %s, expected %s' %
+                             (depth.shape, self.size))
+        valid = np.greater(depth, 0, out=self._valid)
+        if min_distance is not None:
+            valid &= depth >= min_distance / self.scale
+        if max_distance is not None:
+            valid &= depth <= max_distance / self.scale
+        return self._project(depth, valid, self.rays.x, self.rays.y)
+
+    def from_mask(self, depth, mask, origin=(0, 0)):
+        '''
+        Project the pixels of a mask that have a reading.
+
+        Inputs:
+
+            depth - An array indexed [x, y] with the frame's size.
+
+            mask - A boolean array indexed [x, y], covering the part of the
+                frame that starts at origin, e.g. a blob's bounding box.
+
+            origin - The (x, y) of the mask's first pixel in the frame.
+
+        Returns: An (N, 3) float32 array with the points, in metres.
+        '''
+
+        mask = np.asarray(mask, dtype=bool)
+        x0, y0 = int(origin[0]), int(origin[1])
+        box = (slice(x0, x0 + mask.shape[0]), slice(y0, y0 + mask.shape[1]))
+        depth = np.asarray(depth)[box]
+        if depth.shape != mask.shape:
+            raise ValueError('The mask does not fit in the frame')
+        valid = mask & (depth > 0)
+        return self._project(depth, valid, self.rays.x[box],
+                             self.rays.y[box])
+
+    def from_blob(self, depth, blob, offset=(0, 0)):
+        '''
+        Project the pixels of a blob found by the ndimage or the pyramid
+        blob backends.
+
+        Inputs:
+
+            depth - An array indexed [x, y] with the frame's size.
+
+            blob - A blobs.LabeledBlob.
+
+            offset - The (x, y) position in the frame of the image where
+                the blob was found, e.g. a region of interest's offset.
+
+        Returns: An (N, 3) float32 array with the points, in metres.
+        '''
+
+        x, y, w, h = blob.boundingBox()
+        return self.from_mask(depth, blob.mask(),
+                              (x + offset[0], y + offset[1]))
+
+    def _project(self, depth, valid, rays_x, rays_y):
+        indexes = np.flatnonzero(_flat(valid))
+        num_points = len(indexes)
+        x, y, z = self.buffer[:, :num_points]
+        np.multiply(_flat(depth).take(indexes), self.scale, out=z)
+        np.take(_flat(rays_x), indexes, out=x)
+        x *= z
+        np.take(_flat(rays_y), indexes, out=y)
+        y *= z
+        return self.buffer[:, :num_points].T
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Record the kinect's frames to disk and replay them.
+
+A recording is a directory with:
+
+    meta.json - the shapes and dtypes of the frames;
+    depth.dat - the raw 11 bit depth frames, one after the other;
+    image.dat - the RGB frames, one after the other;
+    index.dat - one record per frame with its capturetime and the positions
+        of its depth and RGB frames (-1 when missing).
+
+All files are append-only, so a recording can be read while it is being
+written. They are read back as memory-mapped arrays, so replaying a frame
+does not copy it.
+'''
+
+import os
+import sys
+import json
+import time
+import numpy as np
+from framepool import DepthConverter, DEPTH_8BIT_LUT, DEPTH_MM_LUT
+
+try:
+    import SimpleCV as scv
+except ImportError:
+    scv = None
+
+INDEX_DTYPE = np.dtype([
+    ('capturetime', np.float64),
+    ('depth_frame', np.int64),
+    ('image_frame', np.int64),
+])
+
+
+class FrameRecorder(object):
+
+    def __init__(self, path, depth_shape=(480, 640), depth_dtype=np.uint16,
+                 image_shape=(480, 640, 3), image_dtype=np.uint8):
+        '''
+        Inputs:
+
+            path - The directory where the recording is written. It is
+                created if needed. Frames are appended to an existing
+                recording.
+
+            depth_shape, depth_dtype - The shape and dtype of the depth
+                frames, as returned by freenect.
+
+            image_shape, image_dtype - The shape and dtype of the RGB frames,
+                as returned by freenect.
+        '''
+
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.isfile(meta_path):
+            meta = _read_meta(path)
+        else:
+            meta = {
+                'depth_shape' : list(depth_shape),
+                'depth_dtype' : np.dtype(depth_dtype).str,
+                'image_shape' : list(image_shape),
+                'image_dtype' : np.dtype(image_dtype).str,
+            }
+            with open(meta_path, 'w') as fh:
+                json.dump(meta, fh)
+        self.meta = meta
+        self.depth_file = open(os.path.join(path, 'depth.dat'), 'ab')
+        self.image_file = open(os.path.join(path, 'image.dat'), 'ab')
+        self.index_file = open(os.path.join(path, 'index.dat'), 'ab')
+        self.depth_frames = self._num_frames(self.depth_file, 'depth')
+        self.image_frames = self._num_frames(self.image_file, 'image')
+        self.record = np.zeros(1, dtype=INDEX_DTYPE)
+
+    def _num_frames(self, fh, stream):
+        fh.seek(0, os.SEEK_END)
+        return fh.tell() // _frame_bytes(self.meta, stream)
+
+    def _append(self, fh, frame, stream):
+        frame = np.ascontiguousarray(frame,
+                                     dtype=self.meta['%s_dtype' % stream])
+        if list(frame.shape) != self.meta['%s_shape' % stream]:
+            raise ValueError('%s frame has shape %s, expected %s' %
+                             (stream, frame.shape,
+                              self.meta['%s_shape' % stream]))
+        frame.tofile(fh)
+
+    def add_frame(self, depth=None, image=None, capturetime=None):
+        '''
+        Append a frame to the recording.
+
+        Inputs:
+
+            depth - A numpy array with the raw depth or None.
+
+            image - A numpy array with the RGB image or None.
+
+            capturetime - The time the frame was captured. If None (the
+                default) the current time is used.
+        '''
+
+        record = self.record
+        record['capturetime'] = time.time() if capturetime is None else \
+                capturetime
+        record['depth_frame'] = -1
+        record['image_frame'] = -1
+        if depth is not None:
+            self._append(self.depth_file, depth, 'depth')
+            record['depth_frame'] = self.depth_frames
+            self.depth_frames += 1
+        if image is not None:
+            self._append(self.image_file, image, 'image')
+            record['image_frame'] = self.image_frames
+            self.image_frames += 1
+        # the frame data is flushed before its index record, so readers
+        # never see a record without its data
+        self.depth_file.flush()
+        self.image_file.flush()
+        self.record.tofile(self.index_file)
+        self.index_file.flush()
+
+    def close(self):
+        for fh in (self.depth_file, self.image_file, self.index_file):
+            fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _read_meta(path):
+    with open(os.path.join(path, 'meta.json')) as fh:
+        return json.load(fh)
+
+
+def _frame_bytes(meta, stream):
+    shape = meta['%s_shape' % stream]
+    return int(np.prod(shape)) * np.dtype(meta['%s_dtype' % stream]).itemsize
+
+
+def _memmap(path, meta, stream):
+    '''
+    Return a read-only memory map with the complete frames of a stream.
+    '''
+
+    file_path = os.path.join(path, '%s.dat' % stream)
+    shape = tuple(meta['%s_shape' % stream])
+    num_frames = 0
+    if os.path.isfile(file_path):
+        num_frames = os.path.getsize(file_path) // _frame_bytes(meta, stream)
+    if num_frames == 0:
+        return np.zeros((0,) + shape, dtype=meta['%s_dtype' % stream])
+    return np.memmap(file_path, dtype=meta['%s_dtype' % stream], mode='r',
+                     shape=(num_frames,) + shape)
+
+
+class FrameRecording(object):
+    '''
+    A recording opened for reading.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = _read_meta(path)
+        self.reload()
+
+    def reload(self):
+        '''
+        Map the frames that have been written so far.
+        '''
+
+        index_path = os.path.join(self.path, 'index.dat')
+        num_records = 0
+        if os.path.isfile(index_path):
+            num_records = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+        if num_records > 0:
+            self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r',
+                                   shape=(num_records,))
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        self.depth = _memmap(self.path, self.meta, 'depth')
+        self.image = _memmap(self.path, self.meta, 'image')
+
+    def __len__(self):
+        return len(self.index)
+
+    def frame(self, number):
+        '''
+        Return a tuple (capturetime, depth, image) for a frame.
+
+        depth and image are read-only views into the memory-mapped files,
+        or None when the frame does not have them.
+        '''
+
+        record = self.index[number]
+        depth = image = None
+        if record['depth_frame'] >= 0:
+            depth = self.depth[record['depth_frame']]
+        if record['image_frame'] >= 0:
+            image = self.image[record['image_frame']]
+        return float(record['capturetime']), depth, image
+
+
+class ReplayKinect(object):
+    '''
+    A drop-in replacement for mykinect.Kinect that replays a recording.
+
+    getDepth() and getImage() called for the same frame return the same
+    recorded frame; asking again for a stream that was already served moves
+    on to the next frame.
+    '''
+
+    def __init__(self, path, device_number=0, realtime=True, loop=True,
+                 pool_size=3):
+        '''
+        Inputs:
+
+            path - The directory with the recording.
+
+            device_number - The device number reported by this kinect.
+
+            realtime - A boolean indicating if frames are served at the
+                recorded speed. If False they are served as fast as they
+                are asked for.
+
+            loop - A boolean indicating if the replay starts over after the
+                last frame. If False, EOFError is raised instead.
+
+            pool_size - The number of buffers used for the 8 bit and the
+                metric depth.
+        '''
+
+        self.recording = FrameRecording(path)
+        if len(self.recording) == 0:
+            raise ValueError('The recording at %s has no frames' % path)
+        self.device_number = device_number
+        self.realtime = realtime
+        self.loop = loop
+        self.depth_converter = DepthConverter(
+            DEPTH_8BIT_LUT, tuple(self.recording.meta['depth_shape']),
+            pool_size=pool_size)
+        self.metric_converter = DepthConverter(
+            DEPTH_MM_LUT, tuple(self.recording.meta['depth_shape']),
+            pool_size=pool_size)
+        self.position = -1
+        self.served = set()
+        self._current = None
+        self.start_time = None
+        self.start_capturetime = None
+        self.capturetime = None
+        self.recorded_capturetime = None
+
+    def _frame(self, stream):
+        if self.position < 0 or stream in self.served:
+            self._advance()
+        self.served.add(stream)
+        return self._current
+
+    def _advance(self):
+        self.position += 1
+        if self.position >= len(self.recording):
+            if not self.loop:
+                raise EOFError('End of the recording')
+            self.position = 0
+            self.start_time = None
+        self.served = set()
+        self._current = self.recording.frame(self.position)
+        recorded = self._current[0]
+        if self.realtime:
+            now = time.time()
+            if self.start_time is None:
+                self.start_time = now
+                self.start_capturetime = recorded
+            delay = (recorded - self.start_capturetime) - \
+                    (now - self.start_time)
+            if delay > 0:
+                time.sleep(delay)
+        self.recorded_capturetime = recorded
+        self.capturetime = time.time()
+
+    def getDepthMatrix(self):
+        '''
+        Return the raw 11 bit depth, as a read-only view of the recording.
+        '''
+
+        depth = self._frame('depth')[1]
+        if depth is None:
+            raise ValueError('Frame %i has no depth' % self.position)
+        return depth
+
+    def getDepthArray(self):
+        '''
+        Return the 8 bit depth as a view indexed [x, y], like
+        mykinect.Kinect.getDepthArray().
+        '''
+
+        return self.depth_converter.convert(self.getDepthMatrix()).transpose()
+
+    def getMetricDepthArray(self):
+        '''
+        Return the depth in millimetres as a view indexed [x, y], like
+        mykinect.Kinect.getMetricDepthArray().
+        '''
+
+        return self.metric_converter.convert(
+            self.getDepthMatrix()).transpose()
+
+    def getDepth(self):
+        return scv.Image(self.getDepthArray(), self)
+
+    def getImageMatrix(self):
+        '''
+        Return the RGB image, as a read-only view of the recording.
+        '''
+
+        image = self._frame('image')[2]
+        if image is None:
+            raise ValueError('Frame %i has no image' % self.position)
+        return image
+
+    def getImage(self):
+        return scv.Image(self.getImageMatrix().transpose([1, 0, 2]), self)
+
+
+def record(kinect, path, num_frames=None, depth=True, image=True):
+    '''
+    Record frames from a mykinect.Kinect until num_frames are recorded or
+    the recording is interrupted with Ctrl-C.
+    '''
+
+    recorded = 0
+    with FrameRecorder(path) as recorder:
+        try:
+            while num_frames is None or recorded < num_frames:
+                depth_frame = kinect.getDepthMatrix() if depth else None
+                image_frame = kinect.getImageMatrix() if image else None
+                recorder.add_frame(depth=depth_frame, image=image_frame,
+                                   capturetime=kinect.capturetime)
+                recorded += 1
+        except KeyboardInterrupt:
+            pass
+    return recorded
+
+
+if __name__ == '__main__':
+    from mykinect import Kinect
+    if len(sys.argv) < 2:
+        print('usage: %s recording_dir [device_number] [num_frames]' %
+              sys.argv[0])
+        raise SystemExit
+    device = 0
+    frames = None
+    if len(sys.argv) > 2:
+        device = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        frames = int(sys.argv[3])
+    num = record(Kinect(device), sys.argv[1], num_frames=frames)
+    print('recorded %i frames' % num)
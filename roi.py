@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Static regions of interest for detection.
+
+A RegionOfInterest restricts detection to a part of the frame, given as a
+boolean mask or as a polygon. Frames are cropped to the bounding box of the
+region before any work is done on them and the pixels of the box that are
+outside the region are set to a background value.
+
+Arrays follow SimpleCV's convention and are indexed [x, y].
+'''
+
+import numpy as np
+
+
+def polygon_mask(polygon, shape):
+    '''
+    Rasterize a polygon.
+
+    Inputs:
+
+        polygon - A sequence of (x, y) vertices.
+
+        shape - The (width, height) shape of the mask.
+
+    Returns: A boolean array, indexed [x, y], where the pixels whose center
+        is inside the polygon are True.
+    '''
+
+    vertices = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    mask = np.zeros(shape, dtype=bool)
+    if len(vertices) < 3:
+        return mask
+    x0 = max(int(np.floor(vertices[:, 0].min())), 0)
+    x1 = min(int(np.ceil(vertices[:, 0].max())) + 1, shape[0])
+    y0 = max(int(np.floor(vertices[:, 1].min())), 0)
+    y1 = min(int(np.ceil(vertices[:, 1].max())) + 1, shape[1])
+    if x0 >= x1 or y0 >= y1:
+        return mask
+    xs, ys = np.mgrid[x0:x1, y0:y1]
+    inside = np.zeros(xs.shape, dtype=bool)
+    # even-odd rule: count the edges crossed by a ray going right
+    for (xi, yi), (xj, yj) in zip(vertices, np.roll(vertices, 1, axis=0)):
+        if yi == yj:
+            continue
+        crosses = (yi > ys) != (yj > ys)
+        crosses &= xs < (xj - xi) * (ys - yi) / (yj - yi) + xi
+        inside ^= crosses
+    mask[x0:x1, y0:y1] = inside
+    return mask
+
+
+class RegionOfInterest(object):
+
+    def __init__(self, shape, mask=None, polygon=None):
+        '''
+        Inputs:
+
+            shape - The (width, height) of the frames.
+
+            mask - A boolean array with the frame's shape, True inside the
+                region.
+
+            polygon - A sequence of (x, y) vertices with the outline of the
+                region. Used when mask is None.
+        '''
+
+        if mask is None:
+            if polygon is None:
+                raise ValueError('Either a mask or a polygon is needed')
+            mask = polygon_mask(polygon, shape)
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != tuple(shape):
+            raise ValueError('The mask has shape %s, expected %s' %
+                             (mask.shape, tuple(shape)))
+        if not mask.any():
+            raise ValueError('The region of interest is empty')
+        self.shape = tuple(shape)
+        xs = np.flatnonzero(mask.any(axis=1))
+        ys = np.flatnonzero(mask.any(axis=0))
+        self.slices = (slice(xs[0], xs[-1] + 1), slice(ys[0], ys[-1] + 1))
+        self.offset = (int(xs[0]), int(ys[0]))
+        self.size = (int(xs[-1] + 1 - xs[0]), int(ys[-1] + 1 - ys[0]))
+        # the mask inside the bounding box
+        self.mask = mask[self.slices]
+        self.outside = ~self.mask
+        self.rectangular = bool(self.mask.all())
+
+    def crop(self, array):
+        '''
+        Return a view of the bounding box of the region in an array indexed
+        [x, y].
+        '''
+
+        return array[self.slices]
+
+    def crop_image(self, image):
+        '''
+        Crop a SimpleCV.Image, or an array, to the region's bounding box.
+        '''
+
+        if isinstance(image, np.ndarray):
+            return self.crop(image)
+        x, y = self.offset
+        w, h = self.size
+        return image.crop(x, y, w, h)
+
+    def apply(self, cropped, fill=0):
+        '''
+        Set the pixels outside the region to fill.
+
+        Inputs:
+
+            cropped - An array with the region's bounding box, as returned
+                by crop().
+
+            fill - The value given to the pixels outside the region.
+
+        Returns: The array itself if the region is its bounding box,
+            otherwise a masked copy.
+        '''
+
+        if self.rectangular:
+            return cropped
+        masked = cropped.copy()
+        masked[self.outside] = fill
+        return masked
+
+    def prepare(self, array, fill=0):
+        '''
+        Crop a frame and set the pixels outside the region to fill.
+        '''
+
+        return self.apply(self.crop(array), fill)
+
+    def to_frame(self, x, y):
+        '''
+        Convert coordinates inside the bounding box to frame coordinates.
+        '''
+
+        return x + self.offset[0], y + self.offset[1]
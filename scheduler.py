@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Adaptive scheduling of the detection of several kinects.
+
+Instead of a fixed timer period, the FrameScheduler measures how long each
+device takes to process a frame and tells the GUI how long to wait before
+the next round, so that rounds never pile up. Frames that are already too
+old to be processed within the latency bound are skipped, and the achieved
+frame rate and the skipped frames are counted for each device.
+'''
+
+import timeit
+import time
+from collections import deque
+
+
+class DeviceSchedule(object):
+
+    def __init__(self, smoothing=0.2, fps_window=30):
+        '''
+        Inputs:
+
+            smoothing - The weight of the newest processing time in its
+                exponential moving average.
+
+            fps_window - The number of most recent frames the frame rate is
+                measured over.
+        '''
+
+        self.smoothing = smoothing
+        self.processing_time = None
+        self.last_latency = None
+        self.max_latency = None
+        self.processed = 0
+        self.stale = 0
+        self.dropped = 0
+        self.last_skipped = False
+        self.finish_times = deque(maxlen=fps_window)
+        self.started_at = None
+
+    def update_processing_time(self, duration):
+        if self.processing_time is None:
+            self.processing_time = duration
+        else:
+            self.processing_time += self.smoothing * (duration -
+                                                      self.processing_time)
+
+    def fps(self):
+        if len(self.finish_times) < 2:
+            return None
+        elapsed = self.finish_times[-1] - self.finish_times[0]
+        if elapsed <= 0:
+            return None
+        return (len(self.finish_times) - 1) / elapsed
+
+    def skipped(self):
+        return self.stale + self.dropped
+
+    def as_dict(self):
+        return {
+            'fps' : self.fps(),
+            'processing_time' : self.processing_time,
+            'last_latency' : self.last_latency,
+            'max_latency' : self.max_latency,
+            'processed' : self.processed,
+            'stale' : self.stale,
+            'dropped' : self.dropped,
+            'skipped' : self.skipped(),
+        }
+
+
+class FrameScheduler(object):
+    '''
+    Decides which frames are processed and when the next round starts.
+
+    For each round: call start_round(), then for each device with a new
+    frame ask is_stale() and, if it is not, surround its processing with
+    started() and finished(). next_interval() gives the time to wait before
+    the following round.
+    '''
+
+    def __init__(self, target_fps=30, max_latency=0.1, min_interval=0.001,
+                 smoothing=0.2):
+        '''
+        Inputs:
+
+            target_fps - The rate at which rounds are started when
+                processing keeps up with it.
+
+            max_latency - The longest time, in seconds, between a frame's
+                capture and the end of its processing. Frames that would
+                end later are skipped, but never two in a row for the same
+                device, so a device slower than the bound is still
+                processed.
+
+            min_interval - The shortest wait between rounds, in seconds, so
+                that the GUI can handle its other events.
+
+            smoothing - See DeviceSchedule.
+        '''
+
+        self.period = 1.0 / target_fps
+        self.max_latency = max_latency
+        self.min_interval = min_interval
+        self.smoothing = smoothing
+        self.devices = dict()
+        self._round_start = None
+
+    def device(self, device):
+        schedule = self.devices.get(device)
+        if schedule is None:
+            schedule = self.devices[device] = DeviceSchedule(self.smoothing)
+        return schedule
+
+    def start_round(self):
+        self._round_start = timeit.default_timer()
+
+    def is_stale(self, device, capturetime, now=None):
+        '''
+        Return True, and count the frame as skipped, if a frame captured at
+        capturetime can't be processed within the latency bound.
+        '''
+
+        schedule = self.device(device)
+        if capturetime is None or self.max_latency is None:
+            return False
+        if now is None:
+            now = time.time()
+        expected = now - capturetime + (schedule.processing_time or 0)
+        stale = expected > self.max_latency and not schedule.last_skipped
+        schedule.last_skipped = stale
+        if stale:
+            schedule.stale += 1
+        return stale
+
+    def started(self, device):
+        self.device(device).started_at = timeit.default_timer()
+
+    def finished(self, device, capturetime=None, dropped=None):
+        '''
+        Record the end of a frame's processing.
+
+        Inputs:
+
+            device - The device.
+
+            capturetime - The time the frame was captured, used to measure
+                its latency.
+
+            dropped - The total number of frames the device's source has
+                dropped without them ever being processed, e.g. by its
+                capture thread, or None.
+        '''
+
+        schedule = self.device(device)
+        end = timeit.default_timer()
+        if schedule.started_at is not None:
+            schedule.update_processing_time(end - schedule.started_at)
+            schedule.started_at = None
+        schedule.processed += 1
+        schedule.finish_times.append(end)
+        if capturetime is not None:
+            latency = time.time() - capturetime
+            schedule.last_latency = latency
+            if schedule.max_latency is None or latency > schedule.max_latency:
+                schedule.max_latency = latency
+        if dropped is not None:
+            schedule.dropped = dropped
+
+    def next_interval(self):
+        '''
+        Return the number of seconds to wait before the next round: what is
+        left of the period after the current round, but at least
+        min_interval.
+        '''
+
+        if self._round_start is None:
+            return self.period
+        elapsed = timeit.default_timer() - self._round_start
+        return max(self.period - elapsed, self.min_interval)
+
+    def report(self):
+        '''
+        Return a dictionary with the DeviceSchedule.as_dict() of each
+        device.
+        '''
+
+        return dict((device, schedule.as_dict()) for device, schedule in \
+                    self.devices.items())
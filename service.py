@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Headless detection service.
+
+Runs capture, detection, tracking and OSC output for all the kinects
+described in a JSON config file, without Qt or a display:
+
+    python service.py --config service.json
+
+The config is an object with these entries, all of them optional:
+
+    devices - "auto", to use every kinect that freenect finds, or a list
+        with an object per device:
+            device_number - The number of the kinect (default 0).
+            mode, centroids, boundaries - The arguments of
+                Detector.detect() (default "depth", true, false).
+            capture - An object with the streams to capture, e.g.
+                {"depth": true, "image": false}. By default the streams
+                that the mode needs, and the depth with fusion.
+            detector - Keyword arguments for detection.Detector, e.g.
+                {"metric_depth": true, "blob_backend": "ndimage"}.
+            recording - The path of a recording to replay instead of the
+                kinect.
+            realtime - false to replay the recording as fast as it is
+                read, instead of at the speed it was recorded (default
+                true).
+            process - true to detect in a worker process, see
+                workers.ProcessDetector.
+            track - true to track the device's centroids with an
+                ActorManager and send its actors.
+            osc - Keyword arguments for OSCCommunicator, e.g.
+                {"client_ip": "127.0.0.1", "client_port": 8000}, or null to
+                send nothing.
+    device_defaults - Values used for the entries a device doesn't have.
+    fusion - An object with the "extrinsics", the path of a file read by
+        fusion.load_extrinsics(), the "osc" of the world stream and keyword
+        arguments for fusion.Fusion in "options". With
+        {"point_clouds": true} in the options, the blobs' point clouds of
+        the devices that detect in the service process with metric depth
+        are drawn on the world's grid.
+    target_fps, max_latency - See scheduler.FrameScheduler.
+    report_interval - Seconds between the status lines printed with each
+        device's fps, skipped frames and errors, or null.
+'''
+
+import sys
+import json
+import time
+import signal
+import threading
+import traceback
+import numpy as np
+import freenect
+import detection
+import workers
+from mykinect import Kinect
+from tracking import ActorManager
+from osccommunicator import OSCCommunicator
+from scheduler import FrameScheduler
+
+DEFAULT_CONFIG = {
+    'devices' : 'auto',
+    'device_defaults' : {},
+    'fusion' : None,
+    'target_fps' : 30,
+    'max_latency' : 0.1,
+    'report_interval' : 10,
+}
+
+DEFAULT_DEVICE = {
+    'device_number' : 0,
+    'mode' : 'depth',
+    'centroids' : True,
+    'boundaries' : False,
+    'capture' : None,
+    'detector' : {},
+    'recording' : None,
+    'realtime' : True,
+    'process' : False,
+    'track' : False,
+    'osc' : None,
+}
+
+def load_config(path):
+    '''
+    Read a service config file and fill in its defaults.
+    '''
+
+    with open(path) as fh:
+        config = json.load(fh)
+    return complete_config(config)
+
+
+def complete_config(config):
+    '''
+    Return a copy of a config with the defaults of its missing entries.
+    '''
+
+    completed = dict(DEFAULT_CONFIG)
+    completed.update(config)
+    defaults = dict(DEFAULT_DEVICE)
+    defaults.update(completed['device_defaults'])
+    if completed['devices'] != 'auto':
+        devices = []
+        for device_config in completed['devices']:
+            device = dict(defaults)
+            device.update(device_config)
+            devices.append(complete_device(device, completed))
+        completed['devices'] = devices
+    completed['device_defaults'] = defaults
+    return completed
+
+
+def complete_device(device_config, config):
+    '''
+    Fill in the streams a device captures, if its config doesn't have them,
+    with the ones its detection mode needs and the depth when the devices
+    are fused. Returns the device config.
+    '''
+
+    if device_config['capture'] is None:
+        device_config['capture'] = detection.capture_streams(
+            device_config['mode'], depth=config['fusion'] is not None)
+    return device_config
+
+
+def count_kinects():
+    '''
+    Return the number of kinects that freenect finds.
+    '''
+
+    context = freenect.init()
+    if context is None:
+        return 0
+    try:
+        return freenect.num_devices(context)
+    finally:
+        freenect.shutdown(context)
+
+
+def kinect_detector(kinect_device=0, **kwargs):
+    '''
+    Return a Detector for the kinect numbered kinect_device.
+
+    detection.Detector opens a camera when it isn't given a kinect, so the
+    kinect is opened here. The function can be pickled, to be used as a
+    workers.ProcessDetector factory.
+    '''
+
+    return detection.Detector(kinect=Kinect(kinect_device),
+                              kinect_device=kinect_device, **kwargs)
+
+
+def create_detector(device_config):
+    '''
+    Return a Detector, or a ProcessDetector, for a device's config.
+    '''
+
+    number = device_config['device_number']
+    kwargs = dict(device_config['detector'])
+    capture = device_config['capture']
+    if device_config['process']:
+        if device_config['recording'] is not None:
+            raise ValueError('Recordings are replayed in the service '
+                             'process, not in a worker')
+        kwargs['kinect_device'] = number
+        # metric depth is in millimetres, which don't fit in 8 bits
+        depth_dtype = np.uint8
+        if kwargs.get('metric_depth'):
+            depth_dtype = np.uint16
+        return workers.ProcessDetector(number, factory=kinect_detector,
+                                       factory_kwargs=kwargs,
+                                       capture_depth=capture.get('depth',
+                                                                 False),
+                                       capture_image=capture.get('image',
+                                                                 False),
+                                       depth_dtype=depth_dtype)
+    if device_config['recording'] is None:
+        return kinect_detector(number, **kwargs)
+    from recording import ReplayKinect
+    kwargs['kinect'] = ReplayKinect(device_config['recording'],
+                                    device_number=number,
+                                    realtime=device_config['realtime'])
+    return detection.Detector(kinect_device=number, **kwargs)
+
+
+def enumerate_devices(config):
+    '''
+    Return a list with a (device config, detector) tuple for each device of
+    a config. With "auto" devices, each kinect that freenect finds is
+    opened, and the ones that fail to open are left out.
+    '''
+
+    if config['devices'] != 'auto':
+        return [(d, create_detector(d)) for d in config['devices']]
+    devices = []
+    for number in range(count_kinects()):
+        device_config = dict(config['device_defaults'])
+        device_config['device_number'] = number
+        complete_device(device_config, config)
+        try:
+            detector = create_detector(device_config)
+        except Exception:
+            print('Kinect %i could not be opened.' % number)
+            continue
+        devices.append((device_config, detector))
+    return devices
+
+
+class DetectionService(object):
+
+    def __init__(self, config):
+        '''
+        Inputs:
+
+            config - A config dictionary, as returned by load_config().
+        '''
+
+        self.config = complete_config(config)
+        self.devices = []
+        self.world = None
+        self.world_osc = None
+        self.scheduler = FrameScheduler(
+            target_fps=self.config['target_fps'],
+            max_latency=self.config['max_latency'])
+        self.stop_event = threading.Event()
+        self._last_report = None
+
+    def start(self):
+        '''
+        Open the devices and their OSC clients and start capturing.
+        '''
+
+        for device_config, detector in enumerate_devices(self.config):
+            osc = None
+            if device_config['osc'] is not None:
+                osc = OSCCommunicator(**device_config['osc'])
+            actors = ActorManager() if device_config['track'] else None
+            self.devices.append({
+                'config' : device_config,
+                'detector' : detector,
+                'osc' : osc,
+                'actors' : actors,
+                'errors' : 0,
+            })
+            detector.start_capture(**device_config['capture'])
+        fusion_config = self.config['fusion']
+        if fusion_config is not None:
+            import fusion
+            extrinsics = fusion.load_extrinsics(fusion_config['extrinsics'])
+            self.world = fusion.Fusion(extrinsics,
+                                       **fusion_config.get('options', {}))
+            if fusion_config.get('osc') is not None:
+                self.world_osc = OSCCommunicator(**fusion_config['osc'])
+        self._last_report = time.time()
+        return len(self.devices)
+
+    def step(self):
+        '''
+        Process the newest frame of each device, like a round of the GUI's
+        timer.
+
+        Exceptions raised by a device, e.g. when it is unplugged or a frame
+        is bad, are printed and counted in the device's 'errors', and the
+        round goes on with the next device.
+        '''
+
+        self.scheduler.start_round()
+        for index, device in enumerate(self.devices):
+            try:
+                self._process_device(index, device)
+            except Exception:
+                device['errors'] += 1
+                traceback.print_exc()
+        if self.world is not None and self.world.update() is not None and \
+                self.world_osc is not None:
+            self.world.send_osc_messages(self.world_osc)
+
+    def _process_device(self, index, device):
+        config = device['config']
+        detector = device['detector']
+        if not detector.capture(**config['capture']):
+            return
+        capturetime = detector.latest_capturetime()
+        if self.scheduler.is_stale(index, capturetime):
+            return
+        self.scheduler.started(index)
+        detector.detect(mode=config['mode'],
+                        centroids=config['centroids'] or \
+                                  self.world is not None,
+                        boundaries=config['boundaries'])
+        actors = None
+        if device['actors'] is not None or self.world is not None:
+            results = detector.get_results()
+            if device['actors'] is not None:
+                device['actors'].update_points(results['centroids'])
+                actors = device['actors'].points
+            if self.world is not None:
+                self._add_to_world(config['device_number'], detector,
+                                   results, capturetime)
+        if device['osc'] is not None:
+            detector.send_osc_messages(device['osc'], actors=actors)
+        self.scheduler.finished(index, capturetime,
+                                self._frames_dropped(detector))
+
+    def _add_to_world(self, number, detector, results, capturetime):
+        self.world.add_centroids(number, results['centroids'], capturetime)
+        if self.world.point_clouds and \
+                getattr(detector, 'metric_depth', False):
+            self.world.add_points(number,
+                                  detector.get_point_cloud(blobs=True),
+                                  capturetime)
+
+    def _frames_dropped(self, detector):
+        if hasattr(detector, 'capture_stats'):
+            stats = detector.capture_stats()
+            if stats is not None:
+                return stats.frames_dropped
+        return getattr(detector, 'frames_dropped', None)
+
+    def run(self):
+        '''
+        Run rounds until stop() is called.
+        '''
+
+        while not self.stop_event.is_set():
+            self.step()
+            self._report()
+            self.stop_event.wait(self.scheduler.next_interval())
+
+    def stop(self, *args):
+        '''
+        Ask the main loop to stop. Can be used as a signal handler.
+        '''
+
+        self.stop_event.set()
+
+    def close(self):
+        '''
+        Stop capturing and close the OSC clients.
+        '''
+
+        for device in self.devices:
+            device['detector'].stop_capture()
+            if device['osc'] is not None:
+                device['osc'].close()
+        if self.world_osc is not None:
+            self.world_osc.close()
+        self.devices = []
+
+    def _report(self):
+        interval = self.config['report_interval']
+        if interval is None or time.time() - self._last_report < interval:
+            return
+        self._last_report = time.time()
+        report = self.scheduler.report()
+        for index, device in enumerate(self.devices):
+            stats = report.get(index, {'fps' : None, 'processed' : 0,
+                                       'skipped' : 0})
+            print('kinect %i: %5.1f fps, %i processed, %i skipped, '
+                  '%i errors' % (device['config']['device_number'],
+                                 stats['fps'] or 0, stats['processed'],
+                                 stats['skipped'], device['errors']))
+        sys.stdout.flush()
+
+
+def main(argv):
+    if '--config' not in argv:
+        print('usage: %s --config <service.json>' % argv[0])
+        return 2
+    config = load_config(argv[argv.index('--config') + 1])
+    service = DetectionService(config)
+    signal.signal(signal.SIGINT, service.stop)
+    signal.signal(signal.SIGTERM, service.stop)
+    try:
+        if service.start() == 0:
+            print('No Kinects have been detected.')
+            return 1
+        service.run()
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
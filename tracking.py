@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Tracking of the detected actors between frames.
+'''
+
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+class ActorManager(object):
+
+    def __init__(self, method='auto', max_dense=250):
+        '''
+        Inputs:
+
+            method - A string with the matching method to use. Can be either:
+                    auto: use 'optimal' for small scenes and 'kdtree' when
+                        there are more than `max_dense` actors or
+                        coordinates;
+                    optimal: build the full distance matrix and find the
+                        assignment with the smallest total distance;
+                    kdtree: find the candidate pairs inside the distance
+                        threshold with a cKDTree and assign the closest
+                        pairs first.
+
+            max_dense - The largest number of actors or coordinates for
+                which 'auto' uses the full distance matrix.
+        '''
+
+        self.points = []
+        self.method = method
+        self.max_dense = max_dense
+
+    def update_points(self, coordinates, distance_threshold=100):
+        '''
+        Match the new coordinates with the tracked actors.
+
+        Each coordinate is matched with at most one actor and vice versa.
+        Matched actors are moved to their coordinate, coordinates without an
+        actor become new actors and actors without a coordinate are removed.
+
+        Inputs:
+
+            coordinates - A list of (x, z, y) tuples or an (N, 3) array with
+                the detected coordinates. None means nothing was detected.
+
+            distance_threshold - The largest distance an actor may move
+                between two frames and still be matched.
+        '''
+
+        if coordinates is None:
+            coordinates = []
+        coords = np.asarray(coordinates, dtype=np.float64).reshape(-1, 3)
+        if len(self.points) == 0 or len(coords) == 0:
+            self.points = [Actor(c) for c in coords]
+            return
+        locations = np.array([p.location for p in self.points],
+                             dtype=np.float64)
+        point_indexes, coord_indexes = self.match(locations, coords,
+                                                  distance_threshold)
+        matched = np.zeros(len(coords), dtype=bool)
+        matched[coord_indexes] = True
+        updated = []
+        for p, c in zip(point_indexes, coord_indexes):
+            actor = self.points[p]
+            actor.moved(coords[c])
+            updated.append(actor)
+        for c in np.flatnonzero(~matched):
+            updated.append(Actor(coords[c]))
+        self.points = updated
+
+    def match(self, locations, coords, distance_threshold):
+        '''
+        Match actor locations with coordinates.
+
+        Inputs:
+
+            locations - An (N, 3) array with the actors' locations.
+
+            coords - An (M, 3) array with the new coordinates.
+
+            distance_threshold - Pairs farther apart than this are never
+                matched.
+
+        Returns: A tuple of two integer arrays with the indexes of the matched
+            locations and of their respective coordinates.
+        '''
+
+        method = self.method
+        if method == 'auto':
+            if max(len(locations), len(coords)) > self.max_dense:
+                method = 'kdtree'
+            else:
+                method = 'optimal'
+        if method == 'optimal' and linear_sum_assignment is not None:
+            return self._match_optimal(locations, coords, distance_threshold)
+        return self._match_kdtree(locations, coords, distance_threshold)
+
+    def _match_optimal(self, locations, coords, distance_threshold):
+        distances = cdist(locations, coords)
+        gated = distances > distance_threshold
+        # pairs outside the gate get a cost that no valid pair can reach,
+        # so they are only used when nothing else is left
+        costs = np.where(gated, distances.max() * distances.size + 1,
+                         distances)
+        rows, cols = linear_sum_assignment(costs)
+        valid = ~gated[rows, cols]
+        return rows[valid], cols[valid]
+
+    def _match_kdtree(self, locations, coords, distance_threshold):
+        pairs = cKDTree(locations).sparse_distance_matrix(
+            cKDTree(coords), distance_threshold, output_type='ndarray')
+        order = np.argsort(pairs['v'], kind='mergesort')
+        used_points = np.zeros(len(locations), dtype=bool)
+        used_coords = np.zeros(len(coords), dtype=bool)
+        point_indexes = []
+        coord_indexes = []
+        for p, c in zip(pairs['i'][order], pairs['j'][order]):
+            if not used_points[p] and not used_coords[c]:
+                used_points[p] = True
+                used_coords[c] = True
+                point_indexes.append(p)
+                coord_indexes.append(c)
+        return (np.asarray(point_indexes, dtype=np.intp),
+                np.asarray(coord_indexes, dtype=np.intp))
+
+
+class Actor(object):
+
+    def __init__(self, coords, color=None):
+        if color is None:
+            self.color = tuple(int(c) for c in np.random.randint(0, 256, 3))
+        else:
+            self.color = color
+        self.location = np.asarray(coords)
+        self.velocity = np.asarray([0, 0, 0])
+        self.acceleration = np.asarray([0, 0, 0])
+        self.direction = None
+        self.acceleration = 0
+
+    def moved(self, new_coords):
+        new_coords = np.asarray(new_coords)
+        vel = new_coords - self.location
+        accel = vel - self.velocity
+        self.acceleration = accel
+        self.velocity = vel
+        self.location = new_coords
@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Run each Detector in its own worker process.
+
+The worker captures and detects on its own, writing the raw frames and the
+detection results into shared memory. The GUI process only reads the latest
+results from shared memory, so no frame is ever pickled.
+'''
+
+import ctypes
+import multiprocessing
+import numpy as np
+from instrumentation import STAGES, PERCENTILES
+from pipeline import LazyPipeline, LazyValue
+
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+
+# grid images that are copied back from the worker
+GRID_IMAGES = ('centroids_grid_xy', 'centroids_grid_xz',
+               'boundaries_grid_xy', 'boundaries_grid_xz')
+
+# results of Detector.get_results() that are not copied back from the worker,
+# which are read as None
+UNSHARED_RESULTS = ('blobs', 'blobs_offset', 'depth_foreground',
+                    'depth_blob_source', 'image_blob_source', 'motion_depth',
+                    'motion_depth_blob_source', 'motion_image',
+                    'motion_image_blob_source')
+
+# the statistics of each stage copied back from the worker
+TIMING_STATISTICS = ('count', 'mean') + tuple('p%i' % q for q in PERCENTILES)
+
+
+def _as_array(value, ndim):
+    '''
+    Return the numpy array behind a SimpleCV.Image or the value itself.
+
+    Inputs:
+
+        value - A SimpleCV.Image or something that converts to an array.
+
+        ndim - The number of dimensions wanted. SimpleCV images are returned
+            as grayscale arrays when this is 2.
+    '''
+
+    if hasattr(value, 'getNumpy'):
+        if ndim == 2:
+            return value.getGrayNumpy()
+        return value.getNumpy()
+    return np.asarray(value)
+
+
+class SharedArray(object):
+    '''
+    A numpy array that lives in shared memory and survives a fork.
+    '''
+
+    def __init__(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.raw = multiprocessing.RawArray(ctypes.c_uint8, max(nbytes, 1))
+        self._array = None
+
+    @property
+    def array(self):
+        # the view is created lazily, so it is recreated in the child
+        if self._array is None:
+            self._array = np.frombuffer(self.raw, dtype=self.dtype,
+                                        count=int(np.prod(self.shape)))
+            self._array = self._array.reshape(self.shape)
+        return self._array
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_array'] = None
+        return state
+
+
+class SharedResults(object):
+    '''
+    Fixed size shared memory records with a detector's latest results.
+
+    The depth record is uint8 by default. Use depth_dtype=np.uint16 for
+    detectors built with metric_depth, whose depth is in millimetres.
+    '''
+
+    def __init__(self, image_shape=(640, 480, 3), depth_shape=(640, 480),
+                 grid_shape=(640, 480), max_centroids=64,
+                 max_boundaries=64, max_boundary_points=4096,
+                 depth_dtype=np.uint8):
+        self.lock = multiprocessing.Lock()
+        # frame number, capturetime, has_image, has_depth, num_centroids,
+        # num_boundaries
+        self.header = SharedArray((6,), np.float64)
+        self.image = SharedArray(image_shape, np.uint8)
+        self.depth = SharedArray(depth_shape, depth_dtype)
+        self.centroids = SharedArray((max_centroids, 3), np.float64)
+        self.boundary_points = SharedArray((max_boundary_points, 3),
+                                           np.float64)
+        self.boundary_lengths = SharedArray((max_boundaries,), np.int32)
+        self.grids = dict((name, SharedArray(grid_shape, np.uint8)) for \
+                          name in GRID_IMAGES)
+        self.grid_flags = SharedArray((len(GRID_IMAGES),), np.uint8)
+        self.timings = SharedArray((len(STAGES), len(TIMING_STATISTICS)),
+                                   np.float64)
+
+    def write(self, results, grids=GRID_IMAGES):
+        '''
+        Copy a Detector's results into shared memory.
+
+        Results that do not fit the preallocated records are truncated.
+
+        Inputs:
+
+            results - The Detector's results.
+
+            grids - The names of the grid images that are copied. The grid
+                images are rendered when they are read, so the others are
+                not rendered at all and are read back as None.
+        '''
+
+        centroids = results.get('centroids') or []
+        centroids = centroids[:self.centroids.shape[0]]
+        boundaries = results.get('boundaries') or []
+        boundaries = boundaries[:self.boundary_lengths.shape[0]]
+        with self.lock:
+            header = self.header.array
+            header[0] = results.get('frame') or 0
+            header[1] = results.get('capturetime') or 0
+            header[2] = self._write_frame(self.image, results.get('image'))
+            header[3] = self._write_frame(self.depth, results.get('depth'))
+            header[4] = len(centroids)
+            if len(centroids) > 0:
+                self.centroids.array[:len(centroids)] = centroids
+            points = self.boundary_points.array
+            lengths = self.boundary_lengths.array
+            used = 0
+            num_boundaries = 0
+            for boundary in boundaries:
+                n = min(len(boundary), points.shape[0] - used)
+                if n <= 0:
+                    break
+                points[used:used + n] = boundary[:n]
+                lengths[num_boundaries] = n
+                used += n
+                num_boundaries += 1
+            header[5] = num_boundaries
+            flags = self.grid_flags.array
+            for i, name in enumerate(GRID_IMAGES):
+                flags[i] = 0
+                if name in grids:
+                    flags[i] = self._write_frame(self.grids[name],
+                                                 results.get(name))
+            timings = self.timings.array
+            timings[:, 0] = 0
+            summary = results.get('timings') or dict()
+            for i, name in enumerate(STAGES):
+                if name in summary:
+                    timings[i] = [summary[name][k] for k in \
+                                  TIMING_STATISTICS]
+
+    def _write_frame(self, shared, value):
+        if value is None:
+            return 0
+        array = _as_array(value, len(shared.shape))
+        if array.shape != shared.shape:
+            return 0
+        shared.array[...] = array
+        return 1
+
+    def read(self, copy_frames=True, lazy=False):
+        '''
+        Return a LazyPipeline with the latest results, with the same keys as
+        Detector.get_results(). The UNSHARED_RESULTS are None.
+
+        Inputs:
+
+            copy_frames - A boolean indicating if the frames should be copied
+                out of shared memory. If False the returned arrays are views
+                that the worker keeps overwriting.
+
+            lazy - A boolean indicating if each frame is only copied when it
+                is read. Frames that the worker has replaced by then are
+                read as None, so they never mix with the results of another
+                frame.
+        '''
+
+        with self.lock:
+            header = self.header.array.copy()
+            frame = int(header[0])
+            results = LazyPipeline({
+                'frame' : frame,
+                'capturetime' : header[1],
+                'image' : None,
+                'depth' : None,
+                'centroids' : None,
+                'boundaries' : None,
+            })
+            for name in UNSHARED_RESULTS:
+                results[name] = None
+            if lazy:
+                read_frame = lambda shared: LazyValue(
+                    self._read_frame_of, shared, frame)
+            else:
+                read_frame = lambda shared: self._read_frame(shared,
+                                                             copy_frames)
+            if header[2]:
+                results['image'] = read_frame(self.image)
+            if header[3]:
+                results['depth'] = read_frame(self.depth)
+            num_centroids = int(header[4])
+            if num_centroids > 0:
+                results['centroids'] = [tuple(c) for c in \
+                        self.centroids.array[:num_centroids]]
+            num_boundaries = int(header[5])
+            if num_boundaries > 0:
+                boundaries = []
+                start = 0
+                points = self.boundary_points.array
+                for n in self.boundary_lengths.array[:num_boundaries]:
+                    boundaries.append([tuple(p) for p in \
+                                       points[start:start + n]])
+                    start += n
+                results['boundaries'] = boundaries
+            flags = self.grid_flags.array
+            for i, name in enumerate(GRID_IMAGES):
+                results[name] = None
+                if flags[i]:
+                    results[name] = read_frame(self.grids[name])
+        return results
+
+    def read_timings(self):
+        '''
+        Return the worker's timing summary, like Detector.timing_summary().
+        '''
+
+        with self.lock:
+            timings = self.timings.array.copy()
+        summary = dict()
+        for name, row in zip(STAGES, timings):
+            if row[0] > 0:
+                summary[name] = dict(zip(TIMING_STATISTICS, row))
+                summary[name]['count'] = int(row[0])
+        return summary
+
+    def _read_frame(self, shared, copy_frame):
+        if copy_frame:
+            return shared.array.copy()
+        return shared.array
+
+    def _read_frame_of(self, shared, frame):
+        '''
+        Return a copy of a frame of the given frame number, or None if the
+        worker has replaced it.
+        '''
+
+        with self.lock:
+            if int(self.header.array[0]) != frame:
+                return None
+            return shared.array.copy()
+
+    def frame_number(self):
+        with self.lock:
+            return int(self.header.array[0])
+
+    def capturetime(self):
+        with self.lock:
+            return float(self.header.array[1]) or None
+
+
+def _detected_grids(detect_config):
+    '''
+    Return the names of the grid images that a detect() configuration
+    fills.
+    '''
+
+    grids = []
+    if detect_config.get('centroids'):
+        grids.extend(('centroids_grid_xy', 'centroids_grid_xz'))
+    if detect_config.get('boundaries'):
+        grids.extend(('boundaries_grid_xy', 'boundaries_grid_xz'))
+    return grids
+
+
+def _run_worker(factory, factory_kwargs, shared, commands, stop_event):
+    detector = factory(**factory_kwargs)
+    config = {
+        'capture' : {'depth' : False, 'image' : True},
+        'detect' : {'mode' : 'depth', 'centroids' : True,
+                    'boundaries' : False},
+    }
+    while not stop_event.is_set():
+        try:
+            while True:
+                key, value = commands.get_nowait()
+                config[key] = value
+        except Empty:
+            pass
+        if config.get('timings') is not None:
+            enabled = config.pop('timings')
+            if hasattr(detector, 'enable_timings'):
+                detector.enable_timings(enabled)
+        if detector.capture(**config['capture']):
+            detector.detect(**config['detect'])
+            results = detector.get_results()
+            # factories may build detectors without timings
+            timings = getattr(detector, 'timings', None)
+            if timings is not None and timings.enabled:
+                results['timings'] = detector.timing_summary()
+            shared.write(results, _detected_grids(config['detect']))
+        else:
+            # no new frame yet, don't spin on the capture
+            stop_event.wait(0.001)
+
+
+class ProcessDetector(object):
+    '''
+    A stand in for a Detector that runs the real one in a worker process.
+
+    It offers the part of the Detector interface that MultipleKinectsDlg
+    uses: capture() tells if the worker has published a new frame, detect()
+    forwards the detection settings to the worker and get_results() reads
+    the latest results from shared memory.
+    '''
+
+    def __init__(self, device_number=0, factory=None, factory_kwargs=None,
+                 capture_depth=False, capture_image=True, **shared_kwargs):
+        '''
+        Inputs:
+
+            device_number - The number of the kinect device.
+
+            factory - A picklable callable that builds the detector inside
+                the worker process. If None, detection.Detector is used.
+
+            factory_kwargs - A dictionary with keyword arguments for the
+                factory. By default the device number is passed as
+                kinect_device.
+
+            capture_depth, capture_image - The streams captured by the
+                worker.
+
+            shared_kwargs - Keyword arguments for SharedResults, to size the
+                shared memory records.
+        '''
+
+        if factory is None:
+            import detection
+            factory = detection.Detector
+        if factory_kwargs is None:
+            factory_kwargs = {'kinect_device' : device_number}
+        self.device_number = device_number
+        self.factory = factory
+        self.factory_kwargs = factory_kwargs
+        self.shared = SharedResults(**shared_kwargs)
+        self.capture_config = {'depth' : capture_depth,
+                               'image' : capture_image}
+        self.detect_config = None
+        self.timings_enabled = False
+        self.last_frame = 0
+        self.frames_dropped = 0
+        self.process = None
+        self.commands = None
+        self.stop_event = None
+
+    def start_capture(self, depth=False, image=False):
+        '''
+        Start the worker process, capturing the given streams.
+        '''
+
+        if depth or image:
+            self.capture_config = {'depth' : depth, 'image' : image}
+        if self.process is not None and self.process.is_alive():
+            self.commands.put(('capture', self.capture_config))
+            return
+        self.commands = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        self.commands.put(('capture', self.capture_config))
+        if self.detect_config is not None:
+            self.commands.put(('detect', self.detect_config))
+        if self.timings_enabled:
+            self.commands.put(('timings', True))
+        self.process = multiprocessing.Process(
+            target=_run_worker,
+            args=(self.factory, self.factory_kwargs, self.shared,
+                  self.commands, self.stop_event)
+        )
+        self.process.daemon = True
+        self.process.start()
+
+    def stop_capture(self, timeout=1.0):
+        if self.process is None:
+            return
+        self.stop_event.set()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process = None
+
+    def capture(self, depth=False, image=False):
+        '''
+        Return True if the worker has published a new frame. Frames that
+        were published and replaced since the last call are counted in
+        frames_dropped.
+        '''
+
+        frame = self.shared.frame_number()
+        new_frame = frame != self.last_frame
+        if frame > self.last_frame + 1 and self.last_frame > 0:
+            self.frames_dropped += frame - self.last_frame - 1
+        self.last_frame = frame
+        return new_frame
+
+    def latest_capturetime(self):
+        '''
+        Return the capturetime of the worker's latest frame or None.
+        '''
+
+        return self.shared.capturetime()
+
+    def detect(self, mode='depth', centroids=True, boundaries=False):
+        config = {'mode' : mode, 'centroids' : centroids,
+                  'boundaries' : boundaries}
+        if config != self.detect_config:
+            self.detect_config = config
+            if self.process is not None:
+                self.commands.put(('detect', config))
+
+    def get_results(self, copy_frames=False):
+        '''
+        Return the latest results, like Detector.get_results().
+
+        Inputs:
+
+            copy_frames - A boolean indicating if every frame is copied out
+                of shared memory at once. By default each frame is only
+                copied when it is read, see SharedResults.read().
+        '''
+
+        return self.shared.read(copy_frames=copy_frames,
+                                lazy=not copy_frames)
+
+    def enable_timings(self, enabled=True):
+        self.timings_enabled = enabled
+        if self.process is not None:
+            self.commands.put(('timings', enabled))
+
+    def timing_summary(self):
+        return self.shared.read_timings()
+
+    def send_osc_messages(self, osc_communicator, actors=None,
+                          timings=False):
+        results = self.shared.read(copy_frames=False)
+        if timings:
+            results['timings'] = self.shared.read_timings()
+        return osc_communicator.send_results(results, actors=actors)